@@ -6,10 +6,8 @@ import joblib
 from pathlib import Path
 import json
 import sys, os
-from tensorflow.keras.models import load_model
 
-#Custom module imports
-from ai4hpc_deployment.src.utils import transform_dsos_data, tsfresh_extract_features, scale_data, predict_vae
+from profiling import profiled, profile_stage
  
 class AI4HPCPredict():
     
@@ -35,25 +33,38 @@ class AI4HPCPredict():
         self.loaded_scaler = joblib.load(model_folder_path / scaler_filename) 
         print(f"Scaler is loaded {self.loaded_scaler}")
 
-        #Load the model to serve
+        #Load the model to serve, TensorFlow is only imported once a model is loaded
+        from tensorflow.keras.models import load_model
         self.loaded_model = load_model(model_folder_path / model_name, compile=False)
         print(self.loaded_model.summary())      
         
         print(f"Model prep is completed")
         
+    @profiled('AI4HPCPredict.predict_pipeline')
     def predict_pipeline(self, meminfo_df, vmstat_df, procstat_df):
         
-        job_id_df = transform_dsos_data(meminfo_df, vmstat_df, procstat_df)
+        #Custom module imports, deferred since they pull in the feature extraction stack
+        from ai4hpc_deployment.src.utils import transform_dsos_data, tsfresh_extract_features, scale_data, predict_vae
 
-        fe_job_df = tsfresh_extract_features(job_id_df, 
-                                             self.fc_parameters, 
-                                             "component_id", 
-                                             "timestamp")
+        with profile_stage('AI4HPCPredict.transform_dsos_data', rows_in=len(meminfo_df)) as stage:
+            job_id_df = transform_dsos_data(meminfo_df, vmstat_df, procstat_df)
+            stage.rows_out = len(job_id_df)
 
-        fe_job_df = scale_data(fe_job_df, self.loaded_scaler)
+        with profile_stage('AI4HPCPredict.extract_features', rows_in=len(job_id_df)) as stage:
+            fe_job_df = tsfresh_extract_features(job_id_df, 
+                                                 self.fc_parameters, 
+                                                 "component_id", 
+                                                 "timestamp")
+            stage.rows_out = len(fe_job_df)
+
+        with profile_stage('AI4HPCPredict.scale_data', rows_in=len(fe_job_df)) as stage:
+            fe_job_df = scale_data(fe_job_df, self.loaded_scaler)
+            stage.rows_out = len(fe_job_df)
 
         #Generate predictions
-        pred = predict_vae(fe_job_df, self.loaded_model, self.threshold)
+        with profile_stage('AI4HPCPredict.predict', rows_in=len(fe_job_df)) as stage:
+            pred = predict_vae(fe_job_df, self.loaded_model, self.threshold)
+            stage.rows_out = len(pred)
         result_df = pd.DataFrame(pred, index=fe_job_df.index, columns=['pred'])
 
         print(result_df)   
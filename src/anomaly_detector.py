@@ -5,10 +5,12 @@ import pandas as pd
 import json
 import os, sys
 
-from vae import VAE
 from data_pipeline import DataPipeline
-from tensorflow.keras.models import load_model
-from tensorflow.keras import backend as K
+from numpy_vae import NumpyVAE
+from scoring import calibrate_thresholds, decide, score_thresholds
+from quantile_sketch import QuantileSketch
+from scaling import transform_to_float32
+from profiling import profiled, profile_stage
 import numpy as np
 
 
@@ -24,6 +26,10 @@ class AnomalyDetector():
         self.scaler_filename = kwargs.get("scaler_filename", "scaler.save")
         self.deployment_metadata_filename = kwargs.get("deployment_metadata_filename", "deployment_metadata.json")
         self.verbose = kwargs.get("verbose", False)
+        self.fe_engine = kwargs.get("fe_engine", "tsfresh")
+        #'keras' scores with the TensorFlow model, 'numpy' with NumpyVAE, which doesn't need TensorFlow
+        self.inference_engine = kwargs.get("inference_engine", "keras")
+        self.inference_mode = kwargs.get("inference_mode", "deterministic")
                 
         self.logger = logging.getLogger(__name__)
         
@@ -38,8 +44,15 @@ class AnomalyDetector():
             deployment_metadata = json.load(fp)
 
         self.threshold = deployment_metadata['threshold']    
+        #Models trained before threshold_90 and threshold_max were saved only have the 99th percentile threshold
+        self.thresholds = {name: deployment_metadata[name] for name in ['threshold', 'threshold_90', 'threshold_max']
+                           if name in deployment_metadata}
+        self.threshold_sketch = None
+        if 'threshold_sketch' in deployment_metadata:
+            self.threshold_sketch = QuantileSketch.from_dict(deployment_metadata['threshold_sketch'])
         self.fe_column_names = deployment_metadata['fe_column_names']
         self.raw_column_names = deployment_metadata['raw_column_names']        
+        self.input_column_names = DataPipeline.input_columns(self.fe_column_names)
         self.logger.info(f"Feature extraction columns are loaded")
 
         #Load the scaler
@@ -50,6 +63,19 @@ class AnomalyDetector():
         
     def _build_prepare_model(self, input_dim):
         
+        if self.inference_engine == "numpy":
+            self.model = NumpyVAE(Path(self.model_dir) / self.model_weights_filename, 
+                                  mode=self.inference_mode, 
+                                  verbose=self.verbose)
+            self.model.threshold = self.threshold
+            
+            if self.verbose:
+                self.logger.info(f"Loaded the weights into the NumPy inference engine")
+            return
+        
+        #Only the Keras engine needs TensorFlow
+        from vae import VAE
+        
         intermediate_dim = int(input_dim / 2)
         latent_dim = int(input_dim / 3)
         
@@ -69,18 +95,53 @@ class AnomalyDetector():
                                     
     def calculate_reconstruction_error(self, data):
         
-        recon_data = self.model.predict(data)
-        return np.mean(np.abs(data - recon_data), axis=1)
+        #The engines score through their own path: the graph-mode VAE can't use Model.predict, and NumpyVAE averages its Monte Carlo samples
+        return self.model.calculate_reconstruction_error(data)
     
     def _predict_anomaly(self, data):
         
         mae_data = self.calculate_reconstruction_error(data)
         
-        pred = [1 if curr_mae > self.threshold else 0 for curr_mae in mae_data]
+        pred = decide(mae_data, self.threshold)
         
         return pred[0] if len(pred) == 1 else pred
+    
+    def score(self, data, percentiles=None, thresholds=None, labels=None):
+        """
+        Scores scaled data with one inference pass and decides for all thresholds of the model at once.
+
+        Args:
+            data (np.ndarray): Scaled features.
+            percentiles (list): Custom percentiles of the training errors to add as thresholds, computed from
+                the threshold sketch of the deployment metadata (default is None).
+            thresholds (dict): Additional named thresholds (default is None).
+            labels (array-like): Binary ground truth; adds the per-threshold precision and recall (default is None).
+
+        Raises:
+            ValueError: If percentiles are requested and the deployment metadata has no threshold sketch.
+
+        Returns:
+            dict: Output of `scoring.score_thresholds`.
+        """
+        all_thresholds = dict(self.thresholds)
+        if percentiles:
+            if self.threshold_sketch is None:
+                raise ValueError("Custom percentile thresholds need a threshold_sketch in the deployment metadata")
+            calibrated = calibrate_thresholds(self.threshold_sketch, percentiles)
+            all_thresholds.update({name: calibrated[name] for name in calibrated if name not in all_thresholds})
+        all_thresholds.update(thresholds or {})
+        
+        return score_thresholds(self.calculate_reconstruction_error(data), all_thresholds, labels=labels)
+        
+
+    def load_input_data(self, input_path):
+        """Loads only the raw metrics the model's features are computed from."""
+        
+        pipeline = DataPipeline(fe_engine=self.fe_engine)
         
+        return pipeline.load_data(input_path, columns=self.input_column_names)
 
+    @profiled('AnomalyDetector.prediction_pipeline')
     def prediction_pipeline(self, input_ts):
         
         temp = input_ts.copy(deep=True)
@@ -88,7 +149,8 @@ class AnomalyDetector():
         pipeline = DataPipeline(x_train_filename=None, 
                         y_train_filename=None, 
                         x_test_filename=None, 
-                        y_test_filename=None)
+                        y_test_filename=None,
+                        fe_engine=self.fe_engine)
         
         input_fe = pipeline.tsfresh_generate_features(temp, 
                                                       fe_config=None, 
@@ -97,7 +159,9 @@ class AnomalyDetector():
         input_fe = input_fe[self.raw_column_names]
         result_df = input_fe.index.to_frame(index=False)
         
-        ls_scaled_data = self.loaded_scaler.transform(input_fe)
+        with profile_stage('AnomalyDetector.scale', rows_in=len(input_fe)) as stage:
+            ls_scaled_data = transform_to_float32(self.loaded_scaler, input_fe)
+            stage.rows_out = len(ls_scaled_data)
         
         #This is the VAE model imported from VAE.py
         preds, recon_errors = self.model.predict_anomaly(ls_scaled_data)
@@ -0,0 +1,383 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import yaml
+
+from constants import eclipse_meminfo_col_names, eclipse_vmstat_col_names, eclipse_procstat_col_names, junk_cols, excluded_cols
+from memory_benchmark import peak_rss_bytes
+
+SYNTHETIC_SYSTEM_NAME = 'synthetic'
+
+#Version of the result format, bumped whenever stages or fields change meaning
+BENCHMARK_VERSION = 1
+
+SAMPLER_COL_NAMES = {
+    'meminfo': eclipse_meminfo_col_names,
+    'vmstat': eclipse_vmstat_col_names,
+    'procstat': eclipse_procstat_col_names,
+}
+
+#Totals and sizes that never change on a node, process_raw_metrics drops them
+MEMINFO_LIMITS = ['MemTotal', 'SwapTotal', 'CommitLimit', 'VmallocTotal', 'CmaTotal', 'HugePages_Total', 'Hugepagesize',
+                  'DirectMap4k', 'DirectMap2M', 'DirectMap1G']
+
+#Event counters among the vmstat nr_* metrics, every other nr_* metric is a gauge
+VMSTAT_NR_COUNTERS = ['nr_dirtied', 'nr_written', 'nr_vmscan_write', 'nr_vmscan_immediate_reclaim']
+
+PROCSTAT_GAUGES = ['cores_up', 'cpu_enabled', 'procs_running', 'procs_blocked', 'per_core_cpu_enabled']
+
+
+def metric_category(sampler_name, metric):
+    """Returns the metric info category of a sampler metric: 'cumulative', 'noncumulative' or 'limit'."""
+
+    if sampler_name == 'meminfo':
+        return 'limit' if metric in MEMINFO_LIMITS else 'noncumulative'
+    if sampler_name == 'vmstat':
+        return 'noncumulative' if metric.startswith('nr_') and metric not in VMSTAT_NR_COUNTERS else 'cumulative'
+
+    return 'noncumulative' if metric in PROCSTAT_GAUGES else 'cumulative'
+
+
+def make_metric_info():
+    """Returns the metric info of the synthetic samplers, in the format of {system_name}_metric_info.yaml."""
+
+    return {f"{metric}::{sampler_name}": metric_category(sampler_name, metric)
+            for sampler_name, col_names in SAMPLER_COL_NAMES.items() for metric in col_names if metric not in excluded_cols + junk_cols}
+
+
+def make_sampler_frames(n_nodes=4, n_jobs=32, duration=600, interval=1, start_time=1678928719, string_timestamps=False, seed=0):
+    """
+    Generates DSOS meminfo, vmstat and procstat sampler data with the column schemas of `constants`.
+
+    Jobs run one after another, each on all nodes. Counters grow by random increments and gauges fluctuate
+    around a random level per node and job.
+
+    Args:
+        n_nodes (int): Number of nodes (component ids) per job (default is 4).
+        n_jobs (int): Number of jobs (default is 32).
+        duration (int): Duration of every job, in seconds (default is 600).
+        interval (int): Seconds between samples (default is 1).
+        start_time (int): Epoch timestamp of the first sample (default is 1678928719).
+        string_timestamps (bool): If True, timestamps are strings like the DSOS exports, e.g.
+            '2023-03-16 00:05:19.000000' (default is False, epoch seconds).
+        seed (int): Random seed (default is 0).
+
+    Returns:
+        dict: Mapping of sampler name -> sampler data.
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = duration // interval
+    n_series = n_jobs * n_nodes
+
+    job_ids = np.repeat(np.arange(n_jobs), n_nodes * n_samples)
+    timestamps = start_time + job_ids * duration + np.tile(np.arange(n_samples) * interval, n_series)
+    if string_timestamps:
+        timestamps = pd.to_datetime(timestamps, unit='s').strftime('%Y-%m-%d %H:%M:%S.%f').to_numpy()
+
+    keys = {
+        'timestamp': timestamps,
+        'component_id': np.tile(np.repeat(np.arange(1, n_nodes + 1), n_samples), n_jobs),
+        'job_id': job_ids,
+        'app_id': 0,
+    }
+
+    sampler_frames = {}
+    for sampler_name, col_names in SAMPLER_COL_NAMES.items():
+        metrics = [metric for metric in col_names if metric not in keys]
+        is_counter = np.array([metric_category(sampler_name, metric) == 'cumulative' for metric in metrics])
+        n_counters = int(is_counter.sum())
+
+        #Counters are generated per series and flattened, so they only increase within a series
+        increments = rng.gamma(2.0, 50.0, size=(n_series, n_samples, n_counters))
+        counters = np.floor(np.cumsum(increments, axis=1)).astype(np.int64).reshape(n_series * n_samples, n_counters)
+        del increments
+        levels = rng.uniform(1e3, 1e7, size=(n_series, 1, len(metrics) - n_counters))
+        gauges = (levels * (1 + 0.05 * rng.standard_normal((n_series, n_samples, levels.shape[2])))).reshape(n_series * n_samples, levels.shape[2])
+
+        metric_frame = pd.concat([pd.DataFrame(counters, columns=[metric for metric, counter in zip(metrics, is_counter) if counter]),
+                                  pd.DataFrame(gauges, columns=[metric for metric, counter in zip(metrics, is_counter) if not counter])], axis=1)
+        sampler_frames[sampler_name] = pd.concat([pd.DataFrame(keys), metric_frame[metrics]], axis=1)[col_names]
+
+    return sampler_frames
+
+
+def join_sampler_frames(sampler_frames):
+    """
+    Joins the aligned synthetic samplers into the input of `utils.process_raw_metrics`.
+
+    Returns:
+        pd.DataFrame: Metric columns suffixed with their sampler name, without the per-core procstat metrics.
+        np.ndarray: Group code of every row, one group per job and component.
+    """
+    metric_frames = []
+    for sampler_name, sampler_df in sampler_frames.items():
+        metrics = [column for column in sampler_df.columns if column not in excluded_cols + junk_cols and 'per_core' not in column]
+        metric_frames.append(sampler_df[metrics].rename(columns=lambda column: f"{column}::{sampler_name}"))
+
+    group_codes = sampler_frames['meminfo'].groupby(['job_id', 'component_id'], sort=False).ngroup().values
+
+    return pd.concat(metric_frames, axis=1), group_codes
+
+
+class StageTimer():
+    """Times pipeline stages and records their throughput and the peak resident memory after each of them."""
+
+    def __init__(self, n_nodes):
+
+        self.n_nodes = n_nodes
+        self.stages = {}
+        self.logger = logging.getLogger(__name__)
+
+    def run(self, name, func, samples_in):
+        """
+        Runs one stage and records it.
+
+        Args:
+            name (str): Stage name.
+            func (callable): Stage to run, without arguments.
+            samples_in (int): Number of samples the stage processes.
+
+        Returns:
+            The output of func.
+        """
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        output = func()
+        seconds, cpu_seconds = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+        self.stages[name] = {
+            'seconds': seconds,
+            'cpu_seconds': cpu_seconds,
+            'samples_in': int(samples_in),
+            'samples_out': int(len(output[0] if isinstance(output, tuple) else output)),
+            'samples_per_second': samples_in / seconds if seconds > 0 else None,
+            'nodes_per_second': self.n_nodes / seconds if seconds > 0 else None,
+            #High-water mark of the process, a stage that stays below the previous peak doesn't raise it
+            'peak_rss_bytes': peak_rss_bytes(),
+        }
+        self.logger.info(f"{name}: {seconds:.2f}s, {self.stages[name]['samples_per_second'] or 0:.0f} samples/s")
+
+        return output
+
+    def skip(self, name, reason):
+
+        self.stages[name] = {'skipped': reason}
+        self.logger.info(f"{name}: skipped, {reason}")
+
+
+def run_benchmark(n_nodes=4, n_jobs=32, duration=600, interval=1, fe_engine='tsfresh', fe_config='minimal', epochs=5, batch_size=32,
+                  window_size=60, skip_interval=15, windows=True, string_timestamps=False, seed=0):
+    """
+    Times every stage of training and prediction on synthetic telemetry.
+
+    The stages are transform_dsos_data, process_raw_metrics (on its own), generate_windows with the native
+    generate_window_features next to it, tsfresh_generate_features, scale_data, VAE.fit with the time of every
+    epoch, and predict_anomaly. Every stage after the first runs on the output of the previous ones.
+
+    Args:
+        n_nodes (int): Number of nodes per job (default is 4).
+        n_jobs (int): Number of jobs (default is 32).
+        duration (int): Duration of every job, in seconds (default is 600).
+        interval (int): Seconds between samples (default is 1).
+        fe_engine (str): Feature extraction engine of the `DataPipeline` (default is 'tsfresh').
+        fe_config (str): Feature set, 'minimal' or 'efficient' (default is 'minimal').
+        epochs (int): Number of VAE training epochs (default is 5).
+        batch_size (int): VAE batch size (default is 32).
+        window_size (int): Window size of the windowing stages, in samples (default is 60).
+        skip_interval (int): Samples between windows (default is 15).
+        windows (bool): If False, the windowing stages are skipped (default is True).
+        string_timestamps (bool): If True, samplers carry string timestamps that are parsed (default is False).
+        seed (int): Random seed (default is 0).
+
+    Returns:
+        dict: Stage results, see `StageTimer.run`.
+    """
+    from data_pipeline import DataPipeline
+    from utils import process_raw_metrics
+
+    timer = StageTimer(n_nodes)
+    sampler_frames = make_sampler_frames(n_nodes, n_jobs, duration, interval, string_timestamps=string_timestamps, seed=seed)
+    n_raw_samples = len(sampler_frames['meminfo'])
+    timer.stages['generate'] = {'samples_out': n_raw_samples, 'peak_rss_bytes': peak_rss_bytes()}
+
+    #The metric info is read from the working directory, so the synthetic one is written to a temporary one
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(work_dir, f'{SYNTHETIC_SYSTEM_NAME}_metric_info.yaml'), 'w') as fp:
+            yaml.safe_dump(make_metric_info(), fp)
+        os.chdir(work_dir)
+
+        pipeline = DataPipeline(system_name=SYNTHETIC_SYSTEM_NAME, fe_engine=fe_engine)
+
+        metric_data, group_codes = join_sampler_frames(sampler_frames)
+        #The metric plan is compiled outside the timed stage, as transform_dsos_data reuses it from the cache
+        process_raw_metrics(metric_data.iloc[:2], group_codes=group_codes[:2], system_name=SYNTHETIC_SYSTEM_NAME)
+        timer.run('process_raw_metrics',
+                  lambda: process_raw_metrics(metric_data, group_codes=group_codes, system_name=SYNTHETIC_SYSTEM_NAME),
+                  n_raw_samples)
+        del metric_data, group_codes
+
+        data = timer.run('transform_dsos_data',
+                         lambda: pipeline.transform_dsos_data(sampler_frames['meminfo'], sampler_frames['vmstat'], sampler_frames['procstat']),
+                         n_raw_samples)
+        del sampler_frames
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir)
+
+    if windows:
+        try:
+            import tsfresh
+            window_input = data.copy()
+            timer.run('generate_windows', lambda: pipeline.generate_windows(window_input, window_size, skip_interval), len(data))
+            del window_input
+        except ImportError:
+            timer.skip('generate_windows', 'tsfresh is not installed')
+
+        timer.run('generate_window_features',
+                  lambda: pipeline.generate_window_features(data, fe_config='minimal', window_size=window_size, skip_interval=skip_interval),
+                  len(data))
+
+    #Feature extraction consumes its input
+    feature_input = data.copy()
+    data_fe = timer.run('tsfresh_generate_features', lambda: pipeline.tsfresh_generate_features(feature_input, fe_config=fe_config), len(data))
+    del feature_input, data
+
+    x_scaled, _ = timer.run('scale_data', lambda: pipeline.scale_data(data_fe), len(data_fe))
+
+    #TensorFlow is only imported once the preprocessing stages are timed
+    from vae import VAE
+    from vae_training import EpochThroughput
+
+    input_dim = x_scaled.shape[1]
+    vae = VAE(
+        name="model",
+        input_dim=input_dim,
+        intermediate_dim=int(input_dim / 2),
+        latent_dim=int(input_dim / 3),
+        learning_rate=1e-4
+    )
+    #Keras trains on the leading rows and validates on the rest
+    validation_split = 0.1
+    throughput = EpochThroughput(int(len(x_scaled) * (1 - validation_split)))
+    timer.run('vae_fit',
+              lambda: vae.fit(x_scaled, epochs=epochs, batch_size=batch_size, validation_split=validation_split, callbacks=[throughput]) or x_scaled,
+              len(x_scaled) * epochs)
+    timer.stages['vae_fit']['epochs'] = throughput.report
+
+    timer.run('predict_anomaly', lambda: vae.predict_anomaly(x_scaled), len(x_scaled))
+
+    return timer.stages
+
+
+def environment_info():
+    """Returns the versions the results depend on."""
+
+    versions = {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+    for module_name in ['numpy', 'pandas', 'pyarrow', 'sklearn', 'tsfresh', 'tensorflow']:
+        try:
+            versions[module_name] = __import__(module_name).__version__
+        except ImportError:
+            versions[module_name] = None
+
+    return versions
+
+
+def compare_results(results, baseline):
+    """
+    Compares the stages of two benchmark results.
+
+    Args:
+        results (dict): Current results.
+        baseline (dict): Results of a previous release.
+
+    Returns:
+        dict: Mapping of stage -> ratios of samples per second (above 1 is faster) and of peak resident memory
+            (above 1 uses more) of the current results over the baseline.
+    """
+    comparison = {}
+    for name, stage in results['stages'].items():
+        baseline_stage = baseline['stages'].get(name, {})
+        if not stage.get('samples_per_second') or not baseline_stage.get('samples_per_second'):
+            continue
+        comparison[name] = {
+            'speedup': stage['samples_per_second'] / baseline_stage['samples_per_second'],
+            'peak_rss_ratio': stage['peak_rss_bytes'] / baseline_stage['peak_rss_bytes'],
+        }
+
+    return comparison
+
+
+def main(args):
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-7s %(message)s', stream=sys.stderr, level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    config = {
+        'n_nodes': args.nodes,
+        'n_jobs': args.jobs,
+        'duration': args.duration,
+        'interval': args.interval,
+        'fe_engine': args.fe_engine,
+        'fe_config': args.fe_config,
+        'epochs': args.epochs,
+        'batch_size': args.batch_size,
+        'window_size': args.window_size,
+        'skip_interval': args.skip_interval,
+        'windows': not args.no_windows,
+        'string_timestamps': args.string_timestamps,
+        'seed': args.seed,
+    }
+
+    results = {
+        'benchmark_version': BENCHMARK_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'config': config,
+        'environment': environment_info(),
+        'stages': run_benchmark(**config),
+    }
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as fp:
+            baseline = json.load(fp)
+        if baseline.get('config') != config:
+            logger.warning(f"The baseline {args.compare} was run with a different configuration")
+        results['comparison'] = compare_results(results, baseline)
+        for name, ratios in results['comparison'].items():
+            logger.info(f"{name}: {ratios['speedup']:.2f}x throughput, {ratios['peak_rss_ratio']:.2f}x peak RSS of the baseline")
+
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+        logger.info(f"Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times every pipeline stage on synthetic DSOS telemetry")
+    parser.add_argument('--nodes', type=int, default=4, help="Number of nodes per job")
+    parser.add_argument('--jobs', type=int, default=32, help="Number of jobs")
+    parser.add_argument('--duration', type=int, default=600, help="Duration of every job, in seconds")
+    parser.add_argument('--interval', type=int, default=1, help="Seconds between samples")
+    parser.add_argument('--fe-engine', default='tsfresh', choices=['tsfresh', 'native'])
+    parser.add_argument('--fe-config', default='minimal', choices=['minimal', 'efficient'])
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--window-size', type=int, default=60, help="Window size of the windowing stages, in samples")
+    parser.add_argument('--skip-interval', type=int, default=15, help="Samples between windows")
+    parser.add_argument('--no-windows', action='store_true', help="Skip the windowing stages")
+    parser.add_argument('--string-timestamps', action='store_true', help="Generate string timestamps like the DSOS exports")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON file the results are written to, defaults to stdout")
+    parser.add_argument('--compare', default=None, help="Results of a previous run to compare against")
+    main(parser.parse_args())
@@ -0,0 +1,169 @@
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from job_labels import JobIntervalIndex, label_node_file, node_name_from_path
+
+
+def discover_node_files(pattern):
+    """
+    Finds the metric files of all nodes, e.g. with the pattern '/data/zscore/cn*_*/final_metric.csv'.
+
+    Args:
+        pattern (str): Glob pattern of the node metric files, '**' matches nested directories.
+
+    Returns:
+        dict: Mapping of node name -> metric file, sorted by node name.
+    """
+    logger = logging.getLogger(__name__)
+
+    node_files = {}
+    for node_file in sorted(glob.glob(pattern, recursive=True)):
+        node_name = node_name_from_path(node_file)
+        if node_name in node_files:
+            logger.warning(f"Skipping {node_file}, node {node_name} is already read from {node_files[node_name]}")
+            continue
+        node_files[node_name] = node_file
+
+    return dict(sorted(node_files.items()))
+
+
+def is_node_built(target_dir, node_name):
+    """Returns True if both data files of a node exist in the dataset directory."""
+    return all(os.path.exists(os.path.join(target_dir, node_name, f'{node_name}_{split}.hdf')) for split in ['train', 'test'])
+
+
+#CSV parser thread cap of this process, set by the first build task that runs in it
+_worker_threads = None
+
+
+def _init_worker(threads_per_worker):
+    """Caps the CSV parser threads of a build worker once, so workers don't oversubscribe the cores."""
+
+    global _worker_threads
+    if _worker_threads is not None:
+        return
+    _worker_threads = threads_per_worker
+
+    try:
+        import pyarrow as pa
+        pa.set_cpu_count(threads_per_worker)
+    except ImportError:
+        pass
+
+
+def _build_node_task(node_name, node_file, interval_index, target_dir, split_kwargs, threads_per_worker=None):
+    """Converts one node and reports failures instead of raising, so one bad file doesn't stop the build."""
+
+    try:
+        #Worker processes are capped by their first task, ProcessPoolExecutor's initializer needs Python 3.7
+        if threads_per_worker is not None:
+            _init_worker(threads_per_worker)
+        label_node_file(node_file, interval_index, target_dir, node_name=node_name, **split_kwargs)
+        return None
+    except Exception:
+        return traceback.format_exc()
+
+
+def build_dataset(pattern, target_dir, label_file=None, n_workers=None, threads_per_worker=None, overwrite=False, **split_kwargs):
+    """
+    Converts the raw metric CSVs of all nodes into the dataset layout `single_node.process_node` reads,
+    '<target_dir>/<node>/<node>_train.hdf' and '<node>_test.hdf', in parallel.
+
+    Args:
+        pattern (str): Glob pattern of the node metric files.
+        target_dir (str): Dataset directory.
+        label_file (str): Job table to label the training samples with (default is None, every sample is labeled -1).
+        n_workers (int): Number of worker processes, 1 converts in the current process (default is None, the core count).
+        threads_per_worker (int): CSV parser threads per worker (default is None, the core count divided by n_workers).
+        overwrite (bool): If True, nodes that are already built are converted again (default is False).
+        **split_kwargs: Keyword arguments of `job_labels.label_node_file`, e.g. split_point or sampling_interval.
+
+    Returns:
+        dict: Mapping of node name -> error traceback, or None for converted nodes.
+    """
+    logger = logging.getLogger(__name__)
+    start_time = time.time()
+
+    node_files = discover_node_files(pattern)
+    if not overwrite:
+        built = [node_name for node_name in node_files if is_node_built(target_dir, node_name)]
+        if built:
+            logger.info(f"Skipping {len(built)} nodes that are already built")
+        node_files = {node_name: node_file for node_name, node_file in node_files.items() if node_name not in built}
+
+    #The job table is parsed and indexed once, and shipped to the workers with their tasks
+    interval_index = JobIntervalIndex.from_file(label_file) if label_file is not None else None
+
+    n_workers = n_workers or os.cpu_count() or 1
+    statuses = {}
+
+    if n_workers == 1:
+        for node_name, node_file in node_files.items():
+            statuses[node_name] = _build_node_task(node_name, node_file, interval_index, target_dir, split_kwargs)
+    else:
+        if threads_per_worker is None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // n_workers)
+        logger.info(f"Converting {len(node_files)} nodes on {n_workers} workers with {threads_per_worker} threads each")
+
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(_build_node_task, node_name, node_file, interval_index, target_dir, split_kwargs,
+                                       threads_per_worker): node_name
+                       for node_name, node_file in node_files.items()}
+
+            for num_done, future in enumerate(as_completed(futures), start=1):
+                node_name = futures[future]
+                try:
+                    statuses[node_name] = future.result()
+                except Exception:
+                    # The worker process itself died, e.g. killed by the OOM killer
+                    statuses[node_name] = traceback.format_exc()
+                logger.debug(f"Converted {node_name} ({num_done}/{len(futures)})")
+
+    for node_name, error in statuses.items():
+        if error is not None:
+            logger.error(f"Conversion failed for node {node_name} ({node_files[node_name]}):\n{error}")
+
+    num_failed = sum(error is not None for error in statuses.values())
+    logger.info(f"Built {len(statuses) - num_failed} nodes in {time.time() - start_time:.1f}s, {num_failed} failed")
+
+    return statuses
+
+
+def main(args):
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-7s %(message)s', stream=sys.stderr, level=logging.INFO)
+
+    statuses = build_dataset(args.pattern,
+                             args.target_dir,
+                             label_file=args.label_file,
+                             n_workers=args.workers,
+                             threads_per_worker=args.threads_per_worker,
+                             overwrite=args.overwrite,
+                             split_point=args.split_point,
+                             train_start=args.train_start,
+                             test_start=args.test_start,
+                             sampling_interval=args.sampling_interval)
+
+    if any(error is not None for error in statuses.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Builds the per-node training dataset from raw node metric CSVs")
+    parser.add_argument('--pattern', required=True, help="Glob pattern of the node metric files, e.g. '/data/zscore/cn*_*/final_metric.csv'")
+    parser.add_argument('--target-dir', required=True, help="Dataset directory the <node>/<node>_train.hdf and _test.hdf files are written to")
+    parser.add_argument('--label-file', default=None, help="Job table to label the training samples with")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes, defaults to the core count")
+    parser.add_argument('--threads-per-worker', type=int, default=None, help="CSV parser threads per worker")
+    parser.add_argument('--overwrite', action='store_true', help="Convert nodes that are already built again")
+    parser.add_argument('--split-point', type=int, default=25920, help="Number of training samples per node")
+    parser.add_argument('--train-start', type=int, default=1681660800, help="Epoch timestamp of the first training sample")
+    parser.add_argument('--test-start', type=int, default=1682049600, help="Epoch timestamp of the first test sample")
+    parser.add_argument('--sampling-interval', type=int, default=15, help="Seconds between samples")
+    main(parser.parse_args())
@@ -3,12 +3,15 @@ import json
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from sklearn.preprocessing import MinMaxScaler
-import joblib
-from tsfresh import extract_features
-from tsfresh.utilities.dataframe_functions import roll_time_series
-from tsfresh.feature_extraction.settings import MinimalFCParameters, EfficientFCParameters
-from tsfresh.feature_extraction import settings
+
+from constants import common_cols
+from utils import transform_dsos_data, compact_dtypes, EXACT_COLS
+from feature_engine import extract_minimal_window_features, supports_fc_parameters, fc_parameters_from_columns
+from feature_store import FeatureStore
+from scaling import iter_row_blocks, fit_scaler, merge_scalers, transform_to_float32
+from feature_selection import select_features
+from distributed_features import extract_series_features, extract_features_multiprocessing, extract_features_dask
+from profiling import profiled
 
 class DataPipeline():
     
@@ -18,29 +21,62 @@ class DataPipeline():
         Args:
             **kwargs: Dictionary containing the following optional keyword arguments:
                 system_name (str): Name of the system (default is 'eclipse').
+                fe_engine (str): Feature extraction engine, 'tsfresh' or 'native' (default is 'tsfresh').
+                    The native engine computes the minimal feature set with grouped NumPy reductions.
+                feature_cache_dir (str): Directory of the on-disk feature store. Extracted features are cached
+                    there and reused for identical inputs and settings (default is None, no caching).
+                feature_cache_max_bytes (int): Size limit of the feature store, in bytes (default is 10 GiB).
+                compact_dtypes (bool): If True, telemetry and features are kept in float32 and the job_id and 
+                    component_id columns as integer or categorical codes (default is False).
+                extraction_backend (str): Where features are extracted: 'local' in this process, 'multiprocessing' 
+                    on a pool of local processes, or 'dask' on the workers of a Dask distributed cluster (default is 'local').
+                n_jobs (int): Worker processes of the multiprocessing backend (default is None, the core count).
+                chunksize (int): Series per task of the multiprocessing and dask backends (default is None, a few
+                    tasks per worker).
+                dask_client (distributed.Client): Client of the cluster for the dask backend (default is None).
+                dask_scheduler_address (str): Scheduler the dask backend connects to without a dask_client 
+                    (default is None, a `LocalCluster` is started).
         """        
                 
         self.window_size = 0
         self.dataset_name = kwargs.get('system_name', 'eclipse')                
+        self.fe_engine = kwargs.get('fe_engine', 'tsfresh')
+        self.check_parameters({'fe_engine': self.fe_engine})
+        self.compact_dtypes = kwargs.get('compact_dtypes', False)
+        self.extraction_backend = kwargs.get('extraction_backend', 'local')
+        self.check_parameters({'extraction_backend': self.extraction_backend})
+        self.n_jobs = kwargs.get('n_jobs', None)
+        self.chunksize = kwargs.get('chunksize', None)
+        self.dask_client = kwargs.get('dask_client', None)
+        self.dask_scheduler_address = kwargs.get('dask_scheduler_address', None)
 
         self.raw_features = None        
         self.fe_features = None
+        self.feature_selection_stats = None
+        
+        feature_cache_dir = kwargs.get('feature_cache_dir', None)
+        if feature_cache_dir is None:
+            self.feature_store = None
+        else:
+            self.feature_store = FeatureStore(feature_cache_dir, max_bytes=kwargs.get('feature_cache_max_bytes', 10 * 1024**3))
         
         self.logger = logging.getLogger(__name__)
 
-    def load_HPC_data(self, train_path, test_path):
+    @profiled('DataPipeline.load_HPC_data')
+    def load_HPC_data(self, train_path, test_path, columns=None):
         """Loads data from the given file paths and returns the training and test data.
         
         Args:
-            train_path (str): Path to the training data file.
-            test_path (str): Path to the test data file.
+            train_path (str): Path to the training data file (.hdf, .parquet, .feather or .arrow).
+            test_path (str): Path to the test data file (.hdf, .parquet, .feather or .arrow).
+            columns (list, optional): Columns to load, e.g. from `input_columns`. Defaults to None, all columns.
             
         Returns:
             tuple: A tuple containing the training and test data.
         """        
         
-        x_train = self._read_data(train_path)
-        x_test = self._read_data(test_path)
+        x_train = self._read_data(train_path, columns)
+        x_test = self._read_data(test_path, columns)
         
         self.logger.info('Data read successfully')
         self.logger.info(f'Shape of x_train: {x_train.shape}')
@@ -48,6 +84,191 @@ class DataPipeline():
                 
         return x_train, x_test
         
+    @profiled('DataPipeline.transform_dsos_data')
+    def transform_dsos_data(self, meminfo_df, vmstat_df, procstat_df, silent=True):
+        """
+        Joins and processes DSOS meminfo, vmstat and procstat sampler data.
+
+        The metric info of the pipeline's system is loaded once and its compiled metric plan is cached.
+
+        Args:
+            meminfo_df (pd.DataFrame): meminfo sampler data.
+            vmstat_df (pd.DataFrame): vmstat sampler data.
+            procstat_df (pd.DataFrame): procstat sampler data.
+            silent (bool): If False, prints processing details. Defaults to True.
+
+        Returns:
+            pd.DataFrame: Processed data with timestamp, job_id and component_id columns.
+        """
+        
+        data = self._compact(transform_dsos_data(meminfo_df, vmstat_df, procstat_df, silent=silent, system_name=self.dataset_name))
+        self.logger.info(f'Transformed DSOS data: {data.shape}')
+        
+        return data
+        
+    @profiled('DataPipeline.load_data')
+    def load_data(self, input_path, columns=None):
+        """Loads a single data file, e.g. the input of a prediction.
+        
+        Args:
+            input_path (str): Path to the data file (.hdf, .parquet, .feather or .arrow).
+            columns (list, optional): Columns to load, e.g. from `input_columns`. Defaults to None, all columns.
+            
+        Returns:
+            pd.DataFrame: Loaded data.
+        """
+        
+        data = self._read_data(input_path, columns)
+        
+        if data is not None:
+            self.logger.info(f'Shape of data: {data.shape}')
+            
+        return data
+        
+    def iter_HPC_data(self, input_path, chunk_rows=1000000, job_ids=None, component_ids=None, start_time=None, end_time=None, columns=None):
+        """
+        Iterates a node dataset in bounded-size chunks, with the filters pushed down to storage.
+
+        Parquet and Arrow IPC files are scanned with pyarrow datasets, and HDF files written in table format 
+        are queried with `where` clauses. Rows of the same (job_id, component_id) series must be contiguous 
+        in the file; a chunk never splits such a series, so every chunk can be passed to 
+        `tsfresh_generate_features` on its own.
+
+        Args:
+            input_path (str): Path to the data file (.hdf, .parquet, .feather or .arrow).
+            chunk_rows (int): Number of rows read from storage at once. Defaults to 1000000.
+            job_ids (list, optional): Only read these job_ids.
+            component_ids (list, optional): Only read these component_ids.
+            start_time (int, optional): Only read rows with timestamp >= start_time.
+            end_time (int, optional): Only read rows with timestamp <= end_time.
+            columns (list, optional): Columns to read. Defaults to None, all columns.
+
+        Yields:
+            pd.DataFrame: Chunks of whole series.
+        """
+        
+        carry = None
+        #The series keys are read to find the chunk boundaries, and dropped again if they weren't requested
+        read_columns = None if columns is None else list(columns) + [key for key in ['job_id', 'component_id'] if key not in columns]
+        
+        def project(chunk):
+            return chunk if columns is None else chunk[list(columns)]
+        
+        for batch in self._iter_batches(input_path, chunk_rows, job_ids, component_ids, start_time, end_time, read_columns):
+            batch = self._compact(batch)
+            if carry is not None:
+                batch = pd.concat([carry, batch], ignore_index=True)
+            if len(batch) == 0:
+                continue
+            
+            #Hold back the last series of the batch, the next batch may continue it
+            job_id_values = batch['job_id'].values
+            component_id_values = batch['component_id'].values
+            in_last_series = (job_id_values == job_id_values[-1]) & (component_id_values == component_id_values[-1])
+            boundary = len(batch) - np.argmin(in_last_series[::-1]) if not in_last_series.all() else 0
+            
+            carry = batch.iloc[boundary:]
+            if boundary > 0:
+                yield project(batch.iloc[:boundary])
+                
+        if carry is not None and len(carry) > 0:
+            yield project(carry)
+    
+    def _iter_batches(self, input_path, chunk_rows, job_ids, component_ids, start_time, end_time, columns):
+        """Yields filtered storage batches of at most `chunk_rows` rows."""
+        
+        suffix = Path(input_path).suffix
+        
+        if suffix in ['.parquet', '.feather', '.arrow']:
+            import pyarrow.dataset as ds
+            
+            predicates = []
+            if job_ids is not None:
+                predicates.append(ds.field('job_id').isin(list(job_ids)))
+            if component_ids is not None:
+                predicates.append(ds.field('component_id').isin(list(component_ids)))
+            if start_time is not None:
+                predicates.append(ds.field('timestamp') >= start_time)
+            if end_time is not None:
+                predicates.append(ds.field('timestamp') <= end_time)
+            
+            predicate = None
+            for curr_predicate in predicates:
+                predicate = curr_predicate if predicate is None else predicate & curr_predicate
+            
+            dataset = ds.dataset(input_path, format='parquet' if suffix == '.parquet' else 'ipc')
+            for batch in dataset.to_batches(columns=columns, filter=predicate, batch_size=chunk_rows):
+                yield batch.to_pandas()
+        else:
+            where = []
+            filter_columns = set()
+            if job_ids is not None:
+                where.append(f"job_id in {list(job_ids)}")
+                filter_columns.add('job_id')
+            if component_ids is not None:
+                where.append(f"component_id in {list(component_ids)}")
+                filter_columns.add('component_id')
+            if start_time is not None:
+                where.append(f"timestamp >= {start_time}")
+                filter_columns.add('timestamp')
+            if end_time is not None:
+                where.append(f"timestamp <= {end_time}")
+                filter_columns.add('timestamp')
+            
+            #The format is checked up front, a failure after the first chunks must not restart the read
+            with pd.HDFStore(input_path, mode='r') as store:
+                keys = store.keys()
+                storer = store.get_storer(keys[0]) if len(keys) == 1 else None
+                queryable = storer is not None and storer.is_table and filter_columns <= set(storer.data_columns)
+            
+            if queryable:
+                yield from pd.read_hdf(input_path, where=where or None, columns=columns, chunksize=chunk_rows)
+            else:
+                self.logger.warning(f"{input_path} is not an HDF table with queryable key columns, reading it fully before filtering")
+                data = pd.read_hdf(input_path)
+                mask = np.ones(len(data), dtype=bool)
+                if job_ids is not None:
+                    mask &= data['job_id'].isin(job_ids).values
+                if component_ids is not None:
+                    mask &= data['component_id'].isin(component_ids).values
+                if start_time is not None:
+                    mask &= (data['timestamp'] >= start_time).values
+                if end_time is not None:
+                    mask &= (data['timestamp'] <= end_time).values
+                data = data[mask]
+                data = data[columns] if columns is not None else data
+                for chunk_start in range(0, len(data), chunk_rows):
+                    yield data.iloc[chunk_start:chunk_start + chunk_rows]
+    
+    def generate_features_chunked(self, chunks, fe_config, kind_to_fc_parameters=None):
+        """
+        Runs `tsfresh_generate_features` chunk by chunk, e.g. over `iter_HPC_data`.
+
+        Only the raw rows of one chunk are in memory at a time. A feature column dropped from one chunk 
+        for containing NaNs comes back as NaN when the chunks are concatenated and is dropped again, 
+        the same as extracting all chunks at once.
+
+        Args:
+            chunks (iterable): Frames of whole (job_id, component_id) series.
+            fe_config (str): Configuration of feature extractor. Can be "minimal" or "efficient".
+            kind_to_fc_parameters (dict): Dictionary containing feature parameters for each feature kind.
+
+        Returns:
+            pd.DataFrame: Extracted features.
+        """
+        
+        chunk_features = []
+        for chunk in chunks:
+            chunk_fe = self.tsfresh_generate_features(chunk.copy(), fe_config, kind_to_fc_parameters=kind_to_fc_parameters)
+            chunk_features.append(chunk_fe)
+            self.logger.info(f'Extracted features of chunk {len(chunk_features)}: {chunk_fe.shape}')
+            
+        if not chunk_features:
+            raise ValueError(f"Param [chunks] cannot be empty")
+            
+        return self._finalize_features(pd.concat(chunk_features, sort=False))
+    
+    @profiled('DataPipeline.generate_windows')
     def generate_windows(self, data, window_size=60, skip_interval=15):
         """
         Generates rolling time windows for the input data, based on a given window size and skip interval.
@@ -69,7 +290,10 @@ class DataPipeline():
         data.reset_index(inplace=True)
         
         self.window_size = window_size
-        
+
+        #tsfresh is imported on first use, it takes seconds to import
+        from tsfresh.utilities.dataframe_functions import roll_time_series
+
         data_windows = roll_time_series(
             data,
             column_id="component_id",
@@ -93,7 +317,9 @@ class DataPipeline():
         """
         
         allowed_values = {
-                    'fe_config': ['minimal', 'efficient', None]
+                    'fe_config': ['minimal', 'efficient', None],
+                    'fe_engine': ['tsfresh', 'native'],
+                    'extraction_backend': ['local', 'multiprocessing', 'dask'],
         }
         
         for param_name, param_value in params.items():
@@ -103,14 +329,19 @@ class DataPipeline():
                 raise ValueError(f"Invalid value {param_value} for parameter {param_name}. Allowed values: {allowed_values[param_name]}")
     
     
+    @profiled('DataPipeline.tsfresh_generate_features')
     def tsfresh_generate_features(self, data, fe_config, kind_to_fc_parameters=None, column_id="uid", column_sort="timestamp"):
         """
         Extracts features from data using tsfresh library.
 
+        The extraction runs on the pipeline's extraction_backend. With the dask backend, data can also be a Dask
+        DataFrame whose partitions each hold whole (job_id, component_id) series; its partitions are extracted on
+        the workers holding them, without the feature store.
+
         Args:
             data (pd.DataFrame): Input data to extract features from.
             fe_config (str): Configuration of feature extractor. Can be "minimal" or "efficient".
-            column_id (str): Name of column representing the ID of the time series.
+            column_id (str): Name of the column the integer series codes are stored in during extraction.
             column_sort (str): Name of column representing the time of each observation.
             kind_to_fc_parameters (dict): Dictionary containing feature parameters for each feature kind.
 
@@ -118,58 +349,197 @@ class DataPipeline():
             ValueError: If `fe_config` value is not in allowed list.
 
         Returns:
-            pd.DataFrame: Extracted features.
+            pd.DataFrame: Extracted features, indexed by job_id and component_id with their original types.
         """        
-        if data is None or len(data) == 0: 
+        #The length of a Dask DataFrame is only known after reading all its partitions
+        if data is None or (isinstance(data, pd.DataFrame) and len(data) == 0): 
             raise ValueError(f"Param [data] cannot be None or empty")
             
         self.check_parameters({'fe_config': fe_config})        
         
         if not (kind_to_fc_parameters is None):
             assert fe_config == None, "Either set fe_config or kind_to_fc_parameters, not both"
+        
+        use_native = self._use_native_engine(fe_config, kind_to_fc_parameters)
+        if use_native:
+            self.logger.info("Native engine will extract the minimal features")
+        elif kind_to_fc_parameters is None:
+            self.logger.info("TSFRESH will use default_fc_parameters")
+        else:
+            self.logger.info("TSFRESH will use kind_to_fc_parameters")
+        extract_kwargs = dict(use_native=use_native, fe_config=fe_config, kind_to_fc_parameters=kind_to_fc_parameters, 
+                              column_id=column_id, column_sort=column_sort)
+        
+        if not isinstance(data, pd.DataFrame):
+            if self.extraction_backend != 'dask':
+                raise ValueError(f"Dask DataFrames need the dask extraction backend, not {self.extraction_backend}")
+            return self._finalize_features(extract_features_dask(data, self._get_dask_client(), chunksize=self.chunksize, **extract_kwargs))
+        
+        cache_key, data_fe = self._lookup_features(data, fe_config=fe_config, kind_to_fc_parameters=kind_to_fc_parameters, 
+                                                   window_size=self.window_size, column_id=column_id, column_sort=column_sort)
+        if data_fe is not None:
+            return self._finalize_features(data_fe)
                                 
         if np.any(pd.isnull(data)):
             self.logger.info(f'Raw time series: Before dropping NaNs: {data.shape}')
             data = data.dropna()
             self.logger.info(f'Raw time series:  Dropped NaNs: {data.shape}') 
         
-        data['uid'] = data['job_id'].astype(str) + '_' + data['component_id'].astype(str)
-        data.drop(columns=['job_id','component_id'],inplace=True)
-        
-        if kind_to_fc_parameters is None:
-            self.logger.info("TSFRESH will use default_fc_parameters")
-            data_fe = extract_features(            
-                data,
-                column_id=column_id,
-                column_sort=column_sort,
-                default_fc_parameters=EfficientFCParameters() if fe_config == 'efficient' else MinimalFCParameters(),
-            )
-        else:
-            self.logger.info("TSFRESH will use kind_to_fc_parameters")
-            data_fe = extract_features(            
-                data,
-                column_id=column_id,
-                column_sort=column_sort,
-                kind_to_fc_parameters=kind_to_fc_parameters,
-            )                        
-        data_fe.reset_index(inplace=True)
-        data_fe[['job_id', 'component_id']] = data_fe['index'].str.split('_', expand=True)
-        data_fe.drop(columns=['index'], inplace=True)
-        
-        if self.window_size == 0 :
-            data_fe.set_index(["job_id", "component_id"],inplace=True)
+        if self.extraction_backend == 'multiprocessing':
+            data_fe = extract_features_multiprocessing(data, n_jobs=self.n_jobs, chunksize=self.chunksize, **extract_kwargs)
+        elif self.extraction_backend == 'dask':
+            data_fe = extract_features_dask(data, self._get_dask_client(), chunksize=self.chunksize, **extract_kwargs)
         else:
-            data_fe.set_index(["job_id", "component_id", "timestamp"],inplace=True)
+            data_fe = extract_series_features(data, **extract_kwargs)
+        
+        return self._store_features(cache_key, self._finalize_features(data_fe))
+    
+    @profiled('DataPipeline.generate_window_features')
+    def generate_window_features(self, data, fe_config='minimal', kind_to_fc_parameters=None, window_size=60, skip_interval=15):
+        """
+        Extracts the minimal features of rolling time windows straight from the original series.
+
+        Produces the same windows as `generate_windows` followed by `tsfresh_generate_features`, but computes
+        them with running sums and sliding extremes instead of copying every row into every window.
+
+        Args:
+            data (pd.DataFrame): Input data with job_id, component_id and timestamp columns.
+            fe_config (str): Configuration of feature extractor. Only "minimal" is supported.
+            kind_to_fc_parameters (dict): Dictionary containing feature parameters for each feature kind.
+            window_size (int): Size of the rolling window, in samples. Defaults to 60.
+            skip_interval (int): Number of samples to skip between each window. Defaults to 15.
+
+        Raises:
+            ValueError: If the requested features are not part of the minimal feature set.
+
+        Returns:
+            pd.DataFrame: Extracted features, indexed by job_id, component_id and the window's last timestamp.
+        """
+        if data is None or len(data) == 0: 
+            raise ValueError(f"Param [data] cannot be None or empty")
+        
+        assert window_size != 0, "Window size should be different than 0, to generate windows."
+        
+        self.check_parameters({'fe_config': fe_config})
+        
+        if not (kind_to_fc_parameters is None):
+            assert fe_config == None, "Either set fe_config or kind_to_fc_parameters, not both"
+        elif fe_config == 'efficient':
+            raise ValueError("Windowed feature extraction only supports the minimal feature set")
+        
+        self.window_size = window_size
+        
+        cache_key, data_fe = self._lookup_features(data, fe_config=fe_config, kind_to_fc_parameters=kind_to_fc_parameters, 
+                                                   window_size=window_size, skip_interval=skip_interval)
+        if data_fe is not None:
+            return self._finalize_features(data_fe)
+        
+        if np.any(pd.isnull(data)):
+            self.logger.info(f'Raw time series: Before dropping NaNs: {data.shape}')
+            data = data.dropna()
+            self.logger.info(f'Raw time series:  Dropped NaNs: {data.shape}') 
+        
+        data_fe = extract_minimal_window_features(
+            data,
+            column_id=['job_id', 'component_id'],
+            column_sort='timestamp',
+            window_size=window_size,
+            skip_interval=skip_interval,
+            kind_to_fc_parameters=kind_to_fc_parameters,
+        )
+        
+        return self._store_features(cache_key, self._finalize_features(data_fe))
+    
+    def _lookup_features(self, data, **params):
+        """
+        Consults the feature store before extraction.
+
+        Args:
+            data (pd.DataFrame): Raw input frame of the extraction.
+            **params: Extraction settings that affect the result.
+
+        Returns:
+            tuple: The cache key (None without a feature store) and the cached features (None on a miss).
+        """
+        if self.feature_store is None:
+            return None, None
         
+        cache_key = self.feature_store.fingerprint(data, fe_engine=self.fe_engine, **params)
+        
+        return cache_key, self.feature_store.get(cache_key)
+    
+    def _store_features(self, cache_key, data_fe):
+        """
+        Saves extracted features to the feature store, if there is one.
+
+        Args:
+            cache_key (str): Cache key returned by `_lookup_features`.
+            data_fe (pd.DataFrame): Extracted features.
+
+        Returns:
+            pd.DataFrame: The same extracted features.
+        """
+        if self.feature_store is not None:
+            self.feature_store.put(cache_key, data_fe)
+            self.logger.info(f'Feature store statistics: {self.feature_store.stats()}')
+        
+        return data_fe
+    
+    def _finalize_features(self, data_fe):
+        """
+        Drops feature columns with NaNs and records the extracted feature names.
+
+        Args:
+            data_fe (pd.DataFrame): Extracted features.
+
+        Returns:
+            pd.DataFrame: Extracted features without NaN columns.
+        """
         self.logger.info(f'Feature extraction: Before dropping NaNs: {data_fe.shape}')
         data_fe = data_fe.dropna(axis=1, how='any')    
         self.logger.info(f'Feature extraction: Dropped NaNs: {data_fe.shape}') 
                 
+        if self.compact_dtypes:
+            data_fe = data_fe.astype(np.float32, copy=False)
+                
         self.raw_features = list(data_fe.columns)
-        self.fe_features = settings.from_columns(self.raw_features)
+        self.fe_features = fc_parameters_from_columns(self.raw_features)
         
         return data_fe
     
+    def _get_dask_client(self):
+        """Returns the client of the dask backend, connecting to the scheduler or starting a `LocalCluster` on first use."""
+        
+        if self.dask_client is None:
+            #distributed is only imported by the dask backend
+            from distributed import Client
+            self.dask_client = Client(self.dask_scheduler_address) if self.dask_scheduler_address else Client()
+            self.logger.info(f"Connected to the Dask cluster {self.dask_client.scheduler.address}")
+        
+        return self.dask_client
+    
+    def _use_native_engine(self, fe_config, kind_to_fc_parameters):
+        """
+        Decides whether the native engine can serve the requested feature configuration.
+
+        Args:
+            fe_config (str): Configuration of feature extractor.
+            kind_to_fc_parameters (dict): Dictionary containing feature parameters for each feature kind.
+
+        Returns:
+            bool: True if the native engine is selected and supports the requested features.
+        """
+        if self.fe_engine != 'native':
+            return False
+        
+        if kind_to_fc_parameters is None and fe_config in ['minimal', None]:
+            return True
+        if kind_to_fc_parameters is not None and supports_fc_parameters(kind_to_fc_parameters):
+            return True
+        
+        self.logger.warning("Native engine only supports the minimal features, falling back to TSFRESH")
+        return False
+    
     # def scale_data(self, x_train, x_test=None, save_dir=None):        
     #     """
     #     Scales data using MinMaxScaler.
@@ -198,56 +568,203 @@ class DataPipeline():
             
     #     return x_train, x_test
     
-    def scale_data(self, x_train, x_test=None, save_dir=None):        
+    @profiled('DataPipeline.select_features')
+    def select_features(self, data_fe, variance_threshold=0.0, correlation_threshold=None, pre_selected=None):
+        """
+        Prunes the extracted training features, see `feature_selection.select_features`.
+
+        The retained features become `raw_features` and `fe_features`, so extraction for the test data and
+        at deployment computes only them.
+
+        Args:
+            data_fe (pd.DataFrame): Extracted training features.
+            variance_threshold (float): Minimum variance of the normalized features. Defaults to 0.0, None disables it.
+            correlation_threshold (float): Absolute correlation of near-duplicate features. Defaults to None, disabled.
+            pre_selected (list): Feature names to restrict the selection to. Defaults to None.
+
+        Returns:
+            pd.DataFrame: Training features with the retained columns.
+        """
+        columns, self.feature_selection_stats = select_features(data_fe, 
+                                                                variance_threshold=variance_threshold, 
+                                                                correlation_threshold=correlation_threshold, 
+                                                                pre_selected=pre_selected)
+        
+        self.raw_features = columns
+        self.fe_features = fc_parameters_from_columns(columns)
+        
+        return data_fe[columns]
+    
+    @profiled('DataPipeline.scale_data')
+    def scale_data(self, x_train, x_test=None, save_dir=None, scaler=None):        
         """
         Scales data using MinMaxScaler.
+        
+        The scaler is fitted on float64 row blocks, and every frame is scaled into one float32 matrix.
 
         Args:
             x_train (pd.DataFrame): Training data to scale.
             x_test (pd.DataFrame, optional): Test data to scale. Defaults to None.
             save_dir (str, optional): Directory to save scaler object. Defaults to None.
+            scaler (MinMaxScaler, optional): Scaler fitted beforehand, e.g. with `fit_scaler` or `merge_scalers`.
+                Defaults to None, the scaler is fitted on x_train.
 
         Returns:
             pd.DataFrame: Scaled training data.
             pd.DataFrame: Scaled test data.
         """        
     
-        # Ensure all columns are numeric
-        x_train = x_train.apply(pd.to_numeric, errors='coerce')
-        
-        if x_test is not None:
-            x_test = x_test.apply(pd.to_numeric, errors='coerce')
-
-        scaler = MinMaxScaler(feature_range=(0, 1), clip=True)
+        # Non-numeric columns are coerced block by block while fitting and scaling
+        if scaler is None:
+            scaler = fit_scaler(iter_row_blocks(x_train))
 
-        x_train = pd.DataFrame(scaler.fit_transform(x_train), columns=x_train.columns, index=x_train.index)        
+        x_train = pd.DataFrame(transform_to_float32(scaler, x_train), columns=x_train.columns, index=x_train.index)
         
         if x_test is not None:
             self.logger.info(f"x_test is not None, scaling")
-            x_test = pd.DataFrame(scaler.transform(x_test), columns=x_test.columns, index=x_test.index)
+            x_test = pd.DataFrame(transform_to_float32(scaler, x_test), columns=x_test.columns, index=x_test.index)
         
         if save_dir is not None:
-            scaler_filename = "scaler.save"
-            joblib.dump(scaler, Path(save_dir) / scaler_filename)
-            self.logger.info(f"Scaler is saved")
+            self.save_scaler(scaler, save_dir)
         
         return x_train, x_test
+    
+    def fit_scaler(self, chunks, scaler=None, save_dir=None):
+        """
+        Fits the scaler incrementally over chunks of features, e.g. from `generate_features_chunked`.
+
+        Args:
+            chunks (iterable): Feature chunks with the same columns.
+            scaler (MinMaxScaler, optional): Scaler to keep fitting. Defaults to None, a new scaler.
+            save_dir (str, optional): Directory to save scaler object. Defaults to None.
+
+        Returns:
+            MinMaxScaler: The fitted scaler, to pass to `scale_data`.
+        """
+        scaler = fit_scaler(chunks, scaler)
+        
+        if save_dir is not None:
+            self.save_scaler(scaler, save_dir)
+            
+        return scaler
+    
+    @staticmethod
+    def merge_scalers(scalers):
+        """Merges scalers fitted on different nodes or workers, see `scaling.merge_scalers`."""
+        return merge_scalers(scalers)
+    
+    def save_scaler(self, scaler, save_dir):
+        
+        import joblib
+        scaler_filename = "scaler.save"
+        joblib.dump(scaler, Path(save_dir) / scaler_filename)
+        self.logger.info(f"Scaler is saved")
 
-    def _read_data(self, abs_input_path):
+    @staticmethod
+    def input_columns(kind_to_fc_parameters):
         """
-        Reads data from HDF5 file.
+        Returns the raw columns needed to extract the given features, for column-projected loading.
+
+        Args:
+            kind_to_fc_parameters (dict): Feature parameters for each kind, e.g. `fe_column_names` of the deployment metadata.
+
+        Returns:
+            list: The job_id, component_id and timestamp columns followed by every metric the features are computed from.
+        """
+        return ['job_id', 'component_id', 'timestamp'] + [kind for kind in kind_to_fc_parameters if kind not in common_cols]
+    
+    def write_columnar_data(self, data, abs_output_path):
+        """
+        Writes data in a columnar format that `load_HPC_data` can read with memory mapping and column projection.
+
+        Args:
+            data (pd.DataFrame): Data to write.
+            abs_output_path (str): Output path, ending with .parquet, .feather or .arrow.
+        """
+        import pyarrow as pa
+        
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        
+        if Path(abs_output_path).suffix == '.parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, abs_output_path)
+        else:
+            import pyarrow.feather as feather
+            #Uncompressed Arrow IPC can be memory mapped without decoding
+            feather.write_feather(table, abs_output_path, compression='uncompressed')
+            
+        self.logger.info(f"Data is saved to {abs_output_path}")
+
+    def _read_data(self, abs_input_path, columns=None):
+        """
+        Reads data from an HDF5, Parquet or Arrow IPC (Feather) file.
+        
+        Parquet and Arrow IPC files are memory mapped and only the requested columns are read.
 
         Args:
             abs_input_path (str): Absolute path to input data file.
+            columns (list, optional): Columns to read. Defaults to None, all columns.
 
         Returns:
             pd.DataFrame: Input data.
         """        
         
+        suffix = Path(abs_input_path).suffix
+        
         try:
-            data = pd.read_hdf(abs_input_path)
+            if suffix in ['.parquet', '.feather', '.arrow'] and self.compact_dtypes:
+                data = self._read_columnar_compact(abs_input_path, columns=columns)
+            elif suffix == '.parquet':
+                import pyarrow.parquet as pq
+                data = pq.read_table(abs_input_path, columns=columns, memory_map=True).to_pandas()
+            elif suffix in ['.feather', '.arrow']:
+                import pyarrow.feather as feather
+                data = feather.read_table(abs_input_path, columns=columns, memory_map=True).to_pandas()
+            else:
+                data = pd.read_hdf(abs_input_path)
+                if columns is not None:
+                    data = data[columns]
         except FileNotFoundError:
             self.logger.error(f"File not found!: {abs_input_path}")
             return None
         
-        return data
+        return self._compact(data)
+    
+    def _read_columnar_compact(self, abs_input_path, columns=None, group_size=8):
+        """
+        Reads a Parquet or Arrow IPC file a few columns at a time and casts float64 columns to float32 before 
+        converting them, so neither the whole Arrow table nor a float64 copy of the data is in memory at once.
+        Timestamps and the other `utils.EXACT_COLS` keep their type.
+        """
+        import pyarrow as pa
+        
+        if Path(abs_input_path).suffix == '.parquet':
+            import pyarrow.parquet as pq
+            schema = pq.read_schema(abs_input_path)
+            read_table = lambda group: pq.read_table(abs_input_path, columns=group, memory_map=True)
+        else:
+            import pyarrow.feather as feather
+            with pa.memory_map(abs_input_path) as source:
+                schema = pa.ipc.open_file(source).schema
+            read_table = lambda group: feather.read_table(abs_input_path, columns=group, memory_map=True)
+        
+        columns = schema.names if columns is None else list(columns)
+        
+        frames = []
+        for begin in range(0, len(columns), group_size):
+            table = read_table(columns[begin:begin + group_size])
+            table = table.cast(pa.schema([field.with_type(pa.float32()) if field.type == pa.float64() and field.name not in EXACT_COLS 
+                                          else field for field in table.schema]))
+            frames.append(table.to_pandas())
+            del table
+        
+        #Concatenating the group frames once is far cheaper than building a frame from single columns
+        return pd.concat(frames, axis=1)
+    
+    def _compact(self, data):
+        """Applies `utils.compact_dtypes` in compact mode."""
+        
+        if not self.compact_dtypes or data is None:
+            return data
+        
+        return compact_dtypes(data)
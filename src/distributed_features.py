@@ -0,0 +1,203 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from feature_engine import extract_minimal_features, encode_series_keys
+
+logger = logging.getLogger(__name__)
+
+#Partitions per worker, so a worker with short series picks up the next partition instead of idling
+PARTITIONS_PER_WORKER = 4
+
+
+def extract_series_features(data, use_native, fe_config=None, kind_to_fc_parameters=None, column_id="uid", column_sort="timestamp",
+                            n_jobs=None, chunksize=None):
+    """
+    Extracts the features of every (job_id, component_id) series of a frame, in this process.
+
+    Args:
+        data (pd.DataFrame): Long-format telemetry with job_id, component_id, the sort column and the metrics,
+            without NaNs. The frame is consumed.
+        use_native (bool): If True, the native engine computes the minimal features, otherwise tsfresh does.
+        fe_config (str): tsfresh feature set, 'minimal' or 'efficient', used without kind_to_fc_parameters.
+        kind_to_fc_parameters (dict): Features to extract per metric (default is None).
+        column_id (str): Name of the column the integer series codes are stored in during extraction.
+        column_sort (str): Name of the column representing the time of each observation.
+        n_jobs (int): tsfresh worker processes, 0 extracts in this process (default is None, tsfresh's default).
+        chunksize (int): Series per tsfresh task (default is None, tsfresh's heuristic).
+
+    Returns:
+        pd.DataFrame: Extracted features, indexed by job_id and component_id.
+    """
+    #Series are keyed by integer codes, the lookup table maps them back to the job and component ids
+    series_codes, series_lookup = encode_series_keys(data, ['job_id', 'component_id'])
+    data[column_id] = series_codes
+    #Deleting the id columns only touches their blocks, dropping them rebuilds the whole frame
+    del data['job_id'], data['component_id']
+
+    if use_native:
+        data_fe = extract_minimal_features(
+            data,
+            column_id=column_id,
+            column_sort=column_sort,
+            kind_to_fc_parameters=kind_to_fc_parameters,
+        )
+    else:
+        from tsfresh import extract_features
+
+        extraction_kwargs = {'chunksize': chunksize}
+        if n_jobs is not None:
+            extraction_kwargs['n_jobs'] = n_jobs
+        if kind_to_fc_parameters is None:
+            from tsfresh.feature_extraction.settings import MinimalFCParameters, EfficientFCParameters
+            extraction_kwargs['default_fc_parameters'] = EfficientFCParameters() if fe_config == 'efficient' else MinimalFCParameters()
+        else:
+            extraction_kwargs['kind_to_fc_parameters'] = kind_to_fc_parameters
+
+        data_fe = extract_features(data, column_id=column_id, column_sort=column_sort, **extraction_kwargs)
+
+    data_fe.index = series_lookup[data_fe.index.to_numpy()]
+
+    return data_fe
+
+
+def _extract_partition(partition, *args, **kwargs):
+    """Worker side of the distributed extraction: drops the partition's NaN rows and extracts its series in-process."""
+
+    if partition.isnull().values.any():
+        partition = partition.dropna()
+    if len(partition) == 0:
+        return None
+
+    return extract_series_features(partition, *args, n_jobs=0, **kwargs)
+
+
+def partition_by_series(data, n_partitions):
+    """
+    Splits long-format telemetry into partitions of whole (job_id, component_id) series with similar row counts.
+
+    Args:
+        data (pd.DataFrame): Long-format telemetry with job_id and component_id columns.
+        n_partitions (int): Maximum number of partitions.
+
+    Yields:
+        pd.DataFrame: Rows of the series of one partition, in their original order.
+    """
+    series_codes = data.groupby(['job_id', 'component_id'], sort=True).ngroup().to_numpy()
+    n_partitions = max(1, min(n_partitions, int(series_codes.max()) + 1 if len(series_codes) else 1))
+
+    #Series are assigned in key order by the rows that precede them, so partitions hold contiguous key ranges
+    series_rows = np.bincount(series_codes)
+    rows_before = np.cumsum(series_rows) - series_rows
+    series_partitions = rows_before * n_partitions // max(len(series_codes), 1)
+
+    row_partitions = series_partitions[series_codes]
+    order = np.argsort(row_partitions, kind='stable')
+    bounds = np.searchsorted(row_partitions[order], np.arange(n_partitions + 1))
+
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop > start:
+            yield data.take(order[start:stop])
+
+
+def _num_partitions(data, chunksize, n_workers):
+    """Number of partitions of chunksize series each, or a few per worker without a chunksize."""
+
+    if chunksize is None:
+        return n_workers * PARTITIONS_PER_WORKER
+
+    n_series = len(data.drop_duplicates(['job_id', 'component_id'])) if len(data) else 0
+    return max(1, -(-n_series // chunksize))
+
+
+def _combine(partition_features):
+    """Concatenates the feature partitions in the key order of an in-process extraction."""
+
+    partition_features = [data_fe for data_fe in partition_features if data_fe is not None]
+    if not partition_features:
+        raise ValueError("No series were left to extract features from")
+
+    data_fe = pd.concat(partition_features, sort=False)
+    if data_fe.index.has_duplicates:
+        raise ValueError("A (job_id, component_id) series was split across partitions, every series must lie in one partition")
+
+    return data_fe.sort_index()
+
+
+def extract_features_multiprocessing(data, use_native, fe_config=None, kind_to_fc_parameters=None, column_id="uid",
+                                     column_sort="timestamp", n_jobs=None, chunksize=None):
+    """
+    Extracts features with a pool of local worker processes.
+
+    tsfresh distributes the extraction itself, in tasks of chunksize (series, metric) pairs. The native engine
+    gets partitions of chunksize whole series per task.
+
+    Args:
+        data (pd.DataFrame): Long-format telemetry without NaNs, see `extract_series_features`.
+        use_native (bool): If True, the native engine computes the minimal features, otherwise tsfresh does.
+        fe_config (str): tsfresh feature set, 'minimal' or 'efficient', used without kind_to_fc_parameters.
+        kind_to_fc_parameters (dict): Features to extract per metric (default is None).
+        column_id (str): Name of the column the integer series codes are stored in during extraction.
+        column_sort (str): Name of the column representing the time of each observation.
+        n_jobs (int): Number of worker processes (default is None, the core count).
+        chunksize (int): Series per task (default is None, a few tasks per worker).
+
+    Returns:
+        pd.DataFrame: Extracted features, indexed by job_id and component_id.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    if not use_native:
+        return extract_series_features(data, use_native, fe_config, kind_to_fc_parameters, column_id, column_sort,
+                                       n_jobs=n_jobs, chunksize=chunksize)
+
+    n_partitions = _num_partitions(data, chunksize, n_jobs)
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(_extract_partition, partition, use_native, fe_config, kind_to_fc_parameters, column_id, column_sort)
+                   for partition in partition_by_series(data, n_partitions)]
+        logger.info(f"Extracting features of {len(futures)} partitions on {n_jobs} processes")
+
+        return _combine([future.result() for future in futures])
+
+
+def extract_features_dask(data, client, use_native, fe_config=None, kind_to_fc_parameters=None, column_id="uid",
+                          column_sort="timestamp", chunksize=None):
+    """
+    Extracts features on the workers of a Dask `distributed` cluster.
+
+    A pandas frame is split into partitions of whole series, which are scattered straight to the workers. A
+    Dask DataFrame stays where it is and every partition is extracted on the worker holding it, e.g. one
+    partition per node file read with `dask.dataframe.read_parquet`, so each series must lie in one partition.
+    Only the extracted features are gathered.
+
+    Args:
+        data (pd.DataFrame or dask.dataframe.DataFrame): Long-format telemetry, see `extract_series_features`.
+        client (distributed.Client): Client of the cluster.
+        use_native (bool): If True, the native engine computes the minimal features, otherwise tsfresh does.
+        fe_config (str): tsfresh feature set, 'minimal' or 'efficient', used without kind_to_fc_parameters.
+        kind_to_fc_parameters (dict): Features to extract per metric (default is None).
+        column_id (str): Name of the column the integer series codes are stored in during extraction.
+        column_sort (str): Name of the column representing the time of each observation.
+        chunksize (int): Series per partition of a pandas frame (default is None, a few partitions per worker).
+
+    Raises:
+        ValueError: If a series lies in more than one partition of a Dask DataFrame.
+
+    Returns:
+        pd.DataFrame: Extracted features, indexed by job_id and component_id.
+    """
+    extract_args = (use_native, fe_config, kind_to_fc_parameters, column_id, column_sort)
+
+    if isinstance(data, pd.DataFrame):
+        n_workers = max(1, len(client.scheduler_info()['workers']))
+        futures = [client.submit(_extract_partition, client.scatter(partition), *extract_args)
+                   for partition in partition_by_series(data, _num_partitions(data, chunksize, n_workers))]
+    else:
+        from dask import delayed
+        futures = client.compute([delayed(_extract_partition)(partition, *extract_args) for partition in data.to_delayed()])
+
+    logger.info(f"Extracting features of {len(futures)} partitions on the Dask cluster {client.scheduler.address}")
+
+    return _combine(client.gather(futures))
@@ -0,0 +1,381 @@
+import logging
+import numpy as np
+import pandas as pd
+
+#Feature calculators of tsfresh's MinimalFCParameters, in the same order tsfresh emits them
+MINIMAL_FEATURES = ['sum_values', 'median', 'mean', 'length', 'standard_deviation',
+                    'variance', 'root_mean_square', 'maximum', 'absolute_maximum', 'minimum']
+
+#Number of kinds converted to float64 and reduced at once by the native engine
+KIND_BLOCK_SIZE = 4
+
+logger = logging.getLogger(__name__)
+
+
+def minimal_fc_parameters():
+    """Returns the minimal feature set in the same format as tsfresh's `MinimalFCParameters`."""
+    return {feature: None for feature in MINIMAL_FEATURES}
+
+
+def supports_fc_parameters(kind_to_fc_parameters):
+    """
+    Checks whether the native engine can compute the given per-kind feature parameters.
+
+    Args:
+        kind_to_fc_parameters (dict): Mapping of kind -> {feature name: parameters}, as produced by
+            `tsfresh.feature_extraction.settings.from_columns`.
+
+    Returns:
+        bool: True if every requested feature is a parameterless minimal feature.
+    """
+    if not kind_to_fc_parameters:
+        return False
+
+    for fc_parameters in kind_to_fc_parameters.values():
+        for feature, params in fc_parameters.items():
+            if feature not in MINIMAL_FEATURES or params is not None:
+                return False
+    return True
+
+
+def fc_parameters_from_columns(columns):
+    """
+    Recovers the per-kind feature parameters from extracted feature names.
+
+    Equivalent to `tsfresh.feature_extraction.settings.from_columns`, which is only imported when a
+    feature name carries parameters the minimal feature set doesn't have.
+
+    Args:
+        columns (list): Feature names in the '<kind>__<feature>' format.
+
+    Returns:
+        dict: Mapping of kind -> {feature name: parameters}.
+    """
+    kind_to_fc_parameters = {}
+
+    for column in columns:
+        parts = str(column).split('__')
+        if len(parts) != 2 or parts[1] not in MINIMAL_FEATURES:
+            from tsfresh.feature_extraction import settings
+            return settings.from_columns(columns)
+        kind_to_fc_parameters.setdefault(parts[0], {})[parts[1]] = None
+
+    return kind_to_fc_parameters
+
+
+def _group_bounds(codes):
+    """Returns the start offset and the length of each run of equal codes in a sorted code array."""
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    counts = np.diff(np.r_[starts, len(codes)])
+    return starts, counts
+
+
+def encode_series_keys(data, key_columns):
+    """
+    Codes the series key of every row, e.g. its (job_id, component_id) pair, as one integer.
+
+    Codes follow the sorted order of the keys, and the returned lookup table maps every code back to the
+    original, correctly typed key values, so ids never round-trip through strings.
+
+    Args:
+        data (pd.DataFrame): Input frame with the key columns.
+        key_columns (list): Columns forming the series key.
+
+    Returns:
+        tuple: Array of int64 codes, one per row, and a pd.MultiIndex lookup table with one entry per code.
+    """
+    level_codes, levels = [], []
+    for column in key_columns:
+        codes, uniques = pd.factorize(data[column], sort=True)
+        level_codes.append(codes)
+        levels.append(pd.Index(uniques))
+
+    #Mixed-radix combination of the per-column codes preserves the lexicographic order of the keys
+    combined = np.zeros(len(data), dtype=np.int64)
+    for codes, level in zip(level_codes, levels):
+        combined = combined * len(level) + codes
+    series_codes, unique_combined = pd.factorize(combined, sort=True)
+
+    lookup_codes = []
+    for level in reversed(levels):
+        lookup_codes.append(unique_combined % len(level))
+        unique_combined = unique_combined // len(level)
+    lookup = pd.MultiIndex(levels=levels, codes=lookup_codes[::-1], names=list(key_columns))
+
+    return series_codes.astype(np.int64), lookup
+
+
+def compute_minimal_features(values, codes, features=None):
+    """
+    Computes the minimal feature set for every (group, column) pair with grouped NumPy reductions.
+
+    Args:
+        values (np.ndarray): 2D float array of shape (n_rows, n_kinds), sorted by `codes`.
+        codes (np.ndarray): 1D sorted integer array assigning each row to a group.
+        features (list): Features to compute. Defaults to all of `MINIMAL_FEATURES`.
+
+    Returns:
+        dict: Mapping of feature name -> 2D array of shape (n_groups, n_kinds).
+    """
+    features = MINIMAL_FEATURES if features is None else features
+    starts, counts = _group_bounds(codes)
+    n = counts[:, None].astype(np.float64)
+
+    result = {}
+    sums = np.add.reduceat(values, starts, axis=0)
+    means = sums / n
+
+    if 'sum_values' in features:
+        result['sum_values'] = sums
+    if 'mean' in features:
+        result['mean'] = means
+    if 'length' in features:
+        result['length'] = np.repeat(n, values.shape[1], axis=1)
+    if 'standard_deviation' in features or 'variance' in features:
+        #Two-pass variance, the same as np.var, to avoid cancellation on large counters
+        deviations = values - np.repeat(means, counts, axis=0)
+        variance = np.add.reduceat(deviations * deviations, starts, axis=0) / n
+        result['variance'] = variance
+        result['standard_deviation'] = np.sqrt(variance)
+    if 'root_mean_square' in features:
+        result['root_mean_square'] = np.sqrt(np.add.reduceat(values * values, starts, axis=0) / n)
+    if 'maximum' in features or 'absolute_maximum' in features or 'minimum' in features:
+        maximum = np.maximum.reduceat(values, starts, axis=0)
+        minimum = np.minimum.reduceat(values, starts, axis=0)
+        result['maximum'] = maximum
+        result['minimum'] = minimum
+        result['absolute_maximum'] = np.maximum(np.abs(maximum), np.abs(minimum))
+    if 'median' in features:
+        result['median'] = pd.DataFrame(values).groupby(codes, sort=True).median().to_numpy()
+
+    return {feature: result[feature] for feature in features}
+
+
+def extract_minimal_features(data, column_id, column_sort=None, kind_to_fc_parameters=None):
+    """
+    Drop-in replacement for `tsfresh.extract_features` restricted to the minimal feature set.
+
+    The input is the wide frame handed to tsfresh: one id column, an optional sort column and one
+    column per kind. The output has the same column names, column order and sorted id index as
+    tsfresh produces, so saved deployment metadata and scalers stay valid.
+
+    Args:
+        data (pd.DataFrame): Wide input frame.
+        column_id (str): Name of column representing the ID of the time series.
+        column_sort (str): Name of column representing the time of each observation.
+        kind_to_fc_parameters (dict): Optional per-kind features. Defaults to all minimal features for every kind.
+
+    Raises:
+        ValueError: If `kind_to_fc_parameters` requests a feature outside the minimal set.
+
+    Returns:
+        pd.DataFrame: Extracted features, one row per id.
+    """
+    if kind_to_fc_parameters is not None and not supports_fc_parameters(kind_to_fc_parameters):
+        raise ValueError(f"Native engine only supports the features {MINIMAL_FEATURES}")
+
+    kinds = [col for col in data.columns if col not in (column_id, column_sort)]
+    if kind_to_fc_parameters is not None:
+        kinds = [col for col in kinds if col in kind_to_fc_parameters]
+
+    codes, uniques = pd.factorize(data[column_id], sort=True)
+    #Telemetry is usually stored sorted by job and component already, then no reordering copy is needed
+    order = None if np.all(codes[1:] >= codes[:-1]) else np.argsort(codes, kind='stable')
+    if order is not None:
+        codes = codes[order]
+
+    if kind_to_fc_parameters is None:
+        features = MINIMAL_FEATURES
+    else:
+        features = [feature for feature in MINIMAL_FEATURES
+                    if any(feature in kind_to_fc_parameters[kind] for kind in kinds)]
+
+    #Kinds are converted to float64 a block at a time, so float32 telemetry is never copied to float64 as a whole
+    blocks = []
+    for begin in range(0, len(kinds), KIND_BLOCK_SIZE):
+        block_kinds = kinds[begin:begin + KIND_BLOCK_SIZE]
+        values = np.empty((len(data), len(block_kinds)), dtype=np.float64, order='F')
+        for kind_idx, kind in enumerate(block_kinds):
+            column = data[kind].to_numpy()
+            values[:, kind_idx] = column if order is None else column[order]
+        blocks.append(compute_minimal_features(values, codes, features))
+        del values
+
+    computed = {feature: np.hstack([block[feature] for block in blocks]) for feature in features}
+
+    columns = {}
+    for kind_idx, kind in enumerate(kinds):
+        kind_features = MINIMAL_FEATURES if kind_to_fc_parameters is None else kind_to_fc_parameters[kind]
+        for feature in kind_features:
+            columns[f"{kind}__{feature}"] = computed[feature][:, kind_idx]
+
+    logger.info(f"Native engine extracted {len(columns)} features for {len(uniques)} ids")
+
+    return pd.DataFrame(columns, index=pd.Index(np.asarray(uniques)), dtype=float)
+
+
+def _sliding_extreme(values, begins, window_length, ufunc):
+    """
+    Sliding-window maximum or minimum evaluated at the given window starts.
+
+    Uses the van Herk/Gil-Werman block decomposition, the vectorized counterpart of a monotonic
+    deque: every window of `window_length` rows spans at most two aligned blocks, so its extreme is
+    the combination of a suffix extreme of the first block and a prefix extreme of the second.
+
+    Args:
+        values (np.ndarray): 2D float array of shape (n_rows, n_kinds).
+        begins (np.ndarray): Row offsets where the windows start.
+        window_length (int): Number of rows in each window.
+        ufunc (np.ufunc): `np.maximum` or `np.minimum`.
+
+    Returns:
+        np.ndarray: 2D array of shape (len(begins), n_kinds).
+    """
+    fill = -np.inf if ufunc is np.maximum else np.inf
+    n_rows, n_kinds = values.shape
+    pad = (-n_rows) % window_length
+
+    blocks = np.concatenate([values, np.full((pad, n_kinds), fill)]).reshape(-1, window_length, n_kinds)
+    prefix = ufunc.accumulate(blocks, axis=1).reshape(-1, n_kinds)
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_kinds)
+
+    return ufunc(suffix[begins], prefix[begins + window_length - 1])
+
+
+def _sliding_median(values, begins, window_length, max_elements=2**22):
+    """Median of each window, gathered in batches so that at most `max_elements` values are copied at once."""
+    batch_size = max(1, max_elements // (window_length * values.shape[1]))
+    offsets = np.arange(window_length)
+
+    medians = []
+    for batch_start in range(0, len(begins), batch_size):
+        rows = begins[batch_start:batch_start + batch_size, None] + offsets
+        medians.append(np.median(values[rows], axis=1))
+
+    return np.concatenate(medians) if medians else np.empty((0, values.shape[1]))
+
+
+def compute_minimal_window_features(values, begins, series, series_starts, series_counts, window_length, features=None):
+    """
+    Computes the minimal feature set for fixed-length windows straight from the sorted series.
+
+    Sums and sums of squares come from running sums over values centred on their series mean, and
+    minima/maxima from a sliding extreme, so the rolled windows are never materialized.
+
+    Args:
+        values (np.ndarray): 2D float array of shape (n_rows, n_kinds), sorted by series and time.
+        begins (np.ndarray): Row offset of the first row of each window.
+        series (np.ndarray): Index of the series each window belongs to.
+        series_starts (np.ndarray): Row offset of the first row of each series.
+        series_counts (np.ndarray): Number of rows of each series.
+        window_length (int): Number of rows in each window.
+        features (list): Features to compute. Defaults to all of `MINIMAL_FEATURES`.
+
+    Returns:
+        dict: Mapping of feature name -> 2D array of shape (n_windows, n_kinds).
+    """
+    features = MINIMAL_FEATURES if features is None else features
+    ends = begins + window_length
+    m = float(window_length)
+
+    series_means = np.add.reduceat(values, series_starts, axis=0) / series_counts[:, None]
+    centred = values - np.repeat(series_means, series_counts, axis=0)
+
+    zeros = np.zeros((1, values.shape[1]))
+    running_sum = np.concatenate([zeros, np.cumsum(centred, axis=0)])
+    running_sum_sq = np.concatenate([zeros, np.cumsum(centred * centred, axis=0)])
+
+    centred_mean = (running_sum[ends] - running_sum[begins]) / m
+    means = centred_mean + series_means[series]
+    variance = np.maximum((running_sum_sq[ends] - running_sum_sq[begins]) / m - centred_mean * centred_mean, 0)
+
+    maximum = _sliding_extreme(values, begins, window_length, np.maximum)
+    minimum = _sliding_extreme(values, begins, window_length, np.minimum)
+    #Constant windows have exactly zero variance, which running sums only approximate
+    variance[maximum == minimum] = 0
+
+    result = {
+        'sum_values': means * m,
+        'mean': means,
+        'length': np.full(means.shape, m),
+        'variance': variance,
+        'standard_deviation': np.sqrt(variance),
+        'root_mean_square': np.sqrt(variance + means * means),
+        'maximum': maximum,
+        'minimum': minimum,
+        'absolute_maximum': np.maximum(np.abs(maximum), np.abs(minimum)),
+    }
+    if 'median' in features:
+        result['median'] = _sliding_median(values, begins, window_length)
+
+    return {feature: result[feature] for feature in features}
+
+
+def extract_minimal_window_features(data, column_id, column_sort, window_size, skip_interval, kind_to_fc_parameters=None):
+    """
+    Computes the minimal feature set for rolling windows without materializing the rolled frame.
+
+    Windows follow the semantics of tsfresh `roll_time_series` with `max_timeshift=min_timeshift=window_size`
+    and `rolling_direction=skip_interval`: each window holds `window_size + 1` consecutive rows of a series,
+    consecutive windows are `skip_interval` rows apart, window ends are aligned with the end of the longest
+    series, and every window is identified by the sort value of its last row.
+
+    Args:
+        data (pd.DataFrame): Wide input frame.
+        column_id (str or list): Column(s) identifying a time series, e.g. ['job_id', 'component_id'].
+        column_sort (str): Name of column representing the time of each observation.
+        window_size (int): Window size, as `max_timeshift` of `roll_time_series`.
+        skip_interval (int): Number of rows between the ends of consecutive windows.
+        kind_to_fc_parameters (dict): Optional per-kind features. Defaults to all minimal features for every kind.
+
+    Raises:
+        ValueError: If `kind_to_fc_parameters` requests a feature outside the minimal set.
+
+    Returns:
+        pd.DataFrame: Extracted features, indexed by the id column(s) and the window's `column_sort` value.
+    """
+    if kind_to_fc_parameters is not None and not supports_fc_parameters(kind_to_fc_parameters):
+        raise ValueError(f"Native engine only supports the features {MINIMAL_FEATURES}")
+
+    id_columns = list(column_id) if isinstance(column_id, (list, tuple)) else [column_id]
+    kinds = [col for col in data.columns if col not in id_columns and col != column_sort]
+    if kind_to_fc_parameters is not None:
+        kinds = [col for col in kinds if col in kind_to_fc_parameters]
+
+    data = data.sort_values(id_columns + [column_sort], kind='mergesort')
+    codes = data.groupby(id_columns, sort=True).ngroup().to_numpy()
+    series_starts, series_counts = _group_bounds(codes)
+
+    #Window ends (exclusive) are counted back from the longest series, as roll_time_series does
+    window_length = window_size + 1
+    longest = series_counts.max()
+    first_end = window_length + (longest - window_length) % skip_interval
+    n_windows = np.maximum((series_counts - first_end) // skip_interval + 1, 0)
+
+    series = np.repeat(np.arange(len(series_starts)), n_windows)
+    window_rank = np.arange(n_windows.sum()) - np.repeat(np.cumsum(n_windows) - n_windows, n_windows)
+    begins = series_starts[series] + first_end - window_length + window_rank * skip_interval
+
+    if kind_to_fc_parameters is None:
+        features = MINIMAL_FEATURES
+    else:
+        features = [feature for feature in MINIMAL_FEATURES
+                    if any(feature in kind_to_fc_parameters[kind] for kind in kinds)]
+
+    values = data[kinds].to_numpy(dtype=np.float64)
+    computed = compute_minimal_window_features(values, begins, series, series_starts, series_counts,
+                                               window_length, features)
+
+    columns = {}
+    for kind_idx, kind in enumerate(kinds):
+        kind_features = MINIMAL_FEATURES if kind_to_fc_parameters is None else kind_to_fc_parameters[kind]
+        for feature in kind_features:
+            columns[f"{kind}__{feature}"] = computed[feature][:, kind_idx]
+
+    last_rows = begins + window_length - 1
+    index_frame = data[id_columns].iloc[last_rows].reset_index(drop=True)
+    index_frame[column_sort] = data[column_sort].to_numpy()[last_rows]
+
+    logger.info(f"Native engine extracted {len(columns)} features for {len(begins)} windows")
+
+    return pd.DataFrame(columns, index=pd.MultiIndex.from_frame(index_frame), dtype=float)
@@ -0,0 +1,130 @@
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def variance_mask(values, threshold=0.0):
+    """
+    Flags the features whose variance exceeds a threshold.
+
+    Variances are computed on the features min-max normalized to [0, 1], the range the VAE sees them in,
+    so one threshold fits metrics of any unit. Constant features always fail.
+
+    Args:
+        values (np.ndarray): Feature matrix of shape (n_samples, n_features).
+        threshold (float): Minimum normalized variance (default is 0.0, only constant features are dropped).
+
+    Returns:
+        np.ndarray: Boolean mask of the retained features.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    value_range = values.max(axis=0) - values.min(axis=0)
+    normalized_variance = np.divide(values.var(axis=0), value_range ** 2, out=np.zeros(values.shape[1]), where=value_range > 0)
+
+    return (value_range > 0) & (normalized_variance > threshold)
+
+
+def correlation_mask(values, threshold=0.99):
+    """
+    Flags the features that aren't near-duplicates of an earlier feature.
+
+    Features are visited in order, and every feature whose absolute Pearson correlation with a retained
+    earlier feature reaches the threshold is dropped, e.g. vmstat's nr_free_pages next to meminfo's MemFree.
+    Correlations are computed one retained feature at a time, so the n_features x n_features matrix is never built.
+
+    Args:
+        values (np.ndarray): Feature matrix of shape (n_samples, n_features) without constant features.
+        threshold (float): Absolute correlation at which a feature counts as a duplicate (default is 0.99).
+
+    Returns:
+        np.ndarray: Boolean mask of the retained features.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_features = values.shape[1]
+
+    std = values.std(axis=0)
+    standardized = np.divide(values - values.mean(axis=0), std, out=np.zeros_like(values), where=std > 0)
+
+    keep = np.ones(n_features, dtype=bool)
+    for feature_idx in range(n_features):
+        if not keep[feature_idx]:
+            continue
+        candidates = feature_idx + 1 + np.flatnonzero(keep[feature_idx + 1:])
+        if len(candidates) == 0:
+            break
+        correlations = standardized[:, feature_idx] @ standardized[:, candidates] / len(values)
+        keep[candidates[np.abs(correlations) >= threshold]] = False
+
+    return keep
+
+
+def select_features(data_fe, variance_threshold=0.0, correlation_threshold=None, pre_selected=None):
+    """
+    Chooses the features a model is trained on.
+
+    Args:
+        data_fe (pd.DataFrame): Extracted training features.
+        variance_threshold (float): Minimum normalized variance, see `variance_mask` (default is 0.0). None
+            disables the variance filter.
+        correlation_threshold (float): Absolute correlation above which near-duplicate features are dropped,
+            see `correlation_mask` (default is None, disabled).
+        pre_selected (list): Feature names to restrict the selection to, e.g. loaded with `load_feature_list`
+            (default is None, every feature is a candidate).
+
+    Returns:
+        list: Retained feature names, in the column order of data_fe.
+        dict: Number of features before selection and dropped by each stage.
+    """
+    columns = list(data_fe.columns)
+    stats = {'num_features': len(columns)}
+
+    if pre_selected is not None:
+        pre_selected = set(pre_selected)
+        columns = [column for column in columns if column in pre_selected]
+        stats['dropped_not_pre_selected'] = stats['num_features'] - len(columns)
+
+    values = data_fe[columns].to_numpy(dtype=np.float64)
+
+    if variance_threshold is not None:
+        keep = variance_mask(values, variance_threshold)
+        stats['dropped_low_variance'] = int((~keep).sum())
+        columns, values = [column for column, kept in zip(columns, keep) if kept], values[:, keep]
+
+    if correlation_threshold is not None and len(columns) > 1:
+        keep = correlation_mask(values, correlation_threshold)
+        stats['dropped_correlated'] = int((~keep).sum())
+        columns = [column for column, kept in zip(columns, keep) if kept]
+
+    stats['num_selected'] = len(columns)
+    logger.info(f"Feature selection retained {len(columns)} of {stats['num_features']} features: {stats}")
+
+    return columns, stats
+
+
+def load_feature_list(path):
+    """
+    Loads a persisted feature selection.
+
+    Args:
+        path (str): JSON file with a list of feature names, or with a mapping of kind -> features
+            like the fe_column_names of the deployment metadata.
+
+    Returns:
+        list: Feature names in the '<kind>__<feature>' format.
+    """
+    with open(path, "r") as fp:
+        features = json.load(fp)
+
+    if isinstance(features, dict):
+        return [f"{kind}__{feature}" for kind, kind_features in features.items() for feature in kind_features]
+
+    return list(features)
+
+
+def save_feature_list(features, path):
+    """Persists a feature selection as a JSON list, to reuse it with `load_feature_list`."""
+
+    with open(path, "w") as fp:
+        json.dump(list(features), fp)
@@ -0,0 +1,148 @@
+import logging
+import hashlib
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+#Bump when the stored layout or the extraction semantics change, to invalidate old entries
+FEATURE_STORE_VERSION = 2
+
+
+class FeatureStore():
+    """
+    Content-addressed on-disk cache of extracted feature matrices.
+
+    Entries are keyed by a fingerprint of the raw input frame and of everything that affects extraction
+    (feature parameters, window settings, engine and library versions). Feature matrices are stored in
+    the Arrow IPC (Feather) format, and the least recently used entries are evicted once the store grows
+    beyond `max_bytes`.
+    """
+
+    def __init__(self, cache_dir, max_bytes=10 * 1024**3):
+        """Initializes a `FeatureStore` object.
+
+        Args:
+            cache_dir (str): Directory holding the cached feature matrices. Created if it does not exist.
+            max_bytes (int): Maximum total size of the cached files, in bytes (default is 10 GiB).
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.logger = logging.getLogger(__name__)
+
+    def fingerprint(self, data, **params):
+        """
+        Computes the cache key of an extraction.
+
+        Args:
+            data (pd.DataFrame): Raw input frame handed to feature extraction.
+            **params: Extraction settings, e.g. fe_config, kind_to_fc_parameters, window_size, fe_engine.
+
+        Returns:
+            str: Hex digest identifying the extraction result.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(list(map(str, data.columns))).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+
+        settings = dict(params, pandas_version=pd.__version__, store_version=FEATURE_STORE_VERSION)
+        #Native extraction doesn't depend on tsfresh, so it doesn't pay for importing it
+        if params.get('fe_engine') != 'native':
+            import tsfresh
+            settings['tsfresh_version'] = tsfresh.__version__
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        return self.cache_dir / f"{key}.feather", self.cache_dir / f"{key}.json"
+
+    def get(self, key):
+        """
+        Looks up a cached feature matrix.
+
+        Args:
+            key (str): Cache key from `fingerprint`.
+
+        Returns:
+            pd.DataFrame: The cached features, or None on a miss.
+        """
+        data_path, meta_path = self._paths(key)
+
+        try:
+            with open(meta_path, "r") as fp:
+                metadata = json.load(fp)
+            data_fe = pd.read_feather(data_path)
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+
+        #Refresh the modification time, which orders the entries for eviction
+        os.utime(data_path)
+        self.hits += 1
+        self.logger.info(f"Feature store hit: {key}")
+
+        return data_fe.set_index(metadata['index_names'])
+
+    def put(self, key, data_fe):
+        """
+        Stores a feature matrix and evicts old entries if the store is over its size limit.
+
+        Args:
+            key (str): Cache key from `fingerprint`.
+            data_fe (pd.DataFrame): Extracted features, indexed by the series ids.
+        """
+        data_path, meta_path = self._paths(key)
+        index_names = [name if name is not None else 'index' for name in data_fe.index.names]
+
+        #Write to temporary files first, so concurrent readers never see a partial entry
+        tmp_suffix = f".{os.getpid()}.tmp"
+        data_fe.rename_axis(index_names).reset_index().to_feather(str(data_path) + tmp_suffix)
+        with open(str(meta_path) + tmp_suffix, "w") as fp:
+            json.dump({'index_names': index_names, 'shape': list(data_fe.shape)}, fp)
+        os.replace(str(data_path) + tmp_suffix, data_path)
+        os.replace(str(meta_path) + tmp_suffix, meta_path)
+
+        self.logger.info(f"Feature store saved: {key}")
+        self._evict()
+
+    def _evict(self):
+        """Removes the least recently used entries until the store fits into `max_bytes`."""
+        entries = [(path.stat().st_mtime, path.stat().st_size, path) for path in self.cache_dir.glob("*.feather")]
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            for curr_path in (path, path.with_suffix(".json")):
+                try:
+                    os.remove(curr_path)
+                except FileNotFoundError:
+                    pass
+            total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Reports the cache statistics of this store.
+
+        Returns:
+            dict: Hits, misses, hit rate, evictions, number of entries and total size in bytes.
+        """
+        sizes = [path.stat().st_size for path in self.cache_dir.glob("*.feather")]
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else np.nan,
+            'evictions': self.evictions,
+            'entries': len(sizes),
+            'size_bytes': int(sum(sizes)),
+        }
@@ -0,0 +1,74 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+#Stacks that must only be imported on the code path that needs them
+HEAVY_MODULES = ['tensorflow', 'tsfresh', 'sklearn', 'matplotlib', 'seaborn']
+
+#Entry point -> (module, import-time budget in seconds)
+ENTRY_POINTS = {
+    'AnomalyDetector': ('anomaly_detector', 1.5),
+    'AI4HPCPredict': ('ai4hpc_predict', 1.5),
+    'PredictionService': ('prediction_service', 1.5),
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{'seconds': elapsed, 'heavy_modules': heavy}}))
+"""
+
+
+def measure_import(module, repeats=3):
+    """
+    Measures the cold import time of a module in fresh interpreters.
+
+    Args:
+        module (str): Module to import, relative to the src directory.
+        repeats (int): Number of fresh interpreters to measure in, the fastest run is reported (default is 3).
+
+    Returns:
+        dict: Import time in seconds and the heavy modules the import pulled in.
+    """
+    runs = []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                   cwd=str(Path(__file__).resolve().parent),
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{completed.stderr}")
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    return min(runs, key=lambda run: run['seconds'])
+
+
+def main(entry_points, repeats, budget_scale):
+
+    report = {}
+    for entry_point in entry_points:
+        module, budget = ENTRY_POINTS[entry_point]
+        result = measure_import(module, repeats)
+        result['budget_seconds'] = budget * budget_scale
+        result['ok'] = result['seconds'] <= result['budget_seconds'] and not result['heavy_modules']
+        report[entry_point] = result
+
+    print(json.dumps(report, indent=2))
+
+    return 0 if all(result['ok'] for result in report.values()) else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Checks the cold import time of the prediction entry points against their budgets")
+    parser.add_argument('entry_points', nargs='*', default=list(ENTRY_POINTS), help=f"Entry points to check, out of {list(ENTRY_POINTS)}")
+    parser.add_argument('--repeats', type=int, default=3, help="Fresh interpreters per entry point, the fastest is reported")
+    parser.add_argument('--budget-scale', type=float, default=1.0, help="Multiplies every budget, e.g. for slower machines")
+    args = parser.parse_args()
+    unknown = [entry_point for entry_point in args.entry_points if entry_point not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"Unknown entry points {unknown}. Allowed values: {list(ENTRY_POINTS)}")
+    sys.exit(main(args.entry_points, args.repeats, args.budget_scale))
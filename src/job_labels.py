@@ -0,0 +1,256 @@
+import argparse
+import heapq
+import logging
+import os
+import sys
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+#Module-level, as the index is pickled into the build workers' tasks and loggers can't be pickled before Python 3.7
+logger = logging.getLogger(__name__)
+
+#Columns the node files can be queried by
+HDF_DATA_COLUMNS = ['job_id', 'component_id', 'timestamp']
+
+
+def parse_job_nodes(job_node):
+    """
+    Parses the node list of a job, e.g. "['cn4010']" or "['cn4010', 'cn4011']", into node names.
+
+    Args:
+        job_node (str): Node list as stored in the job_node column of the job table.
+
+    Returns:
+        list: Node names of the job.
+    """
+    return [node.strip(" '\"") for node in str(job_node).strip("[]").split(',') if node.strip(" '\"")]
+
+
+def to_epoch_seconds(values):
+    """Returns datetimes or epoch timestamps as float epoch seconds, naive datetimes are taken as UTC."""
+
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    if is_datetime64_any_dtype(values.dtype):
+        if values.dt.tz is not None:
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+        return values.to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+
+    return values.to_numpy(dtype=np.float64)
+
+
+def read_job_table(label_file):
+    """
+    Reads the job table, e.g. label_job_2500.csv, once for all nodes.
+
+    Args:
+        label_file (str): CSV file with job_node, job_start and job_end columns. A job's id is its row number.
+
+    Returns:
+        pd.DataFrame: One row per job with job_id, job_start and job_end (epoch seconds) and job_nodes (list).
+    """
+    label_df = pd.read_csv(label_file)
+
+    return pd.DataFrame({
+        'job_id': label_df.index.to_numpy(),
+        'job_start': to_epoch_seconds(pd.to_datetime(label_df['job_start'])),
+        'job_end': to_epoch_seconds(pd.to_datetime(label_df['job_end'])),
+        'job_nodes': label_df['job_node'].map(parse_job_nodes),
+    })
+
+
+class JobIntervalIndex():
+    """
+    Per-node interval index of job start and end times.
+
+    Every node's jobs are swept once into disjoint segments, each labeled with the job running on the node
+    during the segment. Timestamps are then labeled with one sorted search over the segment starts. Start and
+    end times are inclusive. Where jobs on a node overlap, the job listed last in the job table wins, as it did
+    when every job overwrote the labels of the previous ones.
+    """
+
+    def __init__(self, job_table):
+        """Initializes a `JobIntervalIndex` object.
+
+        Args:
+            job_table (pd.DataFrame): Output of `read_job_table`.
+        """
+        #A multi-node job is indexed on each of its nodes, the position in the job table decides between overlapping jobs
+        jobs = job_table.reset_index(drop=True).reset_index().explode('job_nodes').dropna(subset=['job_nodes'])
+        self.segments = {node: self._sweep(node_jobs) for node, node_jobs in jobs.groupby('job_nodes', sort=False)}
+        logger.info(f"Indexed {len(job_table)} jobs on {len(self.segments)} nodes")
+
+    @classmethod
+    def from_file(cls, label_file):
+        return cls(read_job_table(label_file))
+
+    @property
+    def nodes(self):
+        return list(self.segments)
+
+    @staticmethod
+    def _sweep(node_jobs):
+        """Returns the segment starts of a node and the job id of every segment, -1 where no job runs."""
+
+        priorities = node_jobs['index'].to_numpy()
+        starts = node_jobs['job_start'].to_numpy()
+        #Segments are half-open, the first instant after an inclusive end starts the next segment
+        stops = np.nextafter(node_jobs['job_end'].to_numpy(), np.inf)
+        job_ids = node_jobs['job_id'].to_numpy()
+
+        order = np.argsort(starts, kind='stable')
+        points = np.unique(np.r_[starts, stops])
+        segment_jobs = np.full(len(points), -1, dtype=np.int64)
+
+        #Max-heap of the running jobs by table position; finished jobs are dropped once they surface
+        running = []
+        next_job = 0
+        for point_idx, point in enumerate(points):
+            while next_job < len(order) and starts[order[next_job]] <= point:
+                job_idx = order[next_job]
+                heapq.heappush(running, (-priorities[job_idx], stops[job_idx], job_idx))
+                next_job += 1
+            while running and running[0][1] <= point:
+                heapq.heappop(running)
+            if running:
+                segment_jobs[point_idx] = job_ids[running[0][2]]
+
+        return points, segment_jobs
+
+    def assign(self, node_name, timestamps, default=-1):
+        """
+        Labels the timestamps of a node with the job running on it.
+
+        Args:
+            node_name (str): Node name, e.g. 'cn4010'.
+            timestamps (array-like): Epoch seconds or datetimes.
+            default (int): Job id of timestamps without a job (default is -1).
+
+        Returns:
+            np.ndarray: Job id of every timestamp.
+        """
+        seconds = to_epoch_seconds(timestamps)
+        if node_name not in self.segments:
+            return np.full(len(seconds), default, dtype=np.int64)
+
+        points, segment_jobs = self.segments[node_name]
+        segment_idx = np.searchsorted(points, seconds, side='right') - 1
+        labels = np.where(segment_idx >= 0, segment_jobs[np.maximum(segment_idx, 0)], -1)
+
+        return np.where(labels >= 0, labels, default)
+
+
+def node_name_from_path(node_file):
+    """Returns the node name of a telemetry file, e.g. 'cn4010' for .../cn4010_<hash>/final_metric.csv."""
+    return os.path.basename(os.path.dirname(os.path.abspath(node_file))).split('_')[0]
+
+
+def read_metric_csv(node_file, block_size=1 << 24, use_threads=True):
+    """
+    Reads a node's metric CSV with Arrow's block-wise, multithreaded parser, or with pandas without pyarrow.
+
+    Args:
+        node_file (str): CSV file with the node's metrics.
+        block_size (int): Bytes parsed per block (default is 16 MiB).
+        use_threads (bool): If True, blocks are parsed in parallel (default is True).
+
+    Returns:
+        pd.DataFrame: The node's metrics.
+    """
+    try:
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        return pd.read_csv(node_file)
+
+    read_options = pa_csv.ReadOptions(block_size=block_size, use_threads=use_threads)
+
+    return pa_csv.read_csv(node_file, read_options=read_options).to_pandas()
+
+
+def label_node_file(node_file, interval_index, target_dir, split_point=25920, train_start=1681660800,
+                    test_start=1682049600, sampling_interval=15, node_name=None, block_size=1 << 24, use_threads=True):
+    """
+    Splits a node's telemetry into train and test data, labels the training samples with their jobs and writes
+    both as HDF files in the training data format.
+
+    Training samples get the id of the job running on the node, or -1. Every test sample is its own job, as the
+    test data is scored sample by sample.
+
+    Args:
+        node_file (str): CSV file with the node's metrics, one row per sample.
+        interval_index (JobIntervalIndex): Index of the job table, None labels every training sample with -1.
+        target_dir (str): Directory the '<node>/<node>_train.hdf' and '<node>/<node>_test.hdf' files are written to.
+        split_point (int): Number of training samples (default is 25920).
+        train_start (int): Epoch timestamp of the first training sample (default is 1681660800).
+        test_start (int): Epoch timestamp of the first test sample (default is 1682049600).
+        sampling_interval (int): Seconds between samples (default is 15).
+        node_name (str): Node name (default is None, parsed from the path).
+        block_size (int): Bytes the CSV parser reads per block (default is 16 MiB).
+        use_threads (bool): If True, CSV blocks are parsed in parallel (default is True).
+
+    Returns:
+        str: Directory the node's files are written to.
+    """
+    node_name = node_name or node_name_from_path(node_file)
+    component_id = int(node_name[2:])
+
+    df = read_metric_csv(node_file, block_size=block_size, use_threads=use_threads)
+    df.insert(0, 'uid', 0)
+    df.insert(1, 'job_id', -1)
+    df.insert(2, 'component_id', component_id)
+
+    train_df = df.iloc[:split_point].copy()
+    test_df = df.iloc[split_point:].copy()
+    del df
+
+    train_df['timestamp'] = train_start + sampling_interval * np.arange(len(train_df))
+    test_df['timestamp'] = test_start + sampling_interval * np.arange(len(test_df))
+
+    train_df['uid'] = np.arange(len(train_df))
+    if interval_index is not None:
+        train_df['job_id'] = interval_index.assign(node_name, train_df['timestamp'])
+    test_df['uid'] = np.arange(len(test_df))
+    test_df['job_id'] = test_df['uid']
+
+    node_dir = os.path.join(target_dir, node_name)
+    os.makedirs(node_dir, exist_ok=True)
+
+    #Write to temporary files first, so an interrupted build never leaves a partial node behind
+    for split_df, split in [(train_df, 'train'), (test_df, 'test')]:
+        hdf_file = os.path.join(node_dir, f'{node_name}_{split}.hdf')
+        tmp_hdf_file = f"{hdf_file}.{os.getpid()}.tmp"
+        #Tables with indexed key columns let `DataPipeline.iter_HPC_data` push its filters down and read in chunks
+        split_df.to_hdf(tmp_hdf_file, key=split, mode='w', format='table', data_columns=HDF_DATA_COLUMNS)
+        os.replace(tmp_hdf_file, hdf_file)
+
+    return node_dir
+
+
+def main(args):
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-7s %(message)s', stream=sys.stderr, level=logging.INFO)
+
+    #The job table is parsed and indexed once for all nodes
+    interval_index = JobIntervalIndex.from_file(args.label_file)
+
+    for node_file in args.node_files:
+        node_dir = label_node_file(node_file,
+                                   interval_index,
+                                   args.target_dir,
+                                   split_point=args.split_point,
+                                   train_start=args.train_start,
+                                   test_start=args.test_start,
+                                   sampling_interval=args.sampling_interval)
+        logger.info(f"Processed {node_name_from_path(node_file)} and saved to {node_dir}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Labels node telemetry with the jobs of a job table and writes the per-node train/test HDF files")
+    parser.add_argument('node_files', nargs='+', help="Node telemetry CSV files, in directories named '<node>_<hash>'")
+    parser.add_argument('--label-file', required=True, help="Job table with job_node, job_start and job_end columns")
+    parser.add_argument('--target-dir', required=True, help="Directory the per-node files are written to")
+    parser.add_argument('--split-point', type=int, default=25920, help="Number of training samples per node")
+    parser.add_argument('--train-start', type=int, default=1681660800, help="Epoch timestamp of the first training sample")
+    parser.add_argument('--test-start', type=int, default=1682049600, help="Epoch timestamp of the first test sample")
+    parser.add_argument('--sampling-interval', type=int, default=15, help="Seconds between samples")
+    main(parser.parse_args())
@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+def make_node_data(n_jobs=50, n_components=4, n_samples=600, n_metrics=100, seed=0):
+    """
+    Generates processed telemetry of one node in the training data format, with float64 metrics.
+
+    Args:
+        n_jobs (int): Number of jobs (default is 50).
+        n_components (int): Number of components per job (default is 4).
+        n_samples (int): Number of samples per job and component (default is 600).
+        n_metrics (int): Number of metric columns (default is 100).
+        seed (int): Random seed (default is 0).
+
+    Returns:
+        pd.DataFrame: Telemetry with job_id, component_id, timestamp and the metric columns.
+    """
+    rng = np.random.default_rng(seed)
+    n_series = n_jobs * n_components
+
+    data = pd.DataFrame({
+        'job_id': np.repeat(np.arange(n_jobs), n_components * n_samples),
+        'component_id': np.tile(np.repeat(np.arange(n_components), n_samples), n_jobs),
+        'timestamp': np.tile(np.arange(n_samples), n_series) + 1678928719,
+    })
+    metrics = rng.gamma(2.0, 1000.0, size=(n_series * n_samples, n_metrics))
+
+    return pd.concat([data, pd.DataFrame(metrics, columns=[f"metric_{i}::meminfo" for i in range(n_metrics)])], axis=1)
+
+
+def peak_rss_bytes():
+    #VmHWM belongs to the address space of this interpreter, ru_maxrss survives exec and may be the parent's peak
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    #ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_stages(input_path, compact_dtypes, fe_engine):
+    """Runs loading, feature extraction and scaling of one node in this process and reports the memory of every stage."""
+
+    from data_pipeline import DataPipeline
+
+    pipeline = DataPipeline(compact_dtypes=compact_dtypes, fe_engine=fe_engine)
+    report = {'baseline_peak_rss_bytes': peak_rss_bytes()}
+
+    data = pipeline.load_data(input_path)
+    report['load'] = {'frame_bytes': int(data.memory_usage(deep=True).sum()), 'peak_rss_bytes': peak_rss_bytes()}
+
+    data_fe = pipeline.tsfresh_generate_features(data, fe_config='minimal')
+    del data
+    report['features'] = {'frame_bytes': int(data_fe.memory_usage(deep=True).sum()), 'peak_rss_bytes': peak_rss_bytes()}
+
+    x_scaled, _ = pipeline.scale_data(data_fe)
+    report['scale'] = {'frame_bytes': int(x_scaled.memory_usage(deep=True).sum()), 'peak_rss_bytes': peak_rss_bytes(),
+                       'dtypes': sorted(set(map(str, x_scaled.dtypes)))}
+
+    return report
+
+
+def main(args):
+
+    tmp_dir = None
+    input_path = args.input
+    if input_path is None:
+        tmp_dir = tempfile.mkdtemp()
+        input_path = str(Path(tmp_dir) / f"node.{args.format}")
+        data = make_node_data(args.jobs, args.components, args.samples, args.metrics)
+        if args.format == 'hdf':
+            data.to_hdf(input_path, key='data', mode='w')
+        else:
+            from data_pipeline import DataPipeline
+            DataPipeline().write_columnar_data(data, input_path)
+        del data
+
+    #Every mode runs in a fresh interpreter, so the peak resident memory of one mode doesn't hide the other's
+    results = {}
+    for mode, compact in [('default', False), ('compact', True)]:
+        completed = subprocess.run([sys.executable, __file__, '--child', '--input', input_path, '--fe-engine', args.fe_engine]
+                                   + (['--compact'] if compact else []),
+                                   cwd=str(Path(__file__).resolve().parent),
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"The {mode} run failed:\n{completed.stderr}")
+        results[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    results['peak_rss_reduction'] = 1 - results['compact']['scale']['peak_rss_bytes'] / results['default']['scale']['peak_rss_bytes']
+    results['input'] = input_path
+
+    print(json.dumps(results, indent=2))
+
+    if tmp_dir is not None:
+        os.remove(input_path)
+        os.rmdir(tmp_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measures the per-node peak memory of the pipeline with and without compact dtypes")
+    parser.add_argument('--input', default=None, help="Node data file, defaults to generated telemetry")
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'feather', 'hdf'], help="Format of the generated telemetry")
+    parser.add_argument('--jobs', type=int, default=50)
+    parser.add_argument('--components', type=int, default=4)
+    parser.add_argument('--samples', type=int, default=600)
+    parser.add_argument('--metrics', type=int, default=100)
+    parser.add_argument('--fe-engine', default='native', choices=['tsfresh', 'native'])
+    parser.add_argument('--compact', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_stages(args.input, args.compact, args.fe_engine)))
+    else:
+        main(args)
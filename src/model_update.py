@@ -0,0 +1,193 @@
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+import joblib
+import pandas as pd
+
+from data_pipeline import DataPipeline
+from quantile_sketch import QuantileSketch
+from scaling import transform_to_float32
+
+
+def next_version_dir(model_dir, version):
+    """
+    Returns the directory of the next artifact version of a model, next to the model directory.
+
+    Versions are named '<model name>_v<version>', e.g. 'expConfig_0_repeatNum_0_v2'. The version number is
+    one above both the model's own version and every version already on disk.
+
+    Args:
+        model_dir (str): Directory of the model that is updated.
+        version (int): Version of that model, 0 for a model trained by `single_node.process_node`.
+
+    Returns:
+        tuple: The new version number and its directory.
+    """
+    model_dir = Path(model_dir)
+    base_name = re.sub(r"_v\d+$", "", model_dir.name)
+
+    existing = [int(match.group(1)) for match in (re.match(rf"{re.escape(base_name)}_v(\d+)$", path.name)
+                                                  for path in model_dir.parent.iterdir()) if match]
+    new_version = max(existing + [version]) + 1
+
+    return new_version, model_dir.parent / f"{base_name}_v{new_version}"
+
+
+def update_model(model_dir, new_data, output_dir=None, epochs=50, batch_size=32, learning_rate=1e-4, patience=5,
+                 validation_fraction=0.1, merge_sketch=False, pipeline_kwargs=None,
+                 model_name="model", scaler_filename="scaler.save", deployment_metadata_filename="deployment_metadata.json"):
+    """
+    Warm-starts a trained model on new healthy telemetry and writes the result as a new artifact version.
+
+    Only the new data is feature extracted. It is scaled with the existing scaler, so the model keeps its
+    input space, and the VAE is fine-tuned from the existing weights for at most `epochs` epochs, stopping
+    early once the loss plateaus. The thresholds are then recalibrated on the new data.
+
+    Args:
+        model_dir (str): Directory of the model to update, holding its weights, scaler and deployment metadata.
+        new_data (pd.DataFrame): New healthy telemetry, in the training data format.
+        output_dir (str): Directory of the new artifact set (default is None, the next '<model name>_v<N>'
+            directory next to model_dir).
+        epochs (int): Maximum number of fine-tuning epochs (default is 50).
+        batch_size (int): Fine-tuning batch size (default is 32).
+        learning_rate (float): Fine-tuning learning rate (default is 1e-4).
+        patience (int): Epochs without improvement before fine-tuning stops (default is 5).
+        validation_fraction (float): Fraction of the new samples held out for early stopping (default is 0.1).
+        merge_sketch (bool): If True, the thresholds are calibrated on the previous training errors as well as
+            on the new ones (default is False).
+        pipeline_kwargs (dict): Keyword arguments of the `DataPipeline`, e.g. fe_engine (default is None).
+        model_name (str): Name of the saved model files (default is 'model').
+        scaler_filename (str): File name of the scaler (default is 'scaler.save').
+        deployment_metadata_filename (str): File name of the deployment metadata (default is 'deployment_metadata.json').
+
+    Raises:
+        ValueError: If features of the model can't be extracted from the new data.
+
+    Returns:
+        Path: Directory of the new artifact set.
+    """
+    logger = logging.getLogger(__name__)
+    model_dir = Path(model_dir)
+    start_time = time.time()
+
+    with open(model_dir / deployment_metadata_filename, "r") as fp:
+        deployment_metadata = json.load(fp)
+    loaded_scaler = joblib.load(model_dir / scaler_filename)
+    raw_column_names = deployment_metadata['raw_column_names']
+
+    version = deployment_metadata.get('version', 0)
+    if output_dir is None:
+        new_version, output_dir = next_version_dir(model_dir, version)
+    else:
+        new_version, output_dir = version + 1, Path(output_dir)
+
+    #Only the new data is feature extracted, with the features the model was trained on
+    pipeline = DataPipeline(**(pipeline_kwargs or {}))
+    new_fe = pipeline.tsfresh_generate_features(new_data.copy(deep=True),
+                                                fe_config=None,
+                                                kind_to_fc_parameters=deployment_metadata['fe_column_names'])
+    missing_columns = [column for column in raw_column_names if column not in new_fe.columns]
+    if missing_columns:
+        raise ValueError(f"The new data doesn't provide the model features {missing_columns}")
+
+    new_scaled = pd.DataFrame(transform_to_float32(loaded_scaler, new_fe[raw_column_names]), columns=raw_column_names)
+    feature_extraction_time = time.time() - start_time
+
+    num_validation = int(len(new_scaled) * validation_fraction) if len(new_scaled) * validation_fraction >= 1 else 0
+    x_finetune = new_scaled.iloc[:len(new_scaled) - num_validation]
+    x_validation = new_scaled.iloc[len(new_scaled) - num_validation:] if num_validation else None
+
+    #TensorFlow is only imported once a model is trained
+    from vae import VAE
+
+    input_dim = len(raw_column_names)
+    vae = VAE(
+        name=model_name,
+        input_dim=input_dim,
+        intermediate_dim=int(input_dim / 2),
+        latent_dim=int(input_dim / 3),
+        learning_rate=learning_rate
+    )
+    vae.load_model_weights(str(model_dir / f"{model_name}-weights.h5"))
+
+    #The artifact set is written to a temporary directory first, so a failed update leaves no partial version
+    tmp_dir = output_dir.with_name(f"{output_dir.name}.{os.getpid()}.tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    training_report = vae.fit_streaming(x_finetune,
+                                        validation_source=x_validation,
+                                        epochs=epochs,
+                                        batch_size=batch_size,
+                                        patience=patience,
+                                        save_dir=str(tmp_dir))
+
+    if merge_sketch and 'threshold_sketch' in deployment_metadata:
+        vae.set_threshold_sketch(vae.threshold_sketch.merge(QuantileSketch.from_dict(deployment_metadata['threshold_sketch'])))
+
+    shutil.copy2(model_dir / scaler_filename, tmp_dir / scaler_filename)
+
+    update_time = time.time() - start_time
+    deployment_metadata.update({
+        'threshold': vae.threshold,
+        'threshold_90': vae.threshold_90,
+        'threshold_max': vae.threshold_max,
+        'threshold_sketch': vae.threshold_sketch.to_dict(),
+        'training_time': update_time,
+        'version': new_version,
+        'parent_version': version,
+        'parent_model_dir': str(model_dir),
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+        'update_stats': {
+            'num_samples': len(new_scaled),
+            'num_validation_samples': num_validation,
+            'epochs': len(training_report),
+            'feature_extraction_time': feature_extraction_time,
+            'update_time': update_time,
+        },
+    })
+    with open(tmp_dir / deployment_metadata_filename, "w") as fp:
+        json.dump(deployment_metadata, fp)
+
+    os.rename(tmp_dir, output_dir)
+    logger.info(f"Model version {new_version} saved to {output_dir} after {len(training_report)} epochs, in {update_time:.1f}s")
+
+    return output_dir
+
+
+def main(args):
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-7s %(message)s', stream=sys.stderr, level=logging.INFO)
+
+    pipeline_kwargs = {'fe_engine': args.fe_engine}
+    new_data = DataPipeline(**pipeline_kwargs).load_data(args.input)
+
+    update_model(args.model_dir,
+                 new_data,
+                 output_dir=args.output_dir,
+                 epochs=args.epochs,
+                 batch_size=args.batch_size,
+                 learning_rate=args.learning_rate,
+                 patience=args.patience,
+                 merge_sketch=args.merge_sketch,
+                 pipeline_kwargs=pipeline_kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fine-tunes a trained Prodigy model on new healthy telemetry")
+    parser.add_argument('--model-dir', required=True, help="Directory of the model to update")
+    parser.add_argument('--input', required=True, help="New healthy telemetry (.hdf, .parquet, .feather or .arrow)")
+    parser.add_argument('--output-dir', default=None, help="Directory of the new version, defaults to <model-dir>_v<N>")
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--learning-rate', type=float, default=1e-4)
+    parser.add_argument('--patience', type=int, default=5)
+    parser.add_argument('--merge-sketch', action='store_true', help="Calibrate on the previous training errors too")
+    parser.add_argument('--fe-engine', default='tsfresh', choices=['tsfresh', 'native'])
+    main(parser.parse_args())
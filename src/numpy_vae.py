@@ -0,0 +1,149 @@
+import logging
+import re
+import h5py
+import numpy as np
+import pandas as pd
+
+from scoring import decide, score_thresholds
+from profiling import profiled
+
+
+def _decode(names):
+    return [name.decode('utf8') if isinstance(name, bytes) else str(name) for name in names]
+
+
+def _load_submodel_weights(weights_file, submodel_name):
+    """Returns the [(kernel, bias), ...] pairs of a sub-model's dense layers, in layer order, keyed by layer name."""
+
+    group = weights_file[submodel_name]
+    weight_names = _decode(group.attrs['weight_names'])
+
+    layers = {}
+    for weight_name in weight_names:
+        layer_name, variable_name = weight_name.split('/')[-2:]
+        layers.setdefault(layer_name, {})[variable_name.split(':')[0]] = np.asarray(group[weight_name], dtype=np.float32)
+
+    #Keras suffixes layer names when several models are built in one process, e.g. 'z_mean_2'
+    return [(re.sub(r"_\d+$", "", layer_name), variables['kernel'], variables['bias']) for layer_name, variables in layers.items()]
+
+
+def _relu(x):
+    return np.maximum(x, 0)
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+class NumpyVAE():
+    """
+    TensorFlow-free inference engine for a trained `VAE`.
+
+    Loads the weights saved by `VAE.fit` (`model-weights.h5`) into NumPy arrays and computes the encoder
+    and decoder with batched matrix multiplies. In the deterministic mode the latent code is the encoder
+    mean; in the Monte-Carlo mode `n_samples` latent codes are drawn per input, as the Keras `Lambda`
+    sampling layer does, and their reconstruction errors are averaged.
+    """
+
+    def __init__(self, weights_path, mode='deterministic', n_samples=10, batch_size=4096, seed=None, verbose=False):
+        """Initializes a `NumpyVAE` object.
+
+        Args:
+            weights_path (str): Path to the weights file saved by `VAE.fit`.
+            mode (str): 'deterministic' or 'monte_carlo' (default is 'deterministic').
+            n_samples (int): Number of latent samples per input in the Monte-Carlo mode (default is 10).
+            batch_size (int): Number of inputs per matrix multiply (default is 4096).
+            seed (int): Seed of the Monte-Carlo sampling (default is None).
+            verbose (bool): If True, logs the loaded layer shapes.
+        """
+        if mode not in ['deterministic', 'monte_carlo']:
+            raise ValueError(f"Invalid value {mode} for parameter mode. Allowed values: ['deterministic', 'monte_carlo']")
+
+        self.mode = mode
+        self.n_samples = n_samples
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self.threshold = None
+
+        self.logger = logging.getLogger(__name__)
+        self.load_model_weights(weights_path)
+
+        if verbose:
+            self.logger.info(f"Loaded encoder {[kernel.shape for kernel, _ in self.encoder_hidden + [self.z_mean, self.z_log_var]]}")
+            self.logger.info(f"Loaded decoder {[kernel.shape for kernel, _ in self.decoder_layers]}")
+
+    def load_model_weights(self, weights_path):
+
+        with h5py.File(weights_path, 'r') as weights_file:
+            encoder_layers = _load_submodel_weights(weights_file, 'encoder')
+            decoder_layers = _load_submodel_weights(weights_file, 'decoder')
+
+        self.encoder_hidden = [(kernel, bias) for name, kernel, bias in encoder_layers if name not in ['z_mean', 'z_log_var']]
+        self.z_mean = [(kernel, bias) for name, kernel, bias in encoder_layers if name == 'z_mean'][0]
+        self.z_log_var = [(kernel, bias) for name, kernel, bias in encoder_layers if name == 'z_log_var'][0]
+        self.decoder_layers = [(kernel, bias) for _, kernel, bias in decoder_layers]
+
+        self.original_dim = self.encoder_hidden[0][0].shape[0]
+        self.latent_dim = self.z_mean[0].shape[1]
+
+    def encode(self, data):
+        """Returns the latent mean and log variance of each input row."""
+
+        x = np.asarray(data, dtype=np.float32)
+        for kernel, bias in self.encoder_hidden:
+            x = _relu(x @ kernel + bias)
+
+        return x @ self.z_mean[0] + self.z_mean[1], x @ self.z_log_var[0] + self.z_log_var[1]
+
+    def decode(self, z):
+        """Returns the reconstruction of latent codes, with the trailing axis holding the latent dimensions."""
+
+        for kernel, bias in self.decoder_layers[:-1]:
+            z = _relu(z @ kernel + bias)
+
+        return _sigmoid(z @ self.decoder_layers[-1][0] + self.decoder_layers[-1][1])
+
+    def predict(self, data):
+        """Reconstructs the inputs, from the encoder mean in the deterministic mode or from one latent sample per input."""
+
+        z_mean, z_log_var = self.encode(data)
+        if self.mode == 'monte_carlo':
+            z_mean = z_mean + np.exp(0.5 * z_log_var) * self.rng.standard_normal(z_mean.shape, dtype=np.float32)
+
+        return self.decode(z_mean)
+
+    def _batch_reconstruction_error(self, x):
+
+        z_mean, z_log_var = self.encode(x)
+
+        if self.mode == 'deterministic':
+            return np.mean(np.abs(x - self.decode(z_mean)), axis=1)
+
+        epsilon = self.rng.standard_normal((self.n_samples,) + z_mean.shape, dtype=np.float32)
+        recon = self.decode(z_mean + np.exp(0.5 * z_log_var) * epsilon)
+
+        return np.mean(np.abs(x - recon), axis=2).mean(axis=0)
+
+    def calculate_reconstruction_error(self, data):
+
+        x = np.asarray(data, dtype=np.float64)
+        mae_data = np.concatenate([self._batch_reconstruction_error(x[batch_start:batch_start + self.batch_size])
+                                   for batch_start in range(0, len(x), self.batch_size)] or [np.empty(0)])
+
+        if isinstance(data, pd.DataFrame):
+            return pd.Series(mae_data, index=data.index)
+        return mae_data
+
+    @profiled('NumpyVAE.predict_anomaly')
+    def predict_anomaly(self, data):
+
+        mae_data = self.calculate_reconstruction_error(data)
+
+        pred = decide(mae_data, self.threshold)
+
+        return pred, mae_data
+
+    def score(self, data, thresholds, labels=None):
+        """Scores data with one pass and decides for every named threshold, see `scoring.score_thresholds`."""
+
+        return score_thresholds(self.calculate_reconstruction_error(data), thresholds, labels=labels)
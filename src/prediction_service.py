@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+import pandas as pd
+
+from anomaly_detector import AnomalyDetector
+from feature_engine import encode_series_keys
+import profiling
+
+
+class ServiceOverloaded(Exception):
+    """Raised when the request queue of a model is full."""
+
+
+class PredictionService():
+    """
+    Resident prediction service that keeps `AnomalyDetector` models warm and scores requests in micro-batches.
+
+    Concurrent requests for the same model are coalesced into one feature extraction, scaling and VAE
+    scoring call of up to `max_batch_size` requests, waiting at most `max_wait_ms` for a batch to fill.
+    Requests are rejected with `ServiceOverloaded` while `max_queue_size` requests are already waiting.
+    """
+
+    def __init__(self, model_dirs, max_batch_size=32, max_wait_ms=20, max_queue_size=256, **detector_kwargs):
+        """Initializes a `PredictionService` object.
+
+        Args:
+            model_dirs (str or dict): Model directory, or a mapping of model name -> model directory.
+                A single directory is served as the model 'default'.
+            max_batch_size (int): Maximum number of requests scored together (default is 32).
+            max_wait_ms (float): Maximum time a request waits for its batch to fill, in ms (default is 20).
+            max_queue_size (int): Maximum number of waiting requests per model (default is 256).
+            **detector_kwargs: Keyword arguments passed to every `AnomalyDetector`, e.g. inference_engine.
+        """
+        if isinstance(model_dirs, (str, Path)):
+            model_dirs = {'default': model_dirs}
+
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+
+        self.logger = logging.getLogger(__name__)
+
+        #One scoring thread per model keeps the event loop responsive and each model single-threaded
+        self.executors = {name: ThreadPoolExecutor(max_workers=1) for name in model_dirs}
+        #The Keras engine builds its graph in the thread's default graph, so every model is loaded on the thread that scores it
+        self.detectors = {name: self.executors[name].submit(AnomalyDetector, model_dir=model_dir, **detector_kwargs).result()
+                          for name, model_dir in model_dirs.items()}
+        self.logger.info(f"Loaded models: {list(self.detectors)}")
+        self.queues = {}
+        self.batchers = []
+
+    async def start(self):
+        """Creates the request queues and starts one batching task per model."""
+
+        for name in self.detectors:
+            self.queues[name] = asyncio.Queue(maxsize=self.max_queue_size)
+            self.batchers.append(asyncio.ensure_future(self._batcher(name)))
+
+    async def stop(self):
+
+        for batcher in self.batchers:
+            batcher.cancel()
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+
+    async def predict(self, input_ts, model='default'):
+        """
+        Scores one input time series.
+
+        Args:
+            input_ts (pd.DataFrame): Input in the `AnomalyDetector.prediction_pipeline` format.
+            model (str): Name of the model (default is 'default').
+
+        Raises:
+            KeyError: If the model is not served.
+            ServiceOverloaded: If the model's request queue is full.
+
+        Returns:
+            pd.DataFrame: Predictions for every job_id and component_id of the input.
+        """
+        if model not in self.queues:
+            raise KeyError(f"Unknown model {model}. Served models: {list(self.queues)}")
+
+        future = asyncio.get_event_loop().create_future()
+        try:
+            self.queues[model].put_nowait((input_ts, future))
+        except asyncio.QueueFull:
+            raise ServiceOverloaded(f"Request queue of model {model} is full")
+
+        return await future
+
+    async def _batcher(self, name):
+
+        loop = asyncio.get_event_loop()
+        queue = self.queues[name]
+
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            results = await loop.run_in_executor(self.executors[name], self._predict_batch, name, [input_ts for input_ts, _ in batch])
+
+            for (_, future), result in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    @profiling.profiled('PredictionService.predict_batch')
+    def _predict_batch(self, name, inputs):
+        """Scores a micro-batch with one prediction_pipeline call, isolating failing requests if the batch fails."""
+
+        detector = self.detectors[name]
+
+        try:
+            return self._predict_tagged(detector, inputs)
+        except Exception as batch_error:
+            if len(inputs) == 1:
+                return [batch_error]
+
+        results = []
+        for input_ts in inputs:
+            try:
+                results.append(detector.prediction_pipeline(input_ts))
+            except Exception as error:
+                results.append(error)
+        return results
+
+    def _predict_tagged(self, detector, inputs):
+        """Replaces every (request, job_id) pair by an integer code, so requests of a batch can't collide, then splits the result."""
+
+        batch = pd.concat(inputs, keys=range(len(inputs)), names=['request_num', None]).reset_index(level=0)
+        batch_codes, batch_lookup = encode_series_keys(batch, ['request_num', 'job_id'])
+        batch['job_id'] = batch_codes
+        del batch['request_num']
+
+        result_df = detector.prediction_pipeline(batch.reset_index(drop=True))
+
+        tags = batch_lookup[result_df['job_id'].to_numpy()]
+        result_df['job_id'] = tags.get_level_values('job_id')
+        request_nums = tags.get_level_values('request_num').to_numpy()
+
+        self.logger.info(f"Scored a micro-batch of {len(inputs)} requests")
+
+        return [result_df[request_nums == request_num].reset_index(drop=True) for request_num in range(len(inputs))]
+
+    async def _respond(self, payload):
+        """
+        Scores one encoded request.
+
+        Every request is {"model": <name, optional>, "data": <input frame in pandas' "split" orientation>}.
+        Every response is {"predictions": [<record per job_id and component_id>]} or {"error": <message>}.
+
+        Returns:
+            int: HTTP status of the response.
+            dict: The response.
+        """
+        try:
+            request = json.loads(payload)
+            model = request.get('model', 'default')
+            if model not in self.queues:
+                return HTTPStatus.NOT_FOUND, {'error': f"Unknown model {model}. Served models: {list(self.queues)}"}
+            input_ts = pd.read_json(json.dumps(request['data']), orient='split')
+        except (ValueError, KeyError, AttributeError) as error:
+            return HTTPStatus.BAD_REQUEST, {'error': f"Malformed request: {error!r}"}
+
+        try:
+            result_df = await self.predict(input_ts, model=model)
+            return HTTPStatus.OK, {'predictions': json.loads(result_df.to_json(orient='records'))}
+        except ServiceOverloaded as error:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(error), 'overloaded': True}
+        except Exception as error:
+            self.logger.exception("Prediction request failed")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': repr(error)}
+
+    async def handle_connection(self, reader, writer):
+        """Serves newline-delimited JSON requests on one connection, see `_respond` for their format."""
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            _, response = await self._respond(line)
+
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+
+        writer.close()
+
+    async def handle_http(self, reader, writer):
+        """
+        Serves one HTTP request per connection, `POST /predict` with a JSON body in the format of `_respond`.
+
+        Requests go through the same micro-batching queues as `handle_connection`. A full queue is answered
+        with 503 Service Unavailable, an unknown model with 404 and a malformed request with 400.
+        """
+        try:
+            method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+        except (ValueError, asyncio.IncompleteReadError):
+            status, response = HTTPStatus.BAD_REQUEST, {'error': "Malformed HTTP request"}
+        else:
+            if target.split('?')[0] != '/predict':
+                status, response = HTTPStatus.NOT_FOUND, {'error': f"Unknown path {target}, requests are sent to /predict"}
+            elif method != 'POST':
+                status, response = HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"Method {method} is not allowed, use POST"}
+            else:
+                status, response = await self._respond(body)
+
+        payload = json.dumps(response).encode()
+        writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + payload)
+        await writer.drain()
+        writer.close()
+
+
+def request_prediction(input_ts, socket_path=None, host='127.0.0.1', port=None, model='default'):
+    """
+    Sends one prediction request to a running service and waits for the response.
+
+    Args:
+        input_ts (pd.DataFrame): Input in the `AnomalyDetector.prediction_pipeline` format.
+        socket_path (str): Unix socket of the service. Either socket_path or port must be set.
+        host (str): Host of the service when it listens on TCP (default is '127.0.0.1').
+        port (int): TCP port of the service.
+        model (str): Name of the model (default is 'default').
+
+    Returns:
+        dict: The decoded response.
+    """
+    if socket_path is not None:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(socket_path)
+    else:
+        conn = socket.create_connection((host, port))
+
+    request = {'model': model, 'data': json.loads(input_ts.to_json(orient='split', index=False))}
+    with conn, conn.makefile('rwb') as stream:
+        stream.write((json.dumps(request) + '\n').encode())
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+def main(args):
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-7s %(message)s', stream=sys.stderr, level=logging.INFO)
+
+    sinks = []
+    if args.profile_log:
+        sinks.append(profiling.LogSink())
+    if args.prometheus_textfile is not None:
+        sinks.append(profiling.PrometheusTextfileSink(args.prometheus_textfile, write_interval=args.prometheus_write_interval))
+    if sinks:
+        profiling.enable(*sinks)
+
+    service = PredictionService(args.model_dir,
+                                max_batch_size=args.max_batch_size,
+                                max_wait_ms=args.max_wait_ms,
+                                max_queue_size=args.max_queue_size,
+                                inference_engine=args.inference_engine,
+                                fe_engine=args.fe_engine)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(service.start())
+
+    handler = service.handle_http if args.http else service.handle_connection
+    protocol = 'HTTP' if args.http else 'newline-delimited JSON'
+    if args.socket is not None:
+        server = loop.run_until_complete(asyncio.start_unix_server(handler, path=args.socket))
+        logging.info(f"Serving {protocol} on {args.socket}")
+    else:
+        server = loop.run_until_complete(asyncio.start_server(handler, host=args.host, port=args.port))
+        logging.info(f"Serving {protocol} on {args.host}:{args.port}")
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.run_until_complete(service.stop())
+        profiling.disable()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Resident Prodigy prediction service with micro-batching")
+    parser.add_argument('--model-dir', required=True, help="Directory of the trained model")
+    parser.add_argument('--socket', default=None, help="Unix socket to listen on")
+    parser.add_argument('--host', default='127.0.0.1', help="Host to listen on, if no socket is given")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on, if no socket is given")
+    parser.add_argument('--http', action='store_true', help="Serve HTTP POST requests to /predict instead of newline-delimited JSON")
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=20)
+    parser.add_argument('--max-queue-size', type=int, default=256)
+    parser.add_argument('--inference-engine', default='keras', choices=['keras', 'numpy'])
+    parser.add_argument('--fe-engine', default='tsfresh', choices=['tsfresh', 'native'])
+    parser.add_argument('--profile-log', action='store_true', help="Log the wall time, CPU time, rows and memory delta of every stage call")
+    parser.add_argument('--prometheus-textfile', default=None, help="File the per-stage metrics are exported to in the Prometheus text format")
+    parser.add_argument('--prometheus-write-interval', type=float, default=0.0, help="Minimum seconds between writes of the Prometheus file")
+    main(parser.parse_args())
@@ -0,0 +1,335 @@
+import functools
+import itertools
+import json
+import logging
+import os
+import resource
+import threading
+import time
+import numpy as np
+
+#Active profiler, None while profiling is disabled
+_profiler = None
+
+_call_ids = itertools.count(1)
+_local = threading.local()
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def current_rss_bytes():
+    """Returns the current resident memory of the process, or its peak where /proc is not available."""
+
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        #ru_maxrss is reported in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _num_rows(value):
+    """Returns the number of rows of a frame or array, the first one of a tuple, or None if it is unknown."""
+
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, 'shape', None)
+
+    #Lazy frames, e.g. Dask DataFrames, don't know their length without computing it
+    return int(shape[0]) if shape and isinstance(shape[0], (int, np.integer)) else None
+
+
+class StageRecord():
+    """Measurements of one call of a stage."""
+
+    def __init__(self, name, rows_in=None, parent=None):
+
+        self.name = name
+        self.call_id = next(_call_ids)
+        self.parent = parent
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.memory_delta_bytes = None
+        self.error = None
+
+    def to_dict(self):
+
+        return {
+            'stage': self.name,
+            'call_id': self.call_id,
+            'parent': self.parent,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'memory_delta_bytes': self.memory_delta_bytes,
+            'error': self.error,
+        }
+
+
+class _Stage():
+    """Context manager that measures one stage call and emits its record to the profiler's sinks."""
+
+    def __init__(self, profiler, name, rows_in):
+
+        self.profiler = profiler
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.stack = stack
+        self.record = StageRecord(name, rows_in=rows_in, parent=stack[-1] if stack else None)
+
+    def __enter__(self):
+
+        self.stack.append(self.record.name)
+        self.rss_start = current_rss_bytes()
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, tb):
+
+        self.record.wall_seconds = time.perf_counter() - self.wall_start
+        #Process CPU time, it includes the threads of multithreaded stages, and of concurrent ones
+        self.record.cpu_seconds = time.process_time() - self.cpu_start
+        self.record.memory_delta_bytes = current_rss_bytes() - self.rss_start
+        if exc_type is not None:
+            self.record.error = exc_type.__name__
+        self.stack.pop()
+
+        self.profiler.emit(self.record)
+
+        return False
+
+
+class _DisabledStage():
+    """Stand-in for `_Stage` while profiling is disabled, its record absorbs the rows_out assignment."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_DISABLED_STAGE = _DisabledStage()
+
+
+class Profiler():
+    """Sends the record of every stage call to a list of sinks."""
+
+    def __init__(self, sinks):
+
+        self.sinks = list(sinks)
+        self.logger = logging.getLogger(__name__)
+
+    def emit(self, record):
+
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception:
+                #A broken sink must never fail the pipeline it observes
+                self.logger.exception(f"Profiling sink {type(sink).__name__} failed")
+
+    def close(self):
+
+        for sink in self.sinks:
+            sink.close()
+
+
+class LogSink():
+    """Logs every stage call as one JSON line."""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        """Initializes a `LogSink` object.
+
+        Args:
+            logger (logging.Logger): Logger to write to (default is None, the logger of this module).
+            level (int): Log level of the records (default is logging.INFO).
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def emit(self, record):
+
+        self.logger.log(self.level, f"stage {json.dumps(record.to_dict())}")
+
+    def close(self):
+        pass
+
+
+class PrometheusTextfileSink():
+    """
+    Aggregates stage calls into Prometheus metrics and writes them to a file in the text exposition format,
+    e.g. into the directory of the node_exporter textfile collector.
+
+    Every stage gets counters of its calls, errors, wall and CPU seconds and rows in and out, and a gauge of
+    the memory delta of its last call. The file is replaced atomically, so a scrape never reads a partial file.
+    """
+
+    METRICS = [
+        ('calls_total', 'counter', "Number of stage calls"),
+        ('errors_total', 'counter', "Number of stage calls that raised"),
+        ('wall_seconds_total', 'counter', "Wall time spent in the stage"),
+        ('cpu_seconds_total', 'counter', "CPU time spent in the stage"),
+        ('rows_in_total', 'counter', "Rows passed to the stage"),
+        ('rows_out_total', 'counter', "Rows returned by the stage"),
+        ('last_memory_delta_bytes', 'gauge', "Resident memory change of the last stage call"),
+    ]
+
+    def __init__(self, path, prefix='prodigy_stage', labels=None, write_interval=0.0):
+        """Initializes a `PrometheusTextfileSink` object.
+
+        Args:
+            path (str): File the metrics are written to, node_exporter reads files ending in '.prom'.
+            prefix (str): Prefix of the metric names (default is 'prodigy_stage').
+            labels (dict): Constant labels added to every metric, e.g. {'node': 'cn4010'} (default is None).
+            write_interval (float): Minimum seconds between writes, records in between are aggregated and
+                written with the next one or on `close` (default is 0.0, every record is written).
+        """
+        self.path = path
+        self.prefix = prefix
+        self.labels = dict(labels or {})
+        self.write_interval = write_interval
+        self.stages = {}
+        self.last_write = 0.0
+        self.lock = threading.Lock()
+
+    def emit(self, record):
+
+        with self.lock:
+            stage = self.stages.setdefault(record.name, {name: 0 for name, _, _ in self.METRICS})
+            stage['calls_total'] += 1
+            stage['errors_total'] += record.error is not None
+            stage['wall_seconds_total'] += record.wall_seconds
+            stage['cpu_seconds_total'] += record.cpu_seconds
+            stage['rows_in_total'] += record.rows_in or 0
+            stage['rows_out_total'] += record.rows_out or 0
+            stage['last_memory_delta_bytes'] = record.memory_delta_bytes
+
+            if time.monotonic() - self.last_write >= self.write_interval:
+                self._write()
+
+    @staticmethod
+    def _format_labels(labels):
+
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+        return ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped))
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+
+        lines = []
+        for name, metric_type, description in self.METRICS:
+            metric_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {metric_name} {description}")
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            for stage_name, stage in sorted(self.stages.items()):
+                labels = self._format_labels(dict(self.labels, stage=stage_name))
+                lines.append(f"{metric_name}{{{labels}}} {stage[name]}")
+
+        return '\n'.join(lines) + '\n'
+
+    def _write(self):
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as fp:
+            fp.write(self.render())
+        os.replace(tmp_path, self.path)
+        self.last_write = time.monotonic()
+
+    def close(self):
+
+        with self.lock:
+            if self.stages:
+                self._write()
+
+
+def enable(*sinks):
+    """
+    Starts profiling the pipeline stages, e.g. `profiling.enable(LogSink(), PrometheusTextfileSink(path))`.
+
+    Returns:
+        Profiler: The active profiler.
+    """
+    global _profiler
+
+    if _profiler is not None:
+        _profiler.close()
+    _profiler = Profiler(sinks or [LogSink()])
+
+    return _profiler
+
+
+def disable():
+    """Stops profiling and flushes the sinks."""
+
+    global _profiler
+
+    if _profiler is not None:
+        _profiler.close()
+    _profiler = None
+
+
+def is_enabled():
+    return _profiler is not None
+
+
+def profile_stage(name, rows_in=None):
+    """
+    Measures a block of code as a stage, e.g.
+
+        with profile_stage('AnomalyDetector.scale', rows_in=len(input_fe)) as stage:
+            scaled = ...
+            stage.rows_out = len(scaled)
+
+    While profiling is disabled, a shared no-op context manager is returned.
+
+    Args:
+        name (str): Stage name.
+        rows_in (int): Number of input rows (default is None).
+
+    Returns:
+        Context manager yielding the `StageRecord` of the call.
+    """
+    if _profiler is None:
+        return _DISABLED_STAGE
+
+    return _Stage(_profiler, name, rows_in)
+
+
+def profiled(name):
+    """
+    Decorator that measures every call of a function or method as a stage.
+
+    The input rows are taken from the first argument with a shape after self, e.g. a DataFrame, and the
+    output rows from the return value or its first element.
+
+    Args:
+        name (str): Stage name, e.g. 'DataPipeline.scale_data'.
+    """
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+
+            if _profiler is None:
+                return func(*args, **kwargs)
+
+            rows_in = next((rows for rows in map(_num_rows, args) if rows is not None), None)
+            with _Stage(_profiler, name, rows_in) as record:
+                result = func(*args, **kwargs)
+                record.rows_out = _num_rows(result)
+
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,196 @@
+import numpy as np
+
+
+class QuantileSketch():
+    """
+    Mergeable streaming quantile sketch (a merging t-digest).
+
+    Values are kept exactly until the sketch has seen more than `exact_limit` of them; quantiles then
+    equal `np.percentile`. Beyond that, values are summarized by at most about `compression / 2`
+    weighted centroids, which are small near the tails, where the classification thresholds are. The
+    minimum and maximum are always exact. Sketches built on different batches, workers or days are
+    combined with `merge`, and round-trip through JSON with `to_dict`/`from_dict`.
+    """
+
+    def __init__(self, compression=200, exact_limit=1000):
+        """Initializes an empty `QuantileSketch` object.
+
+        Args:
+            compression (int): Accuracy parameter, roughly twice the number of centroids (default is 200).
+            exact_limit (int): Number of values kept exactly before the sketch starts compressing (default is 1000).
+        """
+        self.compression = compression
+        self.exact_limit = exact_limit
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        #Exact values while count <= exact_limit, centroids afterwards
+        self.values = np.empty(0)
+        self.means = None
+        self.weights = None
+
+    @property
+    def is_exact(self):
+        return self.means is None
+
+    def update(self, values):
+        """
+        Adds a batch of values to the sketch.
+
+        Args:
+            values (array-like): Values to add, e.g. the reconstruction errors of a batch.
+
+        Returns:
+            QuantileSketch: The updated sketch.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return self
+
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        if self.is_exact and self.count <= self.exact_limit:
+            self.values = np.concatenate([self.values, values])
+        else:
+            self._add_centroids(values, np.ones(len(values)))
+
+        return self
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one.
+
+        Args:
+            other (QuantileSketch): Sketch to merge, it is left unchanged.
+
+        Returns:
+            QuantileSketch: The merged sketch.
+        """
+        if other.count == 0:
+            return self
+
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        if self.is_exact and other.is_exact and self.count <= self.exact_limit:
+            self.values = np.concatenate([self.values, other.values])
+        elif other.is_exact:
+            self._add_centroids(other.values, np.ones(len(other.values)))
+        else:
+            self._add_centroids(other.means, other.weights)
+
+        return self
+
+    def _add_centroids(self, means, weights):
+
+        if self.is_exact:
+            means = np.concatenate([self.values, means])
+            weights = np.concatenate([np.ones(len(self.values)), weights])
+            self.values = np.empty(0)
+        else:
+            means = np.concatenate([self.means, means])
+            weights = np.concatenate([self.weights, weights])
+
+        self.means, self.weights = self._compress(means, weights)
+
+    def _compress(self, means, weights):
+        """Merges sorted neighbouring centroids that fall into the same unit of the t-digest k1 scale."""
+
+        order = np.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+
+        cumulative = np.cumsum(weights)
+        q_mid = (cumulative - weights / 2) / cumulative[-1]
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * q_mid - 1))
+
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        merged_weights = np.add.reduceat(weights, starts)
+        merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+
+        return merged_means, merged_weights
+
+    def quantile(self, q):
+        """
+        Estimates quantiles of the values seen so far.
+
+        Args:
+            q (float or array-like): Quantiles in [0, 1].
+
+        Returns:
+            float or np.ndarray: The estimated quantiles, NaN for an empty sketch.
+        """
+        q = np.asarray(q, dtype=np.float64)
+
+        if self.count == 0:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+        if self.is_exact:
+            return np.percentile(self.values, q * 100)
+
+        #Interpolates between the centroid means, placed at the middle of their cumulative weight
+        cumulative = np.cumsum(self.weights)
+        positions = np.r_[0, cumulative - self.weights / 2, self.count]
+        values = np.r_[self.min, self.means, self.max]
+
+        return np.interp(q * self.count, positions, values)
+
+    def percentile(self, p):
+        """Estimates percentiles, in [0, 100], like `np.percentile`."""
+        return self.quantile(np.asarray(p, dtype=np.float64) / 100)
+
+    def to_dict(self):
+        """Returns a JSON serializable representation of the sketch."""
+
+        sketch_dict = {
+            'compression': self.compression,
+            'exact_limit': self.exact_limit,
+            'count': int(self.count),
+            'min': float(self.min) if self.count else None,
+            'max': float(self.max) if self.count else None,
+        }
+        if self.is_exact:
+            sketch_dict['values'] = self.values.tolist()
+        else:
+            sketch_dict['means'] = self.means.tolist()
+            sketch_dict['weights'] = self.weights.tolist()
+
+        return sketch_dict
+
+    @classmethod
+    def from_dict(cls, sketch_dict):
+        """Rebuilds a sketch from the output of `to_dict`."""
+
+        sketch = cls(compression=sketch_dict['compression'], exact_limit=sketch_dict['exact_limit'])
+        sketch.count = sketch_dict['count']
+        if sketch.count:
+            sketch.min = sketch_dict['min']
+            sketch.max = sketch_dict['max']
+
+        if 'values' in sketch_dict:
+            sketch.values = np.asarray(sketch_dict['values'], dtype=np.float64)
+        else:
+            sketch.means = np.asarray(sketch_dict['means'], dtype=np.float64)
+            sketch.weights = np.asarray(sketch_dict['weights'], dtype=np.float64)
+
+        return sketch
+
+
+def merge_sketches(sketches):
+    """
+    Merges sketches, e.g. from different workers or days, into a new sketch.
+
+    Args:
+        sketches (list): `QuantileSketch` objects or their `to_dict` representations.
+
+    Returns:
+        QuantileSketch: The merged sketch.
+    """
+    sketches = [QuantileSketch.from_dict(sketch) if isinstance(sketch, dict) else sketch for sketch in sketches]
+
+    merged = QuantileSketch(compression=sketches[0].compression, exact_limit=sketches[0].exact_limit)
+    for sketch in sketches:
+        merged.merge(sketch)
+
+    return merged
@@ -4,12 +4,7 @@ import pandas as pd
 import os
 import sys
 
-#Plots, logging, and other configurations
-import matplotlib.pyplot as plt
-import seaborn as sns
-sns.set_context('paper')
-sns.set_style("white")
-
+#Logging and other configurations
 import logging
 logging.basicConfig(format='%(asctime)s %(levelname)-7s %(message)s',
                     stream=sys.stderr, level=logging.INFO)
@@ -80,6 +75,12 @@ def main(results_dir, plot_output_dir):
     result_df = pd.concat(results_list)
     result_df.groupby(['num_samples']).mean()
 
+    #Plotting stacks are only imported once there are results to plot
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    sns.set_context('paper')
+    sns.set_style("white")
+
     fig, ax = plt.subplots(1, 1, figsize=(plot_params['fig_width'], plot_params['fig_height']))
     ax = sns.barplot(x="num_samples", y="f1_scores", data=result_df)
 
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+#Rows converted to float64 at a time while fitting and scaling
+BLOCK_ROWS = 1 << 14
+
+
+def new_scaler(feature_range=(0, 1), clip=True):
+    """Returns an unfitted `MinMaxScaler`, the scaler every saved model uses."""
+
+    from sklearn.preprocessing import MinMaxScaler
+    return MinMaxScaler(feature_range=feature_range, clip=clip)
+
+
+def as_float_matrix(data, dtype=np.float64):
+    """
+    Returns feature values as one float matrix.
+
+    Only non-numeric columns are coerced with `pd.to_numeric`; values that can't be parsed become NaN.
+
+    Args:
+        data (pd.DataFrame or np.ndarray): Features.
+        dtype (np.dtype): Float type of the matrix (default is np.float64).
+
+    Returns:
+        np.ndarray: Float matrix of shape (n_samples, n_features).
+    """
+    if not isinstance(data, pd.DataFrame):
+        return np.asarray(data, dtype=dtype)
+
+    non_numeric = [column for column, dtype in data.dtypes.items() if not is_numeric_dtype(dtype)]
+    if non_numeric:
+        data = data.copy(deep=False)
+        for column in non_numeric:
+            data[column] = pd.to_numeric(data[column], errors='coerce')
+
+    return data.to_numpy(dtype=dtype)
+
+
+def iter_row_blocks(data, block_rows=BLOCK_ROWS):
+    """Yields consecutive blocks of at most block_rows rows of a frame or matrix, as views where possible."""
+
+    rows = data.iloc if isinstance(data, pd.DataFrame) else data
+    for start in range(0, len(data), block_rows):
+        yield rows[start:start + block_rows]
+
+
+def fit_scaler(chunks, scaler=None):
+    """
+    Fits a scaler incrementally over chunks of features, so the training features never need to be in memory at once.
+
+    Every chunk is fitted in float64, so the statistics keep the precision of large-magnitude features.
+
+    Args:
+        chunks (iterable): pd.DataFrame or np.ndarray chunks of features, with the same columns.
+        scaler (MinMaxScaler): Scaler to keep fitting (default is None, a new scaler).
+
+    Returns:
+        MinMaxScaler: The fitted scaler.
+    """
+    scaler = scaler if scaler is not None else new_scaler()
+
+    for chunk in chunks:
+        scaler.partial_fit(as_float_matrix(chunk, np.float64))
+
+    return scaler
+
+
+def merge_scalers(scalers):
+    """
+    Merges scalers fitted on different data, e.g. on different nodes or workers, into one scaler.
+
+    The merged scaler equals a scaler fitted on all of the data at once.
+
+    Args:
+        scalers (list): Fitted `MinMaxScaler` objects with the same features and settings.
+
+    Returns:
+        MinMaxScaler: The merged scaler.
+    """
+    merged = new_scaler(feature_range=scalers[0].feature_range, clip=getattr(scalers[0], 'clip', False))
+
+    #A scaler only depends on the per-feature minimum and maximum, so fitting their rows merges the statistics
+    for scaler in scalers:
+        merged.partial_fit(np.vstack([scaler.data_min_, scaler.data_max_]))
+    merged.n_samples_seen_ = sum(scaler.n_samples_seen_ for scaler in scalers)
+
+    return merged
+
+
+def transform_inplace(scaler, values):
+    """
+    Scales a float matrix in place without copies or input validation, as `MinMaxScaler.transform` does up to rounding.
+
+    The minimum is subtracted before scaling, so values far from zero don't cancel against `scaler.min_`.
+    The result is only as precise as `values`, large-magnitude features need float64 input, see `transform_to_float32`.
+
+    Args:
+        scaler (MinMaxScaler): Fitted scaler, e.g. loaded from `scaler.save`.
+        values (np.ndarray): Float matrix of shape (n_samples, n_features), overwritten with the scaled values.
+
+    Returns:
+        np.ndarray: The scaled matrix, i.e. `values`.
+    """
+    values -= scaler.data_min_.astype(values.dtype, copy=False)
+    values *= scaler.scale_.astype(values.dtype, copy=False)
+    values += scaler.feature_range[0]
+
+    if getattr(scaler, 'clip', False):
+        np.clip(values, scaler.feature_range[0], scaler.feature_range[1], out=values)
+
+    return values
+
+
+def transform_to_float32(scaler, data, block_rows=BLOCK_ROWS):
+    """
+    Scales features into one float32 matrix, the only full copy the scaling stage makes.
+
+    Rows are converted to float64 and scaled a block at a time, so features far from zero are shifted to
+    their range before they are rounded to float32.
+
+    Args:
+        scaler (MinMaxScaler): Fitted scaler, e.g. loaded from `scaler.save`.
+        data (pd.DataFrame or np.ndarray): Features of shape (n_samples, n_features).
+        block_rows (int): Rows converted to float64 at a time (default is BLOCK_ROWS).
+
+    Returns:
+        np.ndarray: Scaled float32 matrix of shape (n_samples, n_features).
+    """
+    scaled = np.empty(data.shape, dtype=np.float32)
+
+    for start, block in zip(range(0, len(data), block_rows), iter_row_blocks(data, block_rows)):
+        scaled[start:start + len(block)] = transform_inplace(scaler, as_float_matrix(block, np.float64))
+
+    return scaled
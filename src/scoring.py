@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+from quantile_sketch import QuantileSketch
+
+
+def percentile_threshold_name(percentile):
+    """Returns the name of a percentile threshold, e.g. 'p95' or 'p99.5'."""
+    return f"p{percentile:g}"
+
+
+def calibrate_thresholds(recon_errors, percentiles=None):
+    """
+    Computes the classification thresholds from the reconstruction errors of healthy training data.
+
+    Args:
+        recon_errors (array-like or QuantileSketch): Reconstruction errors of the training data, or their sketch.
+        percentiles (list): Additional percentiles to compute thresholds for (default is None).
+
+    Returns:
+        dict: Mapping of threshold name -> value. 'threshold' is the 99th percentile, 'threshold_90'
+            the 90th percentile and 'threshold_max' the maximum; custom percentiles are named 'p<percentile>'.
+    """
+    percentiles = list(percentiles or [])
+    if isinstance(recon_errors, QuantileSketch):
+        values = recon_errors.percentile([99, 90, 100] + percentiles)
+    else:
+        values = np.percentile(np.asarray(recon_errors, dtype=np.float64), [99, 90, 100] + percentiles)
+
+    thresholds = {'threshold': values[0], 'threshold_90': values[1], 'threshold_max': values[2]}
+    thresholds.update({percentile_threshold_name(percentile): value for percentile, value in zip(percentiles, values[3:])})
+
+    return thresholds
+
+
+def decide(recon_errors, threshold):
+    """Returns 1 for every reconstruction error above the threshold and 0 otherwise, as an int array."""
+    return (np.asarray(recon_errors) > threshold).astype(np.int64)
+
+
+def precision_recall(labels, decisions):
+    """
+    Computes precision and recall of several decision vectors at once.
+
+    Args:
+        labels (array-like): Binary ground truth, 1 for anomalous samples.
+        decisions (np.ndarray): Binary decisions of shape (n_samples, n_thresholds).
+
+    Returns:
+        tuple: Precision and recall arrays of length n_thresholds. Precision is 0 for a threshold
+            without positive decisions and recall is 0 without positive labels, as scikit-learn reports them.
+    """
+    labels = np.asarray(labels).astype(bool)
+    decisions = np.asarray(decisions).astype(bool)
+
+    true_positives = np.count_nonzero(decisions & labels[:, None], axis=0)
+    predicted_positives = np.count_nonzero(decisions, axis=0)
+    actual_positives = np.count_nonzero(labels)
+
+    precision = np.divide(true_positives, predicted_positives, out=np.zeros(len(true_positives)), where=predicted_positives > 0)
+    recall = true_positives / actual_positives if actual_positives else np.zeros(len(true_positives))
+
+    return precision, recall
+
+
+def score_thresholds(recon_errors, thresholds, labels=None):
+    """
+    Turns reconstruction errors into decisions for any number of thresholds in one vectorized pass.
+
+    Args:
+        recon_errors (array-like): Reconstruction errors of the samples to classify.
+        thresholds (dict): Mapping of threshold name -> value.
+        labels (array-like): Binary ground truth of the samples (default is None).
+
+    Returns:
+        dict: 'recon_errors' holds the errors, 'predictions' maps every threshold name to an int array of
+            decisions. With labels, 'precision_recall' is a pd.DataFrame indexed by threshold name with
+            the threshold, precision and recall, sorted by threshold, i.e. the precision/recall curve.
+    """
+    recon_errors = np.asarray(recon_errors, dtype=np.float64)
+    names = list(thresholds)
+    values = np.array([thresholds[name] for name in names], dtype=np.float64)
+
+    decisions = recon_errors[:, None] > values[None, :]
+
+    scores = {
+        'recon_errors': recon_errors,
+        'predictions': {name: decisions[:, i].astype(np.int64) for i, name in enumerate(names)},
+    }
+
+    if labels is not None:
+        if len(labels) != len(recon_errors):
+            raise ValueError(f"Got {len(labels)} labels for {len(recon_errors)} samples")
+        precision, recall = precision_recall(labels, decisions)
+        scores['precision_recall'] = pd.DataFrame({'threshold': values, 'precision': precision, 'recall': recall},
+                                                  index=pd.Index(names, name='name')).sort_values('threshold')
+
+    return scores
@@ -6,22 +6,32 @@ import joblib
 import json
 import os
 import numpy as np
-import matplotlib.pyplot as plt
-from tsfresh.feature_extraction import settings
-from sklearn.model_selection import train_test_split
 import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from ndata_pipeline import DataPipeline
-from vae import VAE
+from data_pipeline import DataPipeline
+from feature_engine import fc_parameters_from_columns
+from feature_selection import load_feature_list, save_feature_list
+import profiling
 
-def process_node(node_dir, output_dir, repeat_num, expConfig_num):
+#Environment variables read by the BLAS/OpenMP runtimes to size their thread pools
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+def process_node(node_dir, output_dir, repeat_num, expConfig_num, pipeline_kwargs=None, pre_selected_features=None, feature_selection_kwargs=None):
     # Extract node name from directory
     node_name = os.path.basename(node_dir)
+    
+    # Every node and run gets its own model directory, so parallel workers don't overwrite each other
+    model_dir = Path(output_dir) / node_name / f"expConfig_{expConfig_num}_repeatNum_{repeat_num}"
+    os.makedirs(model_dir, exist_ok=True)
+    
     train_path = os.path.join(node_dir, f'{node_name}_train.hdf')
     test_path = os.path.join(node_dir, f'{node_name}_test.hdf')
 
     # Load data using DataPipeline
-    pipeline = DataPipeline()
+    # pipeline_kwargs configures the DataPipeline, e.g. fe_engine or feature_cache_dir
+    pipeline = DataPipeline(**(pipeline_kwargs or {}))
 
     x_train, x_test = pipeline.load_HPC_data(train_path, test_path)
 
@@ -29,19 +39,32 @@ def process_node(node_dir, output_dir, repeat_num, expConfig_num):
         logging.error(f"Data loading failed for node {node_name}")
         return
 
-    # Ensure index column is formatted correctly
-    x_train['index'] = x_train['job_id'].astype(str) + '_' + x_train['component_id'].astype(str)
-    x_test['index'] = x_test['job_id'].astype(str) + '_' + x_test['component_id'].astype(str)
-
-    new_x_train = x_train.drop(['index', 'uid'], axis=1)
-    new_x_test = x_test.drop(['index', 'uid'], axis=1)
+    # Series are keyed by job_id and component_id during feature extraction, the stored uid isn't needed
+    new_x_train = x_train.drop(['uid'], axis=1)
+    new_x_test = x_test.drop(['uid'], axis=1)
 
+    # With a pre-selected feature list, only those features are extracted
     start_time = time.time()
-    x_train_fe = pipeline.tsfresh_generate_features(new_x_train, fe_config="minimal")
+    if pre_selected_features is not None:
+        x_train_fe = pipeline.tsfresh_generate_features(new_x_train, fe_config=None, 
+                                                        kind_to_fc_parameters=fc_parameters_from_columns(pre_selected_features))
+    else:
+        x_train_fe = pipeline.tsfresh_generate_features(new_x_train, fe_config="minimal")
+    
+    # Prune constant and near-duplicate features, which shrinks the VAE and the extraction of the test data
+    if pre_selected_features is not None or feature_selection_kwargs is not None:
+        # A pre-selected list alone is used as is, without pruning
+        selection_kwargs = feature_selection_kwargs if feature_selection_kwargs is not None else {'variance_threshold': None}
+        x_train_fe = pipeline.select_features(x_train_fe, pre_selected=pre_selected_features, **selection_kwargs)
+        save_feature_list(x_train_fe.columns, model_dir / 'selected_features.json')
     feature_extraction_time_train = time.time() - start_time
 
     start_time = time.time()
-    x_test_fe = pipeline.tsfresh_generate_features(new_x_test, fe_config="minimal")
+    if pipeline.feature_selection_stats is not None:
+        x_test_fe = pipeline.tsfresh_generate_features(new_x_test, fe_config=None, 
+                                                       kind_to_fc_parameters=fc_parameters_from_columns(list(x_train_fe.columns)))
+    else:
+        x_test_fe = pipeline.tsfresh_generate_features(new_x_test, fe_config="minimal")
     feature_extraction_time_test = time.time() - start_time
 
     # Make the number of columns and the order equal
@@ -54,12 +77,15 @@ def process_node(node_dir, output_dir, repeat_num, expConfig_num):
     assert all(x_train_fe.columns == x_test_fe.columns)
     x_test_fe.reset_index(drop=True, inplace=True)
 
-    x_train_scaled, x_test_scaled = pipeline.scale_data(x_train_fe, x_test_fe, save_dir=output_dir)
+    x_train_scaled, x_test_scaled = pipeline.scale_data(x_train_fe, x_test_fe, save_dir=model_dir)
 
     input_dim = x_train_scaled.shape[1]
     intermediate_dim = int(input_dim / 2)
     latent_dim = int(input_dim / 3)
 
+    #TensorFlow is only imported once a model is trained, so sweep workers limit its threads first
+    from vae import VAE
+
     vae = VAE(
         name="model",
         input_dim=input_dim,
@@ -75,19 +101,25 @@ def process_node(node_dir, output_dir, repeat_num, expConfig_num):
         epochs=1000,
         batch_size=32,
         validation_split=0.1,
-        save_dir=output_dir,
+        save_dir=str(model_dir),
         verbose=0
     )
     training_time = time.time() - start_time + feature_extraction_time_train
 
     deployment_metadata = {
         'threshold': vae.threshold,
+        'threshold_90': vae.threshold_90,
+        'threshold_max': vae.threshold_max,
+        #Mergeable summary of the training errors, thresholds can be recalibrated from it without the data
+        'threshold_sketch': vae.threshold_sketch.to_dict(),
         'raw_column_names': list(x_train_scaled.columns),
-        'fe_column_names': settings.from_columns(list(x_train_scaled.columns)),
+        'fe_column_names': fc_parameters_from_columns(list(x_train_scaled.columns)),
         'training_time': training_time
     }
+    if pipeline.feature_selection_stats is not None:
+        deployment_metadata['feature_selection'] = pipeline.feature_selection_stats
 
-    with open(Path(output_dir) / 'deployment_metadata.json', 'w') as fp:
+    with open(model_dir / 'deployment_metadata.json', 'w') as fp:
         json.dump(deployment_metadata, fp)
 
     start_time = time.time()
@@ -98,16 +130,121 @@ def process_node(node_dir, output_dir, repeat_num, expConfig_num):
         "y_pred_test": np.array(y_pred_test).tolist(),
         "x_test_recon_errors": np.array(x_test_recon_errors).tolist(),
         "training_time": training_time,
-        "prediction_time": prediction_time
+        "prediction_time": prediction_time,
+        "repeat_num": repeat_num,
+        "expConfig_num": expConfig_num
     }
 
-    result_file = Path(output_dir) / "results" / f"{node_name}.json"
-    with open(result_file, "w") as outfile:
+    # Every repeat and experiment configuration of a node gets its own file, so parallel runs don't overwrite each other
+    result_file = Path(output_dir) / "results" / node_name / f"expConfig_{expConfig_num}_repeatNum_{repeat_num}.json"
+    os.makedirs(result_file.parent, exist_ok=True)
+    # Write to a temporary file first, so concurrent runs of the same node never leave a partial JSON behind
+    tmp_result_file = result_file.with_name(f"{result_file.name}.{os.getpid()}.tmp")
+    with open(tmp_result_file, "w") as outfile:
         json.dump(result_dict, outfile)
+    os.replace(tmp_result_file, result_file)
 
     logging.info(f"Results for {node_name} saved to {result_file}")
+    
+    return result_file
+
+#Thread cap of this process, set by the first sweep task that runs in it
+_worker_threads = None
+
+def _init_worker(threads_per_worker):
+    """Caps the TensorFlow and BLAS thread pools of a sweep worker once, so workers don't oversubscribe the cores."""
+    
+    global _worker_threads
+    if _worker_threads is not None:
+        return
+    _worker_threads = threads_per_worker
+    
+    for env_var in THREAD_ENV_VARS:
+        os.environ[env_var] = str(threads_per_worker)
+        
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=threads_per_worker)
+    except ImportError:
+        pass
+    
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def _run_node_task(node_dir, output_dir, repeat_num, expConfig_num, pipeline_kwargs, pre_selected_features=None, feature_selection_kwargs=None,
+                   threads_per_worker=None):
+    """Runs process_node and reports failures instead of raising, so one bad node doesn't stop the sweep."""
+    
+    try:
+        #Worker processes are capped by their first task, ProcessPoolExecutor's initializer needs Python 3.7
+        if threads_per_worker is not None:
+            _init_worker(threads_per_worker)
+        result_file = process_node(node_dir, output_dir, repeat_num, expConfig_num, pipeline_kwargs=pipeline_kwargs,
+                                   pre_selected_features=pre_selected_features, feature_selection_kwargs=feature_selection_kwargs)
+        return result_file is not None, None
+    except Exception:
+        return False, traceback.format_exc()
+
+def run_sweep(node_dirs, repeat_nums, expConfig_nums, output_dir, n_workers=1, threads_per_worker=None, pipeline_kwargs=None,
+              pre_selected_features=None, feature_selection_kwargs=None):
+    """
+    Runs process_node for every node, repeat and experiment configuration.
+    
+    Args:
+        node_dirs (list): Node data directories.
+        repeat_nums (list): Repeat numbers.
+        expConfig_nums (list): Experimental configuration numbers.
+        output_dir (str): Directory for models and results.
+        n_workers (int): Number of worker processes. 1 runs the sweep in the current process. Defaults to 1.
+        threads_per_worker (int): TensorFlow/BLAS threads per worker. Defaults to the core count divided by n_workers.
+        pipeline_kwargs (dict): Keyword arguments of DataPipeline, e.g. fe_engine or feature_cache_dir.
+        pre_selected_features (list): Feature names to extract and train on. Defaults to None, all minimal features.
+        feature_selection_kwargs (dict): Keyword arguments of DataPipeline.select_features, e.g. 
+            {'variance_threshold': 0.0, 'correlation_threshold': 0.99}. Defaults to None, no pruning.
+        
+    Returns:
+        dict: Mapping of (node_dir, repeat_num, expConfig_num) -> error traceback, or None for successful runs.
+    """
+    
+    tasks = [(node_dir, repeat_num, expConfig_num) for node_dir in node_dirs for repeat_num in repeat_nums for expConfig_num in expConfig_nums]
+    statuses = {}
+    
+    if n_workers == 1:
+        for node_dir, repeat_num, expConfig_num in tasks:
+            logging.info(f"Processing node {node_dir}, repeat_num {repeat_num}, expConfig_num {expConfig_num}")
+            succeeded, error = _run_node_task(node_dir, output_dir, repeat_num, expConfig_num, pipeline_kwargs, 
+                                              pre_selected_features, feature_selection_kwargs)
+            statuses[(node_dir, repeat_num, expConfig_num)] = None if succeeded else (error or "Data loading failed")
+            logging.info(f"Completed processing node {node_dir}")
+    else:
+        if threads_per_worker is None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // n_workers)
+        logging.info(f"Running {len(tasks)} tasks on {n_workers} workers with {threads_per_worker} threads each")
+        
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(_run_node_task, node_dir, output_dir, repeat_num, expConfig_num, pipeline_kwargs, 
+                                       pre_selected_features, feature_selection_kwargs, threads_per_worker): (node_dir, repeat_num, expConfig_num) 
+                       for node_dir, repeat_num, expConfig_num in tasks}
+            
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    succeeded, error = future.result()
+                except Exception:
+                    # The worker process itself died, e.g. killed by the OOM killer
+                    succeeded, error = False, traceback.format_exc()
+                statuses[task] = None if succeeded else (error or "Data loading failed")
+                logging.info(f"Completed processing node {task[0]}, repeat_num {task[1]}, expConfig_num {task[2]}")
+    
+    for (node_dir, repeat_num, expConfig_num), error in statuses.items():
+        if error is not None:
+            logging.error(f"Processing failed for node {node_dir}, repeat_num {repeat_num}, expConfig_num {expConfig_num}:\n{error}")
+            
+    return statuses
 
-def main(repeat_nums, expConfig_nums, data_dir, pre_selected_features_filename, output_dir, verbose=False):
+def main(repeat_nums, expConfig_nums, data_dir, pre_selected_features_filename, output_dir, verbose=False, pipeline_kwargs=None, n_workers=1, threads_per_worker=None,
+         feature_selection_kwargs=None):
     
     logging.basicConfig(format='%(asctime)s %(levelname)-7s %(message)s', stream=sys.stderr, level=logging.INFO if verbose else logging.DEBUG)
         
@@ -129,12 +266,15 @@ def main(repeat_nums, expConfig_nums, data_dir, pre_selected_features_filename,
 
     node_dirs = [f.path for f in os.scandir(data_dir) if f.is_dir()]
 
-    for node_dir in node_dirs:
-        for repeat_num in repeat_nums:
-            for expConfig_num in expConfig_nums:
-                logging.info(f"Processing node {node_dir}, repeat_num {repeat_num}, expConfig_num {expConfig_num}")
-                process_node(node_dir, output_dir, repeat_num, expConfig_num)
-                logging.info(f"Completed processing node {node_dir}")
+    # The pre-selected features are a JSON list of feature names, or the fe_column_names of a trained model
+    pre_selected_features = load_feature_list(pre_selected_features_filename) if pre_selected_features_filename else None
+
+    statuses = run_sweep(node_dirs, repeat_nums, expConfig_nums, output_dir, 
+                         n_workers=n_workers, threads_per_worker=threads_per_worker, pipeline_kwargs=pipeline_kwargs,
+                         pre_selected_features=pre_selected_features, feature_selection_kwargs=feature_selection_kwargs)
+    
+    num_failed = sum(error is not None for error in statuses.values())
+    logging.info(f"Sweep finished: {len(statuses) - num_failed} succeeded, {num_failed} failed")
 
 if __name__ == '__main__':
     repeat_nums = [0]
@@ -143,6 +283,15 @@ if __name__ == '__main__':
     pre_selected_features_filename = None
     output_dir = "/THL5/home/shyunie/xue_code/prodigy_artifacts/prodigy_ae_output"
     verbose = True
-    main(repeat_nums, expConfig_nums, data_dir, pre_selected_features_filename, output_dir, verbose)
+    n_workers = 1
+    pipeline_kwargs = {'fe_engine': 'tsfresh', 'feature_cache_dir': output_dir + "/feature_cache"}
+    # e.g. {'variance_threshold': 0.0, 'correlation_threshold': 0.99} prunes constant and near-duplicate features
+    feature_selection_kwargs = None
+    # Logs the wall time, CPU time, rows and memory delta of every pipeline stage call
+    profile_stages = False
+    if profile_stages:
+        profiling.enable(profiling.LogSink())
+    main(repeat_nums, expConfig_nums, data_dir, pre_selected_features_filename, output_dir, verbose, pipeline_kwargs=pipeline_kwargs, n_workers=n_workers,
+         feature_selection_kwargs=feature_selection_kwargs)
     
     logging.info("Script is completed")
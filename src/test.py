@@ -1,6 +1,9 @@
 import pandas as pd
+import numpy as np
 import os
 
+from job_labels import JobIntervalIndex
+
 component_id = 8
 # 源文件路径
 input_file = 'ai4hpc_deployment\src\eclipse_small_prod_dataset\cn8.csv'
@@ -43,32 +46,19 @@ df_second_part['job_id'] = range(14401)
 df_second_part['uid'] = range(14401)
 df_second_part['component_id'] = component_id
 
-# 读取label_job_2500文件
-label_df = pd.read_csv(label_file)
-
-# 处理label_df
-label_df['job_start'] = pd.to_datetime(label_df['job_start'])
-label_df['job_end'] = pd.to_datetime(label_df['job_end'])
-label_df['job_node'] = label_df['job_node'].apply(lambda x: x.strip("[]").strip("'"))
+# 读取并索引label_job_2500文件
+interval_index = JobIntervalIndex.from_file(label_file)
 
 # 将训练集和测试集的timestamp转换为datetime
 df_first_part['timestamp'] = pd.to_datetime(df_first_part['timestamp'], unit='s')
 df_second_part['timestamp'] = pd.to_datetime(df_second_part['timestamp'], unit='s')
 
-# 根据label_df更新训练集和测试集的job_id
-for _, row in label_df.iterrows():
-    job_node = row['job_node']
-    job_start = row['job_start']
-    job_end = row['job_end']
-    job_id = row.name  # 使用行号作为job_id
-
-    if 'cn10' in job_node:
-        mask = (df_first_part['timestamp'] >= job_start) & (df_first_part['timestamp'] <= job_end)
-        df_first_part.loc[mask, 'job_id'] = job_id
-    # 假设需要对测试集进行类似的操作
-    # if 'cn8' in job_node:
-    #     mask = (df_second_part['timestamp'] >= job_start) & (df_second_part['timestamp'] <= job_end)
-    #     df_second_part.loc[mask, 'job_id'] = job_id
+# 根据区间索引更新训练集的job_id, 没有作业的时间戳保留原来的job_id
+job_ids = interval_index.assign('cn10', df_first_part['timestamp'])
+df_first_part['job_id'] = np.where(job_ids >= 0, job_ids, df_first_part['job_id'])
+# 假设需要对测试集进行类似的操作
+# job_ids = interval_index.assign('cn8', df_second_part['timestamp'])
+# df_second_part['job_id'] = np.where(job_ids >= 0, job_ids, df_second_part['job_id'])
 
 # # 构建新的CSV文件路径
 # train_csv_file = os.path.join(input_dir, 'newtrain.csv')
@@ -3,10 +3,9 @@ import time
 import pandas as pd
 pd.set_option('mode.chained_assignment', None)
 from constants import junk_cols, common_cols, excluded_cols
+from profiling import profiled
 import yaml
 import numpy as np
-import warnings
-warnings.filterwarnings('ignore', category=yaml.YAMLLoadWarning)
 
 def convert_str_time_to_unix(str_time):
     
@@ -16,6 +15,63 @@ def convert_str_time_to_unix(str_time):
     
     return int(time.mktime(datetime_object.timetuple()))
 
+def _local_mktime(naive_seconds):
+    """
+    time.mktime of a naive local wall-clock time given as seconds since 1970-01-01 00:00:00.
+    
+    Unlike time.mktime with tm_isdst=-1, whose choice for ambiguous times depends on previous calls, an ambiguous 
+    wall-clock time always resolves to its first occurrence and a nonexistent one is read as standard time.
+    """
+    fields = time.gmtime(naive_seconds)[:8]
+    candidates = [int(time.mktime(fields + (is_dst,))) for is_dst in (1, 0)]
+    valid = [candidate for candidate in candidates if time.localtime(candidate)[:6] == fields[:6]]
+    
+    return min(valid) if valid else candidates[1]
+
+def convert_str_times_to_unix(str_times):
+    """
+    Vectorized convert_str_time_to_unix for a whole column of timestamp strings.
+    
+    Each distinct string is parsed once. Timestamps are truncated to the second and interpreted as local 
+    wall-clock time, exactly like time.mktime does for convert_str_time_to_unix: the local UTC offset is 
+    resolved with time.mktime once per distinct hour. Hours next to an offset change (DST transitions, 
+    where wall-clock times can be ambiguous or nonexistent) fall back to _local_mktime for every value in them.
+    """
+    
+    codes, uniques = pd.factorize(np.asarray(str_times, dtype=object))
+    
+    parsed = pd.to_datetime(uniques, format='%Y-%m-%d %H:%M:%S.%f').floor('S')
+    naive_seconds = parsed.values.astype('datetime64[s]').astype(np.int64)
+    
+    unique_hours, hour_codes = np.unique(naive_seconds // 3600 * 3600, return_inverse=True)
+    
+    #Local UTC offsets from the previous hour's start to the next hour's end
+    probe_offsets = np.array([[probe - _local_mktime(probe) for probe in (hour - 3600, hour, hour + 3599, hour + 7199)] 
+                              for hour in unique_hours], dtype=np.int64).reshape(-1, 4)
+    
+    unix_seconds = naive_seconds - probe_offsets[hour_codes, 1]
+    
+    irregular = (probe_offsets != probe_offsets[:, [1]]).any(axis=1)[hour_codes]
+    if irregular.any():
+        unix_seconds[irregular] = [_local_mktime(curr_seconds) for curr_seconds in naive_seconds[irregular]]
+    
+    return unix_seconds[codes]
+
+def add_unix_timestamps(sampler_dfs):
+    """
+    Adds the unix_timestamp column to every sampler frame.
+    
+    String timestamps of all samplers are converted together, so a timestamp shared by several samplers is parsed once.
+    """
+    
+    if not isinstance(sampler_dfs[0]['timestamp'].values[0], str):
+        return [sampler_df.assign(unix_timestamp=sampler_df['timestamp'].astype(int)) for sampler_df in sampler_dfs]
+    
+    unix_timestamps = convert_str_times_to_unix(np.concatenate([sampler_df['timestamp'].values for sampler_df in sampler_dfs]))
+    split_points = np.cumsum([len(sampler_df) for sampler_df in sampler_dfs])[:-1]
+    
+    return [sampler_df.assign(unix_timestamp=curr_timestamps) for sampler_df, curr_timestamps in zip(sampler_dfs, np.split(unix_timestamps, split_points))]
+
 def add_job_ids(df, job_ids):
     """
         The example sampler CSV's have only one job_id. This function synthetically adds job_ids to the same dataframe
@@ -28,123 +84,243 @@ def add_job_ids(df, job_ids):
         
     return pd.concat(temp_list)
 
-def transform_dsos_data(meminfo_df, vmstat_df, procstat_df, silent=True):
+def transform_dsos_data(meminfo_df, vmstat_df, procstat_df, silent=True, system_name='eclipse'):
         
     if not (set(meminfo_df.job_id.unique()) == set(vmstat_df.job_id.unique()) == set(procstat_df.job_id.unique())):
         print(f"WARNING: Provided samplers do not contain the same unique job_ids. The code will try to select the minimal subset of job_ids")
         
-    common_job_ids = list((set(meminfo_df.job_id.unique()) & set(vmstat_df.job_id.unique()) & set(procstat_df.job_id.unique())))
-    
-    training_data_list = []
-    for job_id in common_job_ids:        
-        single_job_data = transform_dsos_job_data((meminfo_df[meminfo_df['job_id'] == job_id]), (vmstat_df[vmstat_df['job_id'] == job_id]), (procstat_df[procstat_df['job_id'] == job_id]), silent)
-        training_data_list.append(single_job_data)            
-        
-    return pd.concat(training_data_list)
+    return _transform_dsos_bulk(meminfo_df, vmstat_df, procstat_df, silent, system_name)
+
 
+#Sort and epoch columns, float32 rounds epoch seconds to 128 second steps
+EXACT_COLS = ('timestamp', 'unix_timestamp')
 
-def process_raw_metrics(data, silent=True):
-    """Process data based on YAML"""      
+def compact_dtypes(data, id_cols=('job_id', 'component_id'), exact_cols=EXACT_COLS):
+    """
+    Downcasts float columns to float32 and stores the id columns as integer or categorical codes.
     
-    if not silent:
-        print(f"Processing metrics based on the YAML data")
-        
-    with open('eclipse_metric_info.yaml', 'r') as f:
-        metric_info = yaml.load(f)    
-                
-    new_data = {}
-    for col in data.columns:
-        if col not in metric_info:   
-            if not silent:
-                print("{} not in YAML".format(col))
-        elif metric_info[col] == 'cumulative':
-            new_data[col] = np.diff(data[col].interpolate()) ## maybe NAN problem when the metric is 0
-            if any(new_data[col] < 0):
-                if not silent:
-                    print("Column {} decreased".format(col))
-        elif metric_info[col] in ['important', 'noncumulative']:
-            new_data[col] = data[col].interpolate()[1:]
-        elif metric_info[col] == 'unknown':
-            new_data[col] = data[col].interpolate()[1:]
-            if all(np.diff(data[col].interpolate()) >= 0):
-                if not silent:
-                    print("{} did not decrease".format(col))
-        elif metric_info[col] in ['limit', 'unimportant']:
-            pass
+    Integer metric columns are kept, raw counters can exceed the float32 precision before they are differenced.
+    The exact_cols, e.g. the timestamp used as sort column, keep their dtype.
+    """
+    
+    float_cols = {column: np.float32 for column, dtype in data.dtypes.items() 
+                  if column not in id_cols and column not in exact_cols and dtype == np.float64}
+    ids = {}
+    for column in id_cols:
+        if column not in data.columns or pd.api.types.is_categorical_dtype(data[column].dtype):
+            continue
+        if pd.api.types.is_integer_dtype(data[column].dtype):
+            ids[column] = pd.to_numeric(data[column], downcast='integer')
         else:
-            raise IOError("Condition doesn't exist for {}".format(
-                metric_info[col]))
-    return pd.DataFrame(new_data, index=data.index[1:])
+            values = pd.to_numeric(data[column], errors='coerce')
+            if values.notna().all() and (values == np.floor(values)).all():
+                ids[column] = pd.to_numeric(values.astype(np.int64), downcast='integer')
+            else:
+                ids[column] = data[column].astype('category')
+    
+    #astype converts column by column, a float64 copy of the frame is never made
+    data = data.astype(float_cols) if float_cols else data.copy(deep=False)
+    for column, values in ids.items():
+        data[column] = values
     
+    return data
+
 
-def transform_dsos_job_data(meminfo_df, vmstat_df, procstat_df, silent=True):
+def _interpolate_grouped(data, group_codes):
+    """Linear interpolation with the semantics of DataFrame.interpolate(), applied within each group"""
     
-    assert len(meminfo_df['job_id'].unique()) == 1, "All the samplers must contain only one job_id. You can input multiple job_ids using transform_dsos_data"
-    assert len(vmstat_df['job_id'].unique()) == 1, "All the samplers must contain only one job_id. You can input multiple job_ids using transform_dsos_data"
-    assert len(procstat_df['job_id'].unique()) == 1, "All the samplers must contain only one job_id. You can input multiple job_ids using transform_dsos_data"
+    valid = data.notnull()
+    if valid.values.all():
+        return data
     
-    curr_job_id = meminfo_df['job_id'].unique()[0]
-        
-    meminfo_df.drop(columns=junk_cols,inplace=True)
-    vmstat_df.drop(columns=junk_cols,inplace=True)    
-    procstat_df.drop(columns=junk_cols,inplace=True)
-    
-    if isinstance(meminfo_df['timestamp'].values[0], str):
-        meminfo_df['unix_timestamp'] = meminfo_df['timestamp'].apply(lambda x: convert_str_time_to_unix(x))    
-        vmstat_df['unix_timestamp'] = vmstat_df['timestamp'].apply(lambda x: convert_str_time_to_unix(x))    
-        procstat_df['unix_timestamp'] = procstat_df['timestamp'].apply(lambda x: convert_str_time_to_unix(x))   
-    else:
-        meminfo_df['unix_timestamp'] = meminfo_df['timestamp'].astype(int)
-        vmstat_df['unix_timestamp'] = vmstat_df['timestamp'].astype(int)
-        procstat_df['unix_timestamp'] = procstat_df['timestamp'].astype(int)
-        
-    sampler_col_names = [curr_col + '::{}'.format("meminfo")  if curr_col not in excluded_cols else curr_col for curr_col in meminfo_df.columns ]
-    meminfo_df.columns = sampler_col_names
+    positions = np.arange(len(data), dtype=float)
+    valid_positions = pd.DataFrame(np.where(valid, positions[:, None], np.nan), index=data.index, columns=data.columns)
+    
+    prev_pos = valid_positions.groupby(group_codes).ffill()
+    next_pos = valid_positions.groupby(group_codes).bfill()
+    prev_val = data.groupby(group_codes).ffill()
+    next_val = data.groupby(group_codes).bfill()
+    
+    interpolated = prev_val + (next_val - prev_val) * (positions[:, None] - prev_pos) / (next_pos - prev_pos)
+    #Trailing NaNs are filled with the last valid value, leading NaNs stay NaN
+    interpolated = interpolated.where(next_pos.notnull(), prev_val)
+    
+    return data.where(valid, interpolated)
 
-    sampler_col_names = [curr_col + '::{}'.format("vmstat")  if curr_col not in excluded_cols else curr_col for curr_col in vmstat_df.columns ]
-    vmstat_df.columns = sampler_col_names
 
-    sampler_col_names = [curr_col + '::{}'.format("procstat")  if curr_col not in excluded_cols else curr_col for curr_col in procstat_df.columns ]
-    procstat_df.columns = sampler_col_names
-    
-    non_per_core_cols = [curr_col for curr_col in procstat_df.columns if not ('per_core' in curr_col) and not (curr_col in excluded_cols)]
-    common_comp_ids = list(set(meminfo_df.component_id.values) & set(procstat_df.component_id.values) & set(vmstat_df.component_id.values))
+def _diff_grouped(values, keep_rows):
+    """np.diff within each group, keeping only the rows that have a predecessor in their group"""
+    return (values[1:] - values[:-1])[keep_rows[1:]]
+
+
+#Metric info YAML contents and compiled metric plans, cached per system_name
+_metric_info_cache = {}
+_metric_plan_cache = {}
+
+def load_metric_info(system_name='eclipse'):
+    """Loads {system_name}_metric_info.yaml once per system"""
     
-    cleaned_node_data = []
+    if system_name not in _metric_info_cache:
+        with open('{}_metric_info.yaml'.format(system_name), 'r') as f:
+            _metric_info_cache[system_name] = yaml.safe_load(f)
+            
+    return _metric_info_cache[system_name]
 
-    for comp_id in common_comp_ids:
+
+class MetricPlan():
+    """
+    Column positions of every metric category for a fixed list of columns, compiled from the metric info YAML.
+    
+    Cumulative metrics are differenced, important, noncumulative and unknown metrics are kept, limit and 
+    unimportant metrics are dropped. Every category is processed as one matrix instead of column by column.
+    """
+    
+    def __init__(self, columns, metric_info):
+        
+        self.columns = list(columns)
+        self.missing_cols = [col for col in self.columns if col not in metric_info]
+        self.cumulative_cols = []
+        self.kept_cols = []
+        self.unknown_cols = []
+        
+        for col in self.columns:
+            if col not in metric_info:
+                continue
+            elif metric_info[col] == 'cumulative':
+                self.cumulative_cols.append(col)
+            elif metric_info[col] in ['important', 'noncumulative', 'unknown']:
+                self.kept_cols.append(col)
+                if metric_info[col] == 'unknown':
+                    self.unknown_cols.append(col)
+            elif metric_info[col] in ['limit', 'unimportant']:
+                pass
+            else:
+                raise IOError("Condition doesn't exist for {}".format(
+                    metric_info[col]))
                 
-        node_meminfo_df = meminfo_df[meminfo_df['component_id'] == comp_id]
-        node_vmstat_df = vmstat_df[vmstat_df['component_id'] == comp_id]
-        node_procstat_df = procstat_df[procstat_df['component_id'] == comp_id]
+        self.output_cols = [col for col in self.columns if col in self.cumulative_cols or col in self.kept_cols]
+        
+    def apply(self, data, group_codes, silent=True):
+        
+        if not silent:
+            for col in self.missing_cols:
+                print("{} not in YAML".format(col))
+        
+        keep_rows = np.r_[False, group_codes[1:] == group_codes[:-1]]
+        interpolated = _interpolate_grouped(data[self.output_cols], group_codes)
         
-        common_time = list(set(node_meminfo_df.unix_timestamp.values) & set(node_procstat_df.unix_timestamp.values) & set(node_vmstat_df.unix_timestamp.values))
+        ## maybe NAN problem when the metric is 0
+        cumulative = interpolated[self.cumulative_cols]
+        cumulative = pd.concat([pd.DataFrame(_diff_grouped(block.values, keep_rows), columns=block.columns) for block in _dtype_blocks(cumulative)], axis=1)
+        kept = interpolated[self.kept_cols].iloc[keep_rows]
+        
+        if not silent:
+            for col in cumulative.columns[(cumulative < 0).any(axis=0).values]:
+                print("Column {} decreased".format(col))
+            unknown_diff = _diff_grouped(interpolated[self.unknown_cols].values, keep_rows)
+            for col in np.array(self.unknown_cols)[(unknown_diff >= 0).all(axis=0)]:
+                print("{} did not decrease".format(col))
         
+        new_data = pd.concat([cumulative.set_axis(kept.index, axis=0), kept], axis=1)
+        
+        return new_data[self.output_cols]
 
-        node_meminfo_df = node_meminfo_df[node_meminfo_df['unix_timestamp'].isin(common_time)].drop(columns=common_cols)
-        node_meminfo_df.set_index('unix_timestamp', inplace=True)
 
-        node_vmstat_df = node_vmstat_df[node_vmstat_df['unix_timestamp'].isin(common_time)].drop(columns=common_cols)
-        node_vmstat_df.set_index('unix_timestamp', inplace=True)
+def _dtype_blocks(data):
+    """Splits a frame into column blocks of a single dtype, so matrix operations keep every column's dtype"""
+    return [data.loc[:, (data.dtypes == dtype).values] for dtype in data.dtypes.unique()] or [data]
 
-        node_procstat_df = node_procstat_df[node_procstat_df['unix_timestamp'].isin(common_time)].drop(columns=common_cols)
-        node_procstat_df.set_index('unix_timestamp', inplace=True)
-        node_procstat_df = node_procstat_df[non_per_core_cols]
 
-        node_data_df = pd.concat([node_meminfo_df, node_vmstat_df, node_procstat_df],axis=1)                
+def get_metric_plan(columns, system_name='eclipse'):
+    """Returns the cached MetricPlan of the given system for the given columns"""
+    
+    key = (system_name, tuple(columns))
+    if key not in _metric_plan_cache:
+        _metric_plan_cache[key] = MetricPlan(columns, load_metric_info(system_name))
         
-        node_data_df = process_raw_metrics(node_data_df)
-                
-        node_data_df.index.name = "timestamp"
-        node_data_df.reset_index(inplace=True)    
-        node_data_df.insert(1, 'job_id', curr_job_id)                
-        node_data_df.insert(2, 'component_id', comp_id)
-                
-        cleaned_node_data.append(node_data_df)
+    return _metric_plan_cache[key]
+
+
+@profiled('utils.process_raw_metrics')
+def process_raw_metrics(data, silent=True, group_codes=None, system_name='eclipse'):
+    """Process data based on YAML
+    
+    group_codes optionally assigns every row to a (job_id, component_id) group. Interpolation and 
+    differencing never cross group boundaries and the first row of every group is dropped, so
+    many nodes can be processed in a single pass.
+    """      
+    
+    if not silent:
+        print(f"Processing metrics based on the YAML data")
         
-        if not silent:
-            print(f"Component ID: {comp_id}")
-            print(f"Num. unique timestamps for each sampler: {len(node_meminfo_df.unix_timestamp.unique())}, {len(node_vmstat_df.unix_timestamp.unique())}, {len(node_procstat_df.unix_timestamp.unique())}")
-            print(f"Common time length: {len(common_time)}")        
+    if group_codes is None:
+        group_codes = np.zeros(len(data), dtype=int)
+        
+    plan = get_metric_plan(data.columns, system_name)
+    
+    return plan.apply(data, np.asarray(group_codes), silent)
+    
+
+def _prepare_sampler(sampler_df, sampler_name):
+    """Suffixes the metric columns with the sampler name and drops the raw timestamp"""
+    
+    sampler_df = sampler_df.drop(columns=junk_cols)
+    sampler_df.columns = [curr_col + '::{}'.format(sampler_name) if curr_col not in excluded_cols else curr_col for curr_col in sampler_df.columns]
+    
+    return sampler_df.drop(columns=['timestamp'])
+
+
+def _transform_dsos_bulk(meminfo_df, vmstat_df, procstat_df, silent=True, system_name='eclipse'):
+    """
+    Transforms sampler data of any number of jobs and components in a single pass.
+    
+    The samplers are inner-joined on (job_id, component_id, unix_timestamp), which keeps exactly the common
+    job_ids, the common component_ids of each job and the common timestamps of each component. The joined frame
+    is sorted once and process_raw_metrics handles all (job_id, component_id) groups at once.
+    """
+    
+    common_job_ids = list((set(meminfo_df.job_id.unique()) & set(vmstat_df.job_id.unique()) & set(procstat_df.job_id.unique())))
+    key_cols = ['job_id', 'component_id', 'unix_timestamp']
+    
+    meminfo_df, vmstat_df, procstat_df = add_unix_timestamps([meminfo_df[meminfo_df['job_id'].isin(common_job_ids)],
+                                                              vmstat_df[vmstat_df['job_id'].isin(common_job_ids)],
+                                                              procstat_df[procstat_df['job_id'].isin(common_job_ids)]])
+    
+    meminfo_df = _prepare_sampler(meminfo_df, "meminfo")
+    vmstat_df = _prepare_sampler(vmstat_df, "vmstat")
+    procstat_df = _prepare_sampler(procstat_df, "procstat")
+    
+    non_per_core_cols = [curr_col for curr_col in procstat_df.columns if not ('per_core' in curr_col) and not (curr_col in excluded_cols)]
+    procstat_df = procstat_df[key_cols + non_per_core_cols]
+    
+    data = meminfo_df.merge(vmstat_df, on=key_cols, how='inner').merge(procstat_df, on=key_cols, how='inner')
+    data.sort_values(key_cols, kind='mergesort', inplace=True)
+    data.reset_index(drop=True, inplace=True)
+    
+    group_codes = data.groupby(['job_id', 'component_id'], sort=False).ngroup().values
+    
+    if not silent:
+        group_sizes = data.groupby(['job_id', 'component_id']).size()
+        for (job_id, comp_id), common_time_len in group_sizes.items():
+            print(f"Job ID: {job_id}, Component ID: {comp_id}, Common time length: {common_time_len}")
+    
+    metric_data = process_raw_metrics(data.drop(columns=key_cols), group_codes=group_codes, system_name=system_name)
+    
+    keys = data.loc[metric_data.index, key_cols]
+    metric_data.insert(0, 'timestamp', keys['unix_timestamp'].values)
+    metric_data.insert(1, 'job_id', keys['job_id'].values)
+    metric_data.insert(2, 'component_id', keys['component_id'].values)
+    
+    #Positions within each node, the same index the per-node frames had before concatenation
+    metric_data.index = metric_data.groupby(['job_id', 'component_id'], sort=False).cumcount().values
+    
+    return metric_data
+
+
+def transform_dsos_job_data(meminfo_df, vmstat_df, procstat_df, silent=True, system_name='eclipse'):
+    
+    assert len(meminfo_df['job_id'].unique()) == 1, "All the samplers must contain only one job_id. You can input multiple job_ids using transform_dsos_data"
+    assert len(vmstat_df['job_id'].unique()) == 1, "All the samplers must contain only one job_id. You can input multiple job_ids using transform_dsos_data"
+    assert len(procstat_df['job_id'].unique()) == 1, "All the samplers must contain only one job_id. You can input multiple job_ids using transform_dsos_data"
     
-    return pd.concat(cleaned_node_data)
\ No newline at end of file
+    return _transform_dsos_bulk(meminfo_df, vmstat_df, procstat_df, silent, system_name)
@@ -4,14 +4,21 @@ from tensorflow.keras import Model, optimizers, layers
 from tensorflow.keras import backend as K
 from tensorflow.keras.callbacks import ModelCheckpoint
 import numpy as np
+import pandas as pd
 
+from scoring import calibrate_thresholds, decide, score_thresholds
+from quantile_sketch import QuantileSketch
+from vae_training import iter_feature_blocks, count_feature_rows, make_feature_dataset, EpochThroughput, ResumableCheckpoint
 from tensorflow.python.framework.ops import disable_eager_execution
-disable_eager_execution()
+from profiling import profiled
 
 class VAE(tf.keras.Model):
     
     def __init__(self, input_dim, intermediate_dim, latent_dim, learning_rate, verbose=False, **kwargs):
         
+        #The Keras model is built in graph mode, importing this module leaves the eager mode untouched
+        disable_eager_execution()
+        
         super(VAE, self).__init__(**kwargs)
         
         self.original_dim = input_dim
@@ -20,6 +27,8 @@ class VAE(tf.keras.Model):
         self.learning_rate = learning_rate
         self.verbose = verbose
         self.threshold = None
+        self.threshold_sketch = None
+        self.training_report = None
 
         self.encoder = self.build_encoder()
         self.decoder = self.build_decoder()
@@ -56,8 +65,10 @@ class VAE(tf.keras.Model):
         vae = Model(x, x_decoded_mean)
         vae.add_loss(vae_loss)
                 
-        opt = optimizers.Adam(learning_rate=self.learning_rate)
-        vae.compile(optimizer=opt)
+        #Without a learning rate the model is only used for inference, and Adam can't create its variables from None
+        if self.learning_rate is not None:
+            opt = optimizers.Adam(learning_rate=self.learning_rate)
+            vae.compile(optimizer=opt)
         return vae    
     
     def sample(self, args):
@@ -69,7 +80,8 @@ class VAE(tf.keras.Model):
         #epsilon = K.ones_like(z_mean)
         return z_mean + K.exp(0.5 * z_log_var) * epsilon
 
-    def fit(self, x_train, epochs, batch_size, validation_data=None, validation_split=None, verbose=0, save_dir=None):
+    @profiled('VAE.fit')
+    def fit(self, x_train, epochs, batch_size, validation_data=None, validation_split=None, verbose=0, save_dir=None, callbacks=None):
         
         self.model.fit(x_train, 
                            None ,
@@ -78,7 +90,8 @@ class VAE(tf.keras.Model):
                            batch_size=batch_size,
                            validation_data=validation_data,
                            validation_split=validation_split,
-                           verbose=verbose
+                           verbose=verbose,
+                           callbacks=callbacks
                       )
         if not (save_dir is None):
             
@@ -88,6 +101,84 @@ class VAE(tf.keras.Model):
                     
         self.determine_classification_threshold(x_train)
         
+    @profiled('VAE.fit_streaming')
+    def fit_streaming(self, train_source, validation_source=None, epochs=1000, batch_size=256, patience=20, min_delta=0.0,
+                      checkpoint_dir=None, checkpoint_every=1, shuffle_buffer=100000, block_rows=65536, columns=None,
+                      save_dir=None, verbose=0):
+        """
+        Trains through a prefetching `tf.data` pipeline, stopping once the loss plateaus.
+
+        The input is streamed block by block, so feature files larger than memory can be used. With a
+        `checkpoint_dir`, training is checkpointed and a repeated call with the same directory resumes from
+        the last checkpoint. The per-epoch throughput is kept in `self.training_report`.
+
+        Args:
+            train_source (pd.DataFrame, np.ndarray, str or list): Scaled training features, or path(s) to
+                feature files (.parquet, .feather, .arrow or .csv).
+            validation_source (pd.DataFrame, np.ndarray, str or list): Scaled validation features. Early stopping
+                monitors the validation loss if given, otherwise the training loss (default is None).
+            epochs (int): Maximum number of epochs (default is 1000).
+            batch_size (int): Number of rows per batch (default is 256).
+            patience (int): Number of epochs without improvement before training stops (default is 20).
+            min_delta (float): Minimum loss decrease counted as an improvement (default is 0.0).
+            checkpoint_dir (str): Directory of the resumable checkpoint (default is None, no checkpoints).
+            checkpoint_every (int): Checkpoint frequency, in epochs (default is 1).
+            shuffle_buffer (int): Number of rows shuffled together (default is 100000).
+            block_rows (int): Number of rows read from storage at once (default is 65536).
+            columns (list): Feature columns to read from the files, in model input order (default is None, all columns).
+            save_dir (str): Directory to save the model and weights to, as `fit` does (default is None).
+            verbose (int): Keras verbosity (default is 0).
+
+        Returns:
+            pd.DataFrame: Wall time, samples per second and losses of every epoch.
+        """
+        train_dataset = make_feature_dataset(train_source, self.original_dim, batch_size,
+                                             shuffle_buffer=shuffle_buffer, block_rows=block_rows, columns=columns)
+        validation_dataset = None
+        validation_steps = None
+        if validation_source is not None:
+            validation_dataset = make_feature_dataset(validation_source, self.original_dim, batch_size,
+                                                      block_rows=block_rows, columns=columns)
+            validation_steps = -(-count_feature_rows(validation_source) // batch_size)
+        
+        #Graph-mode Keras needs the number of batches of streamed datasets
+        n_train_rows = count_feature_rows(train_source)
+        steps_per_epoch = -(-n_train_rows // batch_size)
+        
+        early_stopping = tf.keras.callbacks.EarlyStopping(monitor='val_loss' if validation_dataset is not None else 'loss',
+                                                          patience=patience,
+                                                          min_delta=min_delta,
+                                                          restore_best_weights=True)
+        throughput = EpochThroughput(n_train_rows)
+        callbacks = [early_stopping, throughput]
+        
+        initial_epoch = 0
+        stopped = False
+        if checkpoint_dir is not None:
+            checkpoint = ResumableCheckpoint(checkpoint_dir, early_stopping, throughput, every_n_epochs=checkpoint_every)
+            initial_epoch = checkpoint.restore(self.model)
+            stopped = initial_epoch > 0 and checkpoint.restored_state['stopped']
+            callbacks.append(checkpoint)
+        
+        if initial_epoch < epochs and not stopped:
+            self.model.fit(train_dataset,
+                           epochs=epochs,
+                           initial_epoch=initial_epoch,
+                           steps_per_epoch=steps_per_epoch,
+                           validation_data=validation_dataset,
+                           validation_steps=validation_steps,
+                           callbacks=callbacks,
+                           verbose=verbose)
+        self.training_report = pd.DataFrame(throughput.report)
+        
+        if not (save_dir is None):
+            self.model.save(save_dir + '/' + self.name + '.h5')
+            self.model.save_weights(save_dir + '/' + self.name + '-weights.h5')
+        
+        self.determine_classification_threshold(train_source, block_rows=block_rows, columns=columns)
+        
+        return self.training_report
+        
     def load_model_weights(self, weights_path):
         
         self.model.load_weights(weights_path)
@@ -96,23 +187,96 @@ class VAE(tf.keras.Model):
             self.logger.info(f"Loaded model: {self.model.summary()}")
         
 
-    def determine_classification_threshold(self, x_train):
+    def determine_classification_threshold(self, x_train, block_rows=65536, columns=None, sketch=None):
+        """
+        Calibrates the thresholds from the reconstruction errors of the training data, scored block by block.
+
+        Args:
+            x_train (pd.DataFrame, np.ndarray, str or list): Scaled training features, or path(s) to feature files.
+            block_rows (int): Number of rows scored at once (default is 65536).
+            columns (list): Feature columns to read from the files (default is None, all columns).
+            sketch (QuantileSketch): Sketch of other training data to add to, e.g. of an earlier day (default is None).
+
+        Returns:
+            QuantileSketch: The sketch of the training reconstruction errors.
+        """
+        sketch = sketch if sketch is not None else QuantileSketch()
         
-        mae_train = self.calculate_reconstruction_error(x_train)
-        self.threshold_max = np.max(mae_train)
-        self.threshold = np.percentile(mae_train.values, 99)
-        self.threshold_90 = np.percentile(mae_train.values, 90)
+        if isinstance(x_train, (pd.DataFrame, np.ndarray)):
+            rows = x_train.iloc if isinstance(x_train, pd.DataFrame) else x_train
+            blocks = (rows[block_start:block_start + block_rows] for block_start in range(0, len(x_train), block_rows))
+        else:
+            blocks = iter_feature_blocks(x_train, block_rows, columns)
+        
+        for block in blocks:
+            sketch.update(np.asarray(self.calculate_reconstruction_error(block)))
+        
+        self.set_threshold_sketch(sketch)
+        
+        return sketch
+        
+    def set_threshold_sketch(self, sketch):
+        """Sets the thresholds from a sketch of training reconstruction errors, e.g. one merged from several workers."""
+        
+        #The sketch is kept, so custom percentile thresholds don't need another inference pass
+        self.threshold_sketch = sketch
+        thresholds = calibrate_thresholds(sketch)
+        self.threshold = thresholds['threshold']
+        self.threshold_90 = thresholds['threshold_90']
+        self.threshold_max = thresholds['threshold_max']
         
     def calculate_reconstruction_error(self, data):
                 
         recon_data = self.model.predict(data)
         return np.mean(np.abs(data - recon_data), axis=1)
     
+    def get_thresholds(self, percentiles=None):
+        """
+        Returns the calibrated thresholds, plus thresholds at custom percentiles of the training errors.
+
+        Args:
+            percentiles (list): Additional percentiles, named 'p<percentile>' (default is None).
+
+        Raises:
+            ValueError: If custom percentiles are requested before the model is fitted.
+
+        Returns:
+            dict: Mapping of threshold name -> value.
+        """
+        thresholds = {name: getattr(self, name) for name in ['threshold', 'threshold_90', 'threshold_max']
+                      if getattr(self, name, None) is not None}
+        
+        if percentiles:
+            if self.threshold_sketch is None:
+                raise ValueError("Custom percentile thresholds need the training errors, fit the model first")
+            thresholds.update(calibrate_thresholds(self.threshold_sketch, percentiles))
+        
+        return thresholds
+    
+    def score(self, data, percentiles=None, thresholds=None, labels=None):
+        """
+        Scores data with one inference pass and decides for every threshold at once.
+
+        Args:
+            data (pd.DataFrame or np.ndarray): Scaled samples to classify.
+            percentiles (list): Custom percentiles of the training errors to add as thresholds (default is None).
+            thresholds (dict): Additional named thresholds (default is None).
+            labels (array-like): Binary ground truth; adds the per-threshold precision and recall (default is None).
+
+        Returns:
+            dict: Output of `scoring.score_thresholds`.
+        """
+        all_thresholds = self.get_thresholds(percentiles)
+        all_thresholds.update(thresholds or {})
+        
+        return score_thresholds(self.calculate_reconstruction_error(data), all_thresholds, labels=labels)
+    
+    @profiled('VAE.predict_anomaly')
     def predict_anomaly(self, data):
         
         mae_data = self.calculate_reconstruction_error(data)
         
-        pred = [1 if curr_mae > self.threshold else 0 for curr_mae in mae_data]
+        pred = decide(mae_data, self.threshold)
         
         return pred, mae_data
     
@@ -121,6 +285,6 @@ class VAE(tf.keras.Model):
         
         mae_data = self.calculate_reconstruction_error(data)
         
-        pred = [1 if curr_mae > self.threshold_90 else 0 for curr_mae in mae_data]
+        pred = decide(mae_data, self.threshold_90)
         
-        return pred, mae_data    
\ No newline at end of file
+        return pred, mae_data
@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+#Feature files that can be streamed without loading them into memory
+FEATURE_FILE_SUFFIXES = ['.parquet', '.feather', '.arrow', '.csv']
+
+
+def iter_feature_blocks(source, block_rows=65536, columns=None):
+    """
+    Iterates scaled feature rows in float32 blocks, from memory or from feature files.
+
+    Args:
+        source (pd.DataFrame, np.ndarray, str or list): Feature matrix, or path(s) to feature files
+            (.parquet, .feather, .arrow or .csv) holding one scaled feature vector per row.
+        block_rows (int): Maximum number of rows per block (default is 65536).
+        columns (list): Feature columns to read from the files, in model input order (default is None, all columns).
+
+    Yields:
+        np.ndarray: Blocks of shape (n_rows, n_features).
+    """
+    if isinstance(source, (pd.DataFrame, np.ndarray)):
+        values = np.asarray(source, dtype=np.float32)
+        for block_start in range(0, len(values), block_rows):
+            yield values[block_start:block_start + block_rows]
+        return
+
+    paths = [source] if isinstance(source, (str, Path)) else list(source)
+
+    for path in paths:
+        suffix = Path(path).suffix
+        if suffix not in FEATURE_FILE_SUFFIXES:
+            raise ValueError(f"Unsupported feature file {path}. Allowed suffixes: {FEATURE_FILE_SUFFIXES}")
+
+        if suffix == '.csv':
+            for chunk in pd.read_csv(path, usecols=columns, chunksize=block_rows):
+                chunk = chunk[columns] if columns is not None else chunk
+                yield chunk.to_numpy(dtype=np.float32)
+        else:
+            import pyarrow.dataset as ds
+            dataset = ds.dataset(str(path), format='parquet' if suffix == '.parquet' else 'ipc')
+            for batch in dataset.to_batches(columns=columns, batch_size=block_rows):
+                yield batch.to_pandas().to_numpy(dtype=np.float32)
+
+
+def count_feature_rows(source):
+    """Returns the number of rows of a feature matrix or of feature files, reading Arrow formats' metadata only."""
+
+    if isinstance(source, (pd.DataFrame, np.ndarray)):
+        return len(source)
+
+    paths = [source] if isinstance(source, (str, Path)) else list(source)
+
+    n_rows = 0
+    for path in paths:
+        if Path(path).suffix == '.csv':
+            n_rows += sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=1000000))
+        else:
+            import pyarrow.dataset as ds
+            n_rows += ds.dataset(str(path), format='parquet' if Path(path).suffix == '.parquet' else 'ipc').count_rows()
+
+    return n_rows
+
+
+def make_feature_dataset(source, input_dim, batch_size, shuffle_buffer=None, block_rows=65536, columns=None):
+    """
+    Builds a prefetching `tf.data` pipeline over scaled feature rows.
+
+    Rows are read block by block on the fly, so files larger than memory can be streamed. The batches of
+    one pass over the source are repeated indefinitely, `ceil(n_rows / batch_size)` steps make up an epoch.
+
+    Args:
+        source (pd.DataFrame, np.ndarray, str or list): See `iter_feature_blocks`.
+        input_dim (int): Number of features per row.
+        batch_size (int): Number of rows per training batch.
+        shuffle_buffer (int): Number of rows shuffled together, None disables shuffling (default is None).
+        block_rows (int): Number of rows read from storage at once (default is 65536).
+        columns (list): Feature columns to read from the files (default is None, all columns).
+
+    Returns:
+        tf.data.Dataset: Batches of shape (batch_size, input_dim).
+    """
+    dataset = tf.data.Dataset.from_generator(lambda: iter_feature_blocks(source, block_rows, columns),
+                                             output_signature=tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32))
+    dataset = dataset.unbatch()
+
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+
+    #Batching before repeating keeps every epoch aligned to one pass over the source
+    return dataset.batch(batch_size).repeat().prefetch(tf.data.experimental.AUTOTUNE)
+
+
+class EpochThroughput(tf.keras.callbacks.Callback):
+    """Records the wall time and the training samples per second of every epoch."""
+
+    def __init__(self, samples_per_epoch):
+
+        super(EpochThroughput, self).__init__()
+        self.samples_per_epoch = samples_per_epoch
+        self.report = []
+        self.logger = logging.getLogger(__name__)
+
+    def on_epoch_begin(self, epoch, logs=None):
+
+        self.epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+
+        #Includes the validation pass, as the epoch's wall time does
+        seconds = time.perf_counter() - self.epoch_start
+        epoch_report = {
+            'epoch': epoch,
+            'seconds': seconds,
+            'samples': self.samples_per_epoch,
+            'samples_per_second': self.samples_per_epoch / seconds if seconds > 0 else np.nan,
+        }
+        epoch_report.update({name: float(value) for name, value in (logs or {}).items()})
+        self.report.append(epoch_report)
+
+        self.logger.info(f"Epoch {epoch}: {epoch_report['samples_per_second']:.0f} samples/s, "
+                         f"loss {epoch_report.get('loss')}, val_loss {epoch_report.get('val_loss')}")
+
+
+class ResumableCheckpoint(tf.keras.callbacks.Callback):
+    """
+    Checkpoints training so an interrupted `VAE.fit_streaming` call resumes where it stopped.
+
+    Every `every_n_epochs` epochs the model weights, the optimizer state, the early stopping state, the
+    throughput report and the best weights so far are written to a new directory in `checkpoint_dir`. The
+    'checkpoint' link is then swapped to it in one step, so a crash never leaves a checkpoint mixing epochs.
+    The weights of the best epoch so far are saved whenever the monitored loss improves.
+    """
+
+    CHECKPOINT_LINK = 'checkpoint'
+    STATE_FILENAME = 'training_state.json'
+    WEIGHTS_FILENAME = 'checkpoint-weights.h5'
+    OPTIMIZER_FILENAME = 'checkpoint-optimizer.npz'
+    BEST_WEIGHTS_FILENAME = 'best-weights.h5'
+
+    def __init__(self, checkpoint_dir, early_stopping, throughput=None, every_n_epochs=1):
+        """Initializes a `ResumableCheckpoint` object.
+
+        Args:
+            checkpoint_dir (str): Directory of the checkpoint. Created if it does not exist.
+            early_stopping (tf.keras.callbacks.EarlyStopping): Early stopping callback whose state is checkpointed.
+                It must precede this callback in the callback list.
+            throughput (EpochThroughput): Throughput callback whose report is checkpointed (default is None).
+            every_n_epochs (int): Checkpoint frequency, in epochs (default is 1).
+        """
+        super(ResumableCheckpoint, self).__init__()
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.early_stopping = early_stopping
+        self.throughput = throughput
+        self.every_n_epochs = every_n_epochs
+        self.restored_state = None
+        self.restored_best_weights = None
+        self.restored_optimizer_weights = None
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self.logger = logging.getLogger(__name__)
+
+    def restore(self, model):
+        """
+        Loads the last checkpoint into the model, if there is one.
+
+        Args:
+            model (tf.keras.Model): Model to restore.
+
+        Returns:
+            int: The epoch to resume from, 0 without a checkpoint.
+        """
+        checkpoint_path = self.checkpoint_dir / self.CHECKPOINT_LINK
+        try:
+            with open(checkpoint_path / self.STATE_FILENAME, "r") as fp:
+                self.restored_state = json.load(fp)
+        except FileNotFoundError:
+            return 0
+
+        if (checkpoint_path / self.BEST_WEIGHTS_FILENAME).exists():
+            model.load_weights(str(checkpoint_path / self.BEST_WEIGHTS_FILENAME))
+            self.restored_best_weights = model.get_weights()
+
+        model.load_weights(str(checkpoint_path / self.WEIGHTS_FILENAME))
+
+        with np.load(checkpoint_path / self.OPTIMIZER_FILENAME) as optimizer_file:
+            self.restored_optimizer_weights = [optimizer_file[f"arr_{i}"] for i in range(len(optimizer_file.files))]
+
+        if self.throughput is not None:
+            self.throughput.report = self.restored_state['throughput']
+
+        self.logger.info(f"Resuming training from epoch {self.restored_state['epoch']} of {self.checkpoint_dir}")
+
+        return self.restored_state['epoch']
+
+    def on_train_begin(self, logs=None):
+
+        if self.restored_state is None:
+            return
+
+        #The optimizer slots only exist once the training function is built, right before training begins
+        self.model.optimizer.set_weights(self.restored_optimizer_weights)
+
+        self.early_stopping.wait = self.restored_state['wait']
+        self.early_stopping.best = self.restored_state['best']
+        self.early_stopping.best_weights = self.restored_best_weights
+
+    def on_epoch_end(self, epoch, logs=None):
+
+        #Early stopping has already seen this epoch, a zero wait means the monitored loss improved
+        if self.early_stopping.wait == 0:
+            self._save_weights(self.BEST_WEIGHTS_FILENAME)
+
+        if (epoch + 1) % self.every_n_epochs == 0 or self.model.stop_training:
+            self._save_checkpoint(epoch + 1)
+
+    def _save_weights(self, filename):
+
+        tmp_path = self.checkpoint_dir / f"tmp-{filename}"
+        self.model.save_weights(str(tmp_path))
+        os.replace(tmp_path, self.checkpoint_dir / filename)
+
+    def _save_checkpoint(self, next_epoch):
+
+        #A leftover of an interrupted save is never linked, so it is written again from scratch
+        epoch_dir = self.checkpoint_dir / f"epoch-{next_epoch}"
+        shutil.rmtree(epoch_dir, ignore_errors=True)
+        os.makedirs(epoch_dir)
+
+        self.model.save_weights(str(epoch_dir / self.WEIGHTS_FILENAME))
+        with open(epoch_dir / self.OPTIMIZER_FILENAME, "wb") as fp:
+            np.savez(fp, *self.model.optimizer.get_weights())
+        #The best weights are copied too, so they always match the early stopping state of the checkpoint
+        if (self.checkpoint_dir / self.BEST_WEIGHTS_FILENAME).exists():
+            shutil.copyfile(self.checkpoint_dir / self.BEST_WEIGHTS_FILENAME, epoch_dir / self.BEST_WEIGHTS_FILENAME)
+
+        state = {
+            'epoch': next_epoch,
+            'wait': int(self.early_stopping.wait),
+            'best': float(self.early_stopping.best),
+            'stopped': bool(self.model.stop_training),
+            'throughput': self.throughput.report if self.throughput is not None else [],
+        }
+        with open(epoch_dir / self.STATE_FILENAME, "w") as fp:
+            json.dump(state, fp)
+
+        #Replacing the link is atomic, it switches all files of the checkpoint at once
+        tmp_link = self.checkpoint_dir / f"tmp-{self.CHECKPOINT_LINK}"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(epoch_dir.name, tmp_link)
+        os.replace(tmp_link, self.checkpoint_dir / self.CHECKPOINT_LINK)
+
+        for old_dir in self.checkpoint_dir.glob("epoch-*"):
+            if old_dir != epoch_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+#The modules live flat in src and import each other by name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+METRICS = ['MemFree::meminfo', 'b::procstat']
+FEATURES = ['mean', 'maximum', 'minimum']
+
+
+@pytest.fixture(scope='session')
+def keras_model_dir(tmp_path_factory):
+    """Directory of an untrained Keras model with its scaler and deployment metadata."""
+
+    from sklearn.preprocessing import MinMaxScaler
+    from vae import VAE
+
+    model_dir = tmp_path_factory.mktemp('model')
+    fe_column_names = {metric: {feature: None for feature in FEATURES} for metric in METRICS}
+    raw_column_names = [f"{metric}__{feature}" for metric in METRICS for feature in FEATURES]
+
+    vae = VAE(name='model', input_dim=len(raw_column_names), intermediate_dim=3, latent_dim=2, learning_rate=1e-4)
+    vae.model.save_weights(str(model_dir / 'model-weights.h5'))
+
+    rng = np.random.default_rng(0)
+    joblib.dump(MinMaxScaler().fit(rng.normal(size=(20, len(raw_column_names)))), model_dir / 'scaler.save')
+    with open(model_dir / 'deployment_metadata.json', 'w') as fp:
+        json.dump({'threshold': 0.5, 'threshold_90': 0.4, 'threshold_max': 0.6,
+                   'fe_column_names': fe_column_names, 'raw_column_names': raw_column_names}, fp)
+
+    return str(model_dir)
+
+
+@pytest.fixture
+def input_ts():
+    """Telemetry of one job on two components, in the prediction_pipeline format."""
+
+    rng = np.random.default_rng(1)
+    data = pd.DataFrame({
+        'job_id': 1,
+        'component_id': np.repeat([1, 2], 10),
+        'timestamp': np.tile(np.arange(10), 2),
+    })
+    for metric in METRICS:
+        data[metric] = rng.normal(size=len(data))
+
+    return data
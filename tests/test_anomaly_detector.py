@@ -0,0 +1,16 @@
+import numpy as np
+
+from anomaly_detector import AnomalyDetector
+
+
+def test_score_keras_model(keras_model_dir):
+
+    detector = AnomalyDetector(model_dir=keras_model_dir, inference_engine='keras', fe_engine='native')
+    data = np.random.default_rng(2).random((4, len(detector.raw_column_names))).astype(np.float32)
+
+    scores = detector.score(data)
+
+    assert scores['recon_errors'].shape == (len(data),)
+    assert np.isfinite(scores['recon_errors']).all()
+    assert set(scores['predictions']) == {'threshold', 'threshold_90', 'threshold_max'}
+    assert len(detector._predict_anomaly(data)) == len(data)
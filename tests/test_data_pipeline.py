@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_pipeline import DataPipeline
+
+
+@pytest.mark.parametrize('suffix', ['.parquet', '.feather', '.hdf'])
+def test_compact_load_keeps_float_timestamps(tmp_path, suffix):
+
+    data = pd.DataFrame({
+        'job_id': np.repeat([1.0, 2.0], 8),
+        'component_id': 1.0,
+        'timestamp': 1681660800.0 + 15 * np.arange(16),
+        'MemFree::meminfo': np.linspace(0, 1, 16),
+    })
+    input_path = str(tmp_path / f'data{suffix}')
+    if suffix == '.parquet':
+        data.to_parquet(input_path)
+    elif suffix == '.feather':
+        data.to_feather(input_path)
+    else:
+        data.to_hdf(input_path, key='data')
+
+    loaded = DataPipeline(compact_dtypes=True).load_data(input_path)
+
+    assert loaded['timestamp'].dtype == np.float64
+    np.testing.assert_array_equal(loaded['timestamp'].to_numpy(), data['timestamp'].to_numpy())
+    assert loaded['MemFree::meminfo'].dtype == np.float32
+
+
+@pytest.mark.parametrize('hdf_kwargs', [{'format': 'fixed'}, {'format': 'table'},
+                                        {'format': 'table', 'data_columns': ['job_id', 'component_id', 'timestamp']}])
+def test_iter_hpc_data_filters_before_projecting(tmp_path, hdf_kwargs):
+
+    data = pd.DataFrame({
+        'job_id': np.repeat([1, 2, 3], 6),
+        'component_id': 4,
+        'timestamp': np.tile(np.arange(6), 3),
+        'MemFree::meminfo': np.arange(18.0),
+    })
+    input_path = str(tmp_path / 'data.hdf')
+    data.to_hdf(input_path, key='data', **hdf_kwargs)
+
+    chunks = list(DataPipeline().iter_HPC_data(input_path, chunk_rows=4, job_ids=[1, 3], start_time=2,
+                                               columns=['MemFree::meminfo']))
+
+    assert all(list(chunk.columns) == ['MemFree::meminfo'] for chunk in chunks)
+    assert pd.concat(chunks)['MemFree::meminfo'].tolist() == [2.0, 3.0, 4.0, 5.0, 14.0, 15.0, 16.0, 17.0]
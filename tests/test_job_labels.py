@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from data_pipeline import DataPipeline
+from job_labels import label_node_file
+
+
+def test_node_files_are_queryable_tables(tmp_path):
+
+    node_file = tmp_path / 'cn7_0' / 'final_metric.csv'
+    node_file.parent.mkdir()
+    pd.DataFrame({'MemFree::meminfo': np.arange(40.0), 'b::procstat': np.ones(40)}).to_csv(node_file, index=False)
+
+    node_dir = label_node_file(str(node_file), None, str(tmp_path / 'dataset'), split_point=30, node_name='cn7')
+    train_file = f'{node_dir}/cn7_train.hdf'
+
+    with pd.HDFStore(train_file, mode='r') as store:
+        assert store.get_storer('train').is_table
+
+    chunks = list(DataPipeline().iter_HPC_data(train_file, chunk_rows=8, start_time=1681660800 + 15 * 10,
+                                               columns=['job_id', 'component_id', 'timestamp', 'MemFree::meminfo']))
+
+    assert pd.concat(chunks)['MemFree::meminfo'].tolist() == list(np.arange(10.0, 30.0))
@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+from prediction_service import PredictionService
+
+
+def test_keras_engine_serves_requests(keras_model_dir, input_ts):
+
+    async def serve():
+        service = PredictionService(keras_model_dir, inference_engine='keras', fe_engine='native')
+        await service.start()
+        try:
+            return await service.predict(input_ts)
+        finally:
+            await service.stop()
+
+    result = asyncio.new_event_loop().run_until_complete(serve())
+
+    assert list(result['component_id']) == [1, 2]
+    assert (result['job_id'] == 1).all()
+    assert result['recon_errors'].notna().all()
+
+
+async def _post(port, body):
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"POST /predict HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    response = await reader.read()
+    writer.close()
+
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+
+def test_http_endpoint_batches_and_rejects_overload(keras_model_dir, input_ts):
+
+    body = json.dumps({'data': json.loads(input_ts.to_json(orient='split', index=False))}).encode()
+
+    async def serve():
+        service = PredictionService(keras_model_dir, max_queue_size=1, inference_engine='numpy', fe_engine='native')
+        await service.start()
+        server = await asyncio.start_server(service.handle_http, host='127.0.0.1', port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            served = await _post(port, body)
+            #A stopped batcher leaves the queue full
+            service.batchers[0].cancel()
+            service.queues['default'].put_nowait((input_ts, asyncio.get_event_loop().create_future()))
+            rejected = await _post(port, body)
+            unknown = await _post(port, json.dumps({'model': 'other', 'data': {}}).encode())
+            return served, rejected, unknown
+        finally:
+            server.close()
+            await service.stop()
+
+    served, rejected, unknown = asyncio.new_event_loop().run_until_complete(serve())
+
+    assert served[0] == 200
+    assert [prediction['component_id'] for prediction in served[1]['predictions']] == [1, 2]
+    assert rejected[0] == 503 and rejected[1]['overloaded']
+    assert unknown[0] == 404
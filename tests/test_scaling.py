@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+from scaling import new_scaler, fit_scaler, iter_row_blocks, transform_to_float32
+
+
+def test_large_magnitude_features_keep_their_precision():
+
+    rng = np.random.default_rng(3)
+    features = pd.DataFrame({'large': 1e12 + rng.uniform(0, 1e7, 500), 'small': rng.normal(size=500)})
+    expected = new_scaler().fit(features).transform(features)
+
+    scaler = fit_scaler(iter_row_blocks(features, block_rows=128))
+    scaled = transform_to_float32(scaler, features, block_rows=128)
+
+    assert scaled.dtype == np.float32
+    np.testing.assert_allclose(scaled, expected, atol=1e-6)
+    assert len(np.unique(scaled[:, 0])) == len(features)